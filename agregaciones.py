@@ -0,0 +1,34 @@
+import hashlib
+import re
+
+# pandas se importa dentro de la función: la app compara las huellas de las
+# reglas al arrancar sin cargarlo.
+
+# Reglas para agrupar descripciones parecidas en los rankings de ingresos y
+# gastos. Son las mismas que usaba `getTop5` en el frontend: cada patrón se
+# reemplaza una sola vez, sin distinguir mayúsculas y con \w solo ASCII.
+REGLAS_NORMALIZACION = [
+    (re.compile(r'Pago YAPE (de|a) \d+', re.IGNORECASE | re.ASCII), 'Pago YAPE a Terceros'),
+    (re.compile(r'CLAR\d+', re.IGNORECASE | re.ASCII), 'Servicios (Claro)'),
+    (re.compile(r'WOW\d+', re.IGNORECASE | re.ASCII), 'Suscripción (WOW)'),
+    (re.compile(r'ABON PLIN-[\w\s\*]+', re.IGNORECASE | re.ASCII), 'Recepción PLIN'),
+]
+
+def huella_normalizacion(reglas=REGLAS_NORMALIZACION):
+    """Huella corta del conjunto de reglas de agrupación, para detectar si cambiaron."""
+    texto = "\x01".join(f"{patron.pattern}\x00{patron.flags}\x00{reemplazo}" for patron, reemplazo in reglas)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()[:12]
+
+def normalizar_descripciones(descripciones, reglas=REGLAS_NORMALIZACION):
+    """
+    Aplica las reglas de agrupación a una serie de descripciones de forma
+    vectorizada. Cada descripción distinta se normaliza una sola vez.
+    """
+    import pandas as pd
+
+    codigos, unicas = pd.factorize(descripciones.fillna('').astype(str))
+    claves = pd.Series(unicas, dtype=object)
+    claves = claves.where(claves != '', 'Sin descripción')
+    for patron, reemplazo in reglas:
+        claves = claves.str.replace(patron, reemplazo, n=1, regex=True).str.strip()
+    return pd.Series(claves.to_numpy(dtype=object)[codigos], index=descripciones.index)
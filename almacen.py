@@ -0,0 +1,636 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import uuid
+from datetime import datetime, timezone
+
+import busqueda
+import metricas
+import resumenes
+from esquema import COLUMNAS_MONTO
+
+# pandas, numpy y las reglas de categorías solo hacen falta para escribir el
+# almacén: se importan dentro de esas funciones, de modo que los procesos que
+# solo sirven datos arrancan sin cargarlos.
+
+# Columnas que se devuelven a la API, con los mismos nombres que el CSV exportado
+COLUMNAS_API = ['FECHA', 'DESCRIPCION', 'CARGOS / DEBE', 'ABONOS / HABER', 'CUENTA_ORIGEN']
+
+# Cada transacción de la API añade su fecha completa en ISO y su categoría,
+# calculadas una sola vez en el pipeline
+COLUMNAS_RESPUESTA = COLUMNAS_API + ['FECHA_ISO', 'CATEGORIA']
+
+# Sentencias que recrean la tabla de transacciones. Se ejecutan una a una
+# dentro de la misma transacción que la carga de datos (executescript haría
+# COMMIT por su cuenta).
+# Las transacciones se particionan por año y cuenta con índices: una partición
+# (un año, una cuenta o ambos) es un rango contiguo del índice, así que
+# consultarla no recorre el resto del historial. Como cada índice termina
+# implícitamente en el id, las filas de una cuenta (o de una cuenta en un año)
+# salen además en orden cronológico, sin ordenarlas aparte. 'ESTADO' identifica
+# el estado de cuenta (PDF) del que salió cada transacción.
+_ESQUEMA = [
+    "DROP TABLE IF EXISTS transacciones",
+    """CREATE TABLE transacciones (
+        id INTEGER PRIMARY KEY,
+        FECHA TEXT NOT NULL,
+        FECHA_ISO TEXT,
+        ANIO INTEGER NOT NULL,
+        DESCRIPCION TEXT,
+        "CARGOS / DEBE" INTEGER NOT NULL DEFAULT 0,
+        "ABONOS / HABER" INTEGER NOT NULL DEFAULT 0,
+        CUENTA_ORIGEN TEXT,
+        FAMILIA TEXT,
+        CATEGORIA TEXT,
+        REGLA_CATEGORIA INTEGER,
+        ESTADO TEXT NOT NULL DEFAULT ''
+    )""",
+    "CREATE INDEX idx_transacciones_fecha ON transacciones (FECHA_ISO)",
+    "CREATE INDEX idx_transacciones_cuenta ON transacciones (CUENTA_ORIGEN)",
+    "CREATE INDEX idx_transacciones_particion ON transacciones (ANIO, CUENTA_ORIGEN)",
+    "CREATE INDEX idx_transacciones_descripcion ON transacciones (DESCRIPCION)",
+    "CREATE INDEX idx_transacciones_regla ON transacciones (REGLA_CATEGORIA)",
+    "CREATE INDEX idx_transacciones_estado ON transacciones (CUENTA_ORIGEN, ESTADO)",
+    # Los gastos atípicos se leen como un rango de este índice
+    'CREATE INDEX idx_transacciones_cargo ON transacciones ("CARGOS / DEBE")',
+    # Índice invertido de las descripciones (ver `busqueda.py`)
+    "DROP TABLE IF EXISTS indice_tokens",
+    """CREATE TABLE indice_tokens (
+        TOKEN TEXT NOT NULL,
+        DESCRIPCION TEXT NOT NULL,
+        PRIMARY KEY (TOKEN, DESCRIPCION)
+    ) WITHOUT ROWID""",
+]
+
+# Tablas que se conservan entre publicaciones: metadatos y resúmenes materializados
+_ESQUEMA_PERSISTENTE = [
+    "CREATE TABLE IF NOT EXISTS metadatos (clave TEXT PRIMARY KEY, valor TEXT)",
+    *resumenes.ESQUEMA,
+]
+
+# Columnas de la tabla de transacciones, en el orden del INSERT
+_COLUMNAS_TABLA = [
+    'FECHA', 'FECHA_ISO', 'ANIO', 'DESCRIPCION', *COLUMNAS_MONTO, 'CUENTA_ORIGEN',
+    'FAMILIA', 'CATEGORIA', 'REGLA_CATEGORIA', 'ESTADO',
+]
+_COLUMNAS_TABLA_SQL = ", ".join(f'"{c}"' for c in _COLUMNAS_TABLA)
+
+# Año de la partición de las transacciones sin fecha completa
+ANIO_DESCONOCIDO = 0
+
+# Los ids llevan el día de la transacción (días desde 1970; 0 si no tiene fecha)
+# en los bits altos y su posición dentro del día en los bajos. Así siguen el
+# orden cronológico aunque una ingesta incremental añada transacciones de días
+# ya publicados, y sirven de cursor sin renumerar la tabla.
+_BITS_POSICION = 20
+
+def _conectar(ruta_db, solo_lectura=False):
+    """
+    Abre la base de datos en modo autocommit (las transacciones se controlan
+    con BEGIN/COMMIT explícitos). En solo lectura no se crea el archivo si falta.
+    """
+    if solo_lectura:
+        return sqlite3.connect(f"file:{ruta_db}?mode=ro", uri=True, isolation_level=None)
+    conexion = sqlite3.connect(ruta_db, isolation_level=None)
+    # WAL permite que la API siga leyendo la versión anterior mientras se escribe la nueva
+    conexion.execute("PRAGMA journal_mode=WAL")
+    return conexion
+
+def _tabla_almacen(df):
+    """
+    Prepara el reporte final con las columnas de la tabla de transacciones:
+    fecha ISO y año de partición, montos en céntimos, familia de descripciones,
+    categoría según `REGLAS_CATEGORIAS` y estado de cuenta de origen ('' si el
+    reporte no lo indica). La familia y la categoría se repiten mucho, así que
+    van como categorías: cada valor distinto se guarda una sola vez.
+    """
+    import pandas as pd
+    from agregaciones import normalizar_descripciones
+    from categorias import categorizar
+    from esquema import a_centimos
+
+    if 'Fecha_Completa' in df.columns:
+        fechas = df['Fecha_Completa']
+        fechas_iso = fechas.dt.strftime('%Y-%m-%d').astype(object).where(fechas.notna(), None)
+        anios = fechas.dt.year.fillna(ANIO_DESCONOCIDO).astype('int64')
+    else:
+        fechas_iso = pd.Series(None, index=df.index, dtype=object)
+        anios = pd.Series(ANIO_DESCONOCIDO, index=df.index, dtype='int64')
+
+    categorias, reglas = categorizar(df['DESCRIPCION'])
+    estados = df['ESTADO'].astype(object).fillna('').astype(str) if 'ESTADO' in df.columns else ''
+    return pd.DataFrame({
+        'FECHA': df['FECHA'].astype(object),
+        'FECHA_ISO': fechas_iso,
+        'ANIO': anios,
+        'DESCRIPCION': df['DESCRIPCION'].astype(object),
+        'CARGOS / DEBE': a_centimos(df['CARGOS / DEBE'], 'centimos'),
+        'ABONOS / HABER': a_centimos(df['ABONOS / HABER'], 'centimos'),
+        'CUENTA_ORIGEN': df['CUENTA_ORIGEN'].astype(object),
+        'FAMILIA': normalizar_descripciones(df['DESCRIPCION']).astype('category'),
+        'CATEGORIA': categorias.astype('category'),
+        'REGLA_CATEGORIA': reglas,
+        'ESTADO': estados,
+    }, index=df.index).reset_index(drop=True)
+
+def _ids_cronologicos(conexion, tabla):
+    """
+    Ids de las filas de `tabla` que se van a insertar: dentro de cada día se
+    respeta el orden de la tabla y se continúa tras las transacciones de ese
+    día que ya están en el almacén.
+    """
+    import pandas as pd
+
+    fechas = pd.to_datetime(tabla['FECHA_ISO'], format='%Y-%m-%d')
+    dias = ((fechas - pd.Timestamp('1970-01-01')).dt.days + 1).fillna(0).astype('int64')
+    siguientes = {}
+    for dia in dias.unique().tolist():
+        ultimo = conexion.execute(
+            "SELECT MAX(id) FROM transacciones WHERE id >= ? AND id < ?",
+            (dia << _BITS_POSICION, (dia + 1) << _BITS_POSICION),
+        ).fetchone()[0]
+        siguientes[dia] = 0 if ultimo is None else (ultimo & ((1 << _BITS_POSICION) - 1)) + 1
+    posiciones = dias.groupby(dias).cumcount() + dias.map(siguientes)
+    return (dias * (1 << _BITS_POSICION) + posiciones).tolist()
+
+def _insertar_transacciones(conexion, tabla):
+    """Inserta las filas de `tabla` y añade sus descripciones al índice de tokens."""
+    conexion.executemany(
+        f"INSERT INTO transacciones (id, {_COLUMNAS_TABLA_SQL}) "
+        f"VALUES ({', '.join('?' * (len(_COLUMNAS_TABLA) + 1))})",
+        zip(_ids_cronologicos(conexion, tabla), *[tabla[columna].tolist() for columna in _COLUMNAS_TABLA]),
+    )
+    conexion.executemany(
+        "INSERT OR IGNORE INTO indice_tokens (TOKEN, DESCRIPCION) VALUES (?, ?)",
+        busqueda.filas_del_indice(tabla['DESCRIPCION']),
+    )
+
+def _huellas_estados(tabla):
+    """
+    Huella del contenido de cada estado de cuenta del reporte, como diccionario
+    {(cuenta, estado): (huella, filas)}. Un estado cuya huella no cambió aporta
+    exactamente las mismas transacciones que ya están en los resúmenes. La
+    huella no depende del orden de las filas, que entre transacciones del mismo
+    día puede variar de una ejecución a otra.
+    """
+    import numpy as np
+    import pandas as pd
+
+    contenido = tabla[['FECHA', 'FECHA_ISO', 'DESCRIPCION', *COLUMNAS_MONTO]]
+    hashes = pd.util.hash_pandas_object(contenido, index=False).to_numpy()
+    grupos = tabla.groupby([tabla['CUENTA_ORIGEN'].fillna(''), 'ESTADO'], sort=False).indices
+    return {
+        clave: (hashlib.sha1(np.sort(hashes[posiciones]).tobytes()).hexdigest(), len(posiciones))
+        for clave, posiciones in grupos.items()
+    }
+
+def _leer_filas_de_estados(conexion, claves):
+    """Transacciones publicadas de los estados de cuenta indicados (cuenta, estado)."""
+    import pandas as pd
+
+    partes = [
+        pd.read_sql_query(
+            f"SELECT {_COLUMNAS_TABLA_SQL} FROM transacciones WHERE CUENTA_ORIGEN IS ? AND ESTADO = ?",
+            conexion, params=(cuenta or None, estado),
+        )
+        for cuenta, estado in claves
+    ]
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=_COLUMNAS_TABLA)
+
+def _guardar_instantanea(conexion, instantanea):
+    """
+    Guarda el escaneo de las carpetas de PDFs del que sale el reporte (ver
+    `observador.escanear`), o lo borra si es None: un reporte publicado sin
+    escaneo no dice de qué PDFs sale.
+    """
+    if instantanea is None:
+        conexion.execute("DELETE FROM metadatos WHERE clave = 'instantanea_carpetas'")
+    else:
+        conexion.execute(
+            "INSERT OR REPLACE INTO metadatos (clave, valor) VALUES ('instantanea_carpetas', ?)",
+            (json.dumps(instantanea, sort_keys=True),),
+        )
+
+def guardar_reporte(df, ruta_db, instantanea=None):
+    """
+    Reemplaza el contenido del almacén con el reporte final en una única
+    transacción: si algo falla a mitad, la API sigue viendo el reporte anterior
+    completo. Si el DataFrame trae 'Fecha_Completa' se guarda también la fecha
+    en formato ISO para poder filtrar y ordenar por ella con índice. Los montos
+    del DataFrame van en céntimos, como en todo el pipeline, y cada transacción
+    se categoriza aquí, una sola vez, con `REGLAS_CATEGORIAS` y con su familia
+    de descripciones.
+
+    Los resúmenes materializados se actualizan de forma incremental por estado
+    de cuenta (columna 'ESTADO' del reporte): solo se suman los estados nuevos o
+    modificados y se restan los que desaparecieron o cambiaron. Si cambiaron
+    las reglas de categorías o las de familias de descripciones se
+    reconstruyen desde cero. `instantanea` es el escaneo de las carpetas de
+    PDFs del que sale el reporte, si se conoce.
+    Devuelve el identificador de la nueva versión del reporte.
+    """
+    import pandas as pd
+    from agregaciones import huella_normalizacion
+    from categorias import huellas_reglas
+
+    tabla = _tabla_almacen(df)
+    huellas = _huellas_estados(tabla)
+    version = uuid.uuid4().hex
+    actualizado = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    huellas_categorias = json.dumps(huellas_reglas())
+    huella_familias = huella_normalizacion()
+
+    conexion = _conectar(ruta_db)
+    try:
+        with metricas.medir('escritura_almacen', filas=len(df)):
+            conexion.execute("BEGIN IMMEDIATE")
+            for sentencia in _ESQUEMA_PERSISTENTE:
+                conexion.execute(sentencia)
+
+            anteriores = {
+                (cuenta, estado): huella
+                for cuenta, estado, huella in conexion.execute("SELECT CUENTA_ORIGEN, ESTADO, HUELLA FROM estados")
+            }
+            reglas_anteriores = dict(conexion.execute(
+                "SELECT clave, valor FROM metadatos WHERE clave IN ('huellas_categorias', 'huella_familias')"
+            ).fetchall())
+            if (not anteriores or reglas_anteriores.get('huellas_categorias') != huellas_categorias
+                    or reglas_anteriores.get('huella_familias') != huella_familias):
+                resumenes.vaciar(conexion)
+                anteriores = {}
+            quitados = [clave for clave, huella in anteriores.items() if huellas.get(clave, (None,))[0] != huella]
+            nuevos = [clave for clave, (huella, _) in huellas.items() if anteriores.get(clave) != huella]
+
+            # Se resta lo que aportaban los estados quitados antes de reemplazar las transacciones
+            tocados = resumenes.sumar(conexion, _leer_filas_de_estados(conexion, quitados), signo=-1)
+
+            for sentencia in _ESQUEMA:
+                conexion.execute(sentencia)
+            _insertar_transacciones(conexion, tabla)
+
+            # Y se suma lo que aportan los estados nuevos o modificados
+            claves_estado = pd.MultiIndex.from_arrays([tabla['CUENTA_ORIGEN'].fillna(''), tabla['ESTADO']])
+            resumenes.sumar(conexion, tabla[claves_estado.isin(nuevos)])
+            resumenes.recalcular_maximos(conexion, tocados)
+
+            conexion.executemany("DELETE FROM estados WHERE CUENTA_ORIGEN = ? AND ESTADO = ?", quitados)
+            conexion.executemany(
+                "INSERT OR REPLACE INTO estados (CUENTA_ORIGEN, ESTADO, HUELLA, FILAS) VALUES (?, ?, ?, ?)",
+                [(*clave, *huellas[clave]) for clave in nuevos],
+            )
+            conexion.executemany(
+                "INSERT OR REPLACE INTO metadatos (clave, valor) VALUES (?, ?)",
+                [('version', version), ('actualizado', actualizado),
+                 ('huellas_categorias', huellas_categorias), ('huella_familias', huella_familias)],
+            )
+            _guardar_instantanea(conexion, instantanea)
+            conexion.execute("COMMIT")
+    except Exception:
+        if conexion.in_transaction:
+            conexion.execute("ROLLBACK")
+        raise
+    finally:
+        conexion.close()
+    metricas.incrementar('transacciones_publicadas_total', len(df))
+    metricas.incrementar('estados_resumidos_total', len(nuevos), operacion='suma')
+    metricas.incrementar('estados_resumidos_total', len(quitados), operacion='resta')
+
+    print(f"   -> 🗄️ Reporte guardado en el almacén '{ruta_db}' (versión {version[:8]}, "
+          f"resúmenes: {len(nuevos)} estado(s) sumado(s), {len(quitados)} restado(s)).")
+    return version
+
+def actualizar_estados(df, estados, ruta_db, instantanea=None):
+    """
+    Reemplaza en el almacén solo las transacciones de los estados de cuenta
+    indicados, sin reescribir el resto del reporte: `estados` son pares
+    (cuenta, estado) cuyas filas publicadas se descartan, y `df` (o None) trae
+    las nuevas filas de esos mismos estados, con su columna 'ESTADO'. Un estado
+    eliminado simplemente no aparece en `df`.
+
+    Igual que `guardar_reporte`, se hace en una única transacción y los
+    resúmenes solo restan y suman los estados cuya huella cambió. El índice de
+    tokens añade las descripciones nuevas y olvida las que ya no tiene ninguna
+    transacción. Antes se aplican las reglas de categorías y familias que
+    hayan cambiado, para que las filas nuevas y las publicadas usen las mismas.
+    Devuelve el identificador de la nueva versión del reporte.
+    """
+    import pandas as pd
+
+    actualizar_categorias(ruta_db)
+    actualizar_familias(ruta_db)
+
+    tabla = _tabla_almacen(df) if df is not None else pd.DataFrame(columns=_COLUMNAS_TABLA)
+    huellas = _huellas_estados(tabla)
+    claves = set(estados) | set(huellas)
+    version = uuid.uuid4().hex
+
+    conexion = _conectar(ruta_db)
+    try:
+        with metricas.medir('escritura_almacen', filas=len(tabla), estados=len(claves)):
+            conexion.execute("BEGIN IMMEDIATE")
+            anteriores = {
+                (cuenta, estado): huella
+                for cuenta, estado, huella in conexion.execute("SELECT CUENTA_ORIGEN, ESTADO, HUELLA FROM estados")
+                if (cuenta, estado) in claves
+            }
+            quitados = [clave for clave, huella in anteriores.items() if huellas.get(clave, (None,))[0] != huella]
+            nuevos = [clave for clave, (huella, _) in huellas.items() if anteriores.get(clave) != huella]
+
+            filas_quitadas = _leer_filas_de_estados(conexion, quitados)
+            tocados = resumenes.sumar(conexion, filas_quitadas, signo=-1)
+            conexion.executemany(
+                "DELETE FROM transacciones WHERE CUENTA_ORIGEN IS ? AND ESTADO = ?",
+                [(cuenta or None, estado) for cuenta, estado in quitados],
+            )
+
+            claves_estado = pd.MultiIndex.from_arrays([tabla['CUENTA_ORIGEN'].fillna(''), tabla['ESTADO']])
+            filas_nuevas = tabla[claves_estado.isin(nuevos)]
+            _insertar_transacciones(conexion, filas_nuevas)
+            # Las descripciones que ya no tiene ninguna transacción salen del índice
+            huerfanas = [
+                descripcion for descripcion in filas_quitadas['DESCRIPCION'].dropna().unique().tolist()
+                if conexion.execute(
+                    "SELECT 1 FROM transacciones WHERE DESCRIPCION = ? LIMIT 1", (descripcion,)
+                ).fetchone() is None
+            ]
+            conexion.executemany(
+                "DELETE FROM indice_tokens WHERE TOKEN = ? AND DESCRIPCION = ?",
+                busqueda.filas_del_indice(pd.Series(huerfanas, dtype=object)),
+            )
+
+            resumenes.sumar(conexion, filas_nuevas)
+            resumenes.recalcular_maximos(conexion, tocados)
+
+            conexion.executemany("DELETE FROM estados WHERE CUENTA_ORIGEN = ? AND ESTADO = ?", quitados)
+            conexion.executemany(
+                "INSERT OR REPLACE INTO estados (CUENTA_ORIGEN, ESTADO, HUELLA, FILAS) VALUES (?, ?, ?, ?)",
+                [(*clave, *huellas[clave]) for clave in nuevos],
+            )
+            conexion.executemany(
+                "INSERT OR REPLACE INTO metadatos (clave, valor) VALUES (?, ?)",
+                [('version', version), ('actualizado', datetime.now(timezone.utc).isoformat(timespec='seconds'))],
+            )
+            _guardar_instantanea(conexion, instantanea)
+            conexion.execute("COMMIT")
+    except Exception:
+        if conexion.in_transaction:
+            conexion.execute("ROLLBACK")
+        raise
+    finally:
+        conexion.close()
+    metricas.incrementar('transacciones_publicadas_total', len(filas_nuevas))
+    metricas.incrementar('estados_resumidos_total', len(nuevos), operacion='suma')
+    metricas.incrementar('estados_resumidos_total', len(quitados), operacion='resta')
+
+    print(f"   -> 🗄️ Almacén '{ruta_db}' actualizado (versión {version[:8]}): "
+          f"{len(nuevos)} estado(s) añadido(s) o modificado(s), {len(quitados)} restado(s).")
+    return version
+
+def actualizar_categorias(ruta_db, reglas=None):
+    """
+    Vuelve a categorizar el reporte publicado si las reglas cambiaron desde que
+    se guardó, sin ejecutar el pipeline. Solo se reevalúan las transacciones
+    asignadas a la primera regla que cambió o a una posterior; el resto conserva
+    su categoría, y los resúmenes solo se corrigen con la diferencia de esas
+    transacciones. Publica una nueva versión del reporte (para invalidar las
+    respuestas en caché) y devuelve cuántas transacciones se reevaluaron.
+    Por defecto se usan las reglas de `categorias.REGLAS_CATEGORIAS`.
+    Comprobar que las reglas no cambiaron no carga pandas.
+    """
+    from categorias import REGLAS_CATEGORIAS, categorizar, huellas_reglas, primera_regla_cambiada
+
+    if reglas is None:
+        reglas = REGLAS_CATEGORIAS
+    actuales = huellas_reglas(reglas)
+    conexion = _conectar(ruta_db)
+    try:
+        conexion.execute("BEGIN IMMEDIATE")
+        fila = conexion.execute("SELECT valor FROM metadatos WHERE clave = 'huellas_categorias'").fetchone()
+        desde_regla = primera_regla_cambiada(json.loads(fila[0]) if fila else [], actuales)
+        if desde_regla is None:
+            conexion.execute("ROLLBACK")
+            return 0
+
+        import pandas as pd
+
+        with metricas.medir('recategorizacion', desde_regla=desde_regla):
+            pendientes = pd.read_sql_query(
+                f"SELECT id, {_COLUMNAS_TABLA_SQL} FROM transacciones WHERE REGLA_CATEGORIA >= ?",
+                conexion, params=(desde_regla,),
+            )
+            ids = pendientes['id'].tolist()
+            # Los resúmenes por categoría se corrigen solo en los días afectados
+            tocados = resumenes.sumar(conexion, pendientes, signo=-1)
+            pendientes['CATEGORIA'], indices = categorizar(pendientes['DESCRIPCION'].astype(object), reglas)
+            conexion.executemany(
+                "UPDATE transacciones SET CATEGORIA = ?, REGLA_CATEGORIA = ? WHERE id = ?",
+                zip(pendientes['CATEGORIA'].tolist(), indices.tolist(), ids),
+            )
+            resumenes.sumar(conexion, pendientes)
+            resumenes.recalcular_maximos(conexion, tocados)
+            conexion.executemany(
+                "INSERT OR REPLACE INTO metadatos (clave, valor) VALUES (?, ?)",
+                [('version', uuid.uuid4().hex),
+                 ('actualizado', datetime.now(timezone.utc).isoformat(timespec='seconds')),
+                 ('huellas_categorias', json.dumps(actuales))],
+            )
+            conexion.execute("COMMIT")
+    except Exception:
+        if conexion.in_transaction:
+            conexion.execute("ROLLBACK")
+        raise
+    finally:
+        conexion.close()
+    metricas.incrementar('transacciones_recategorizadas_total', len(ids))
+
+    print(f"   -> 🏷️ Reglas de categorías modificadas: {len(ids)} transacciones recategorizadas.")
+    return len(ids)
+
+def actualizar_familias(ruta_db, reglas=None):
+    """
+    Vuelve a calcular la familia de descripciones del reporte publicado si las
+    reglas de agrupación cambiaron desde que se guardó, sin ejecutar el
+    pipeline. Cada descripción distinta se normaliza una vez y solo se
+    actualizan las transacciones cuya familia cambia; el resumen por familias
+    se rehace desde el almacén. Publica una nueva versión del reporte y
+    devuelve cuántas transacciones cambiaron de familia.
+    Por defecto se usan las reglas de `agregaciones.REGLAS_NORMALIZACION`.
+    """
+    from agregaciones import REGLAS_NORMALIZACION, huella_normalizacion
+
+    if reglas is None:
+        reglas = REGLAS_NORMALIZACION
+    actual = huella_normalizacion(reglas)
+    conexion = _conectar(ruta_db)
+    try:
+        conexion.execute("BEGIN IMMEDIATE")
+        fila = conexion.execute("SELECT valor FROM metadatos WHERE clave = 'huella_familias'").fetchone()
+        if fila is not None and fila[0] == actual:
+            conexion.execute("ROLLBACK")
+            return 0
+
+        import pandas as pd
+        from agregaciones import normalizar_descripciones
+
+        with metricas.medir('reagrupacion_familias'):
+            familias = pd.read_sql_query(
+                "SELECT DISTINCT DESCRIPCION, FAMILIA FROM transacciones", conexion
+            )
+            nuevas = normalizar_descripciones(familias['DESCRIPCION'], reglas)
+            cambiadas = familias[nuevas != familias['FAMILIA']].assign(NUEVA=nuevas)
+            cambios_antes = conexion.total_changes
+            conexion.executemany(
+                "UPDATE transacciones SET FAMILIA = ? WHERE DESCRIPCION IS ?",
+                zip(cambiadas['NUEVA'].tolist(), cambiadas['DESCRIPCION'].tolist()),
+            )
+            filas = conexion.total_changes - cambios_antes
+            # El resumen por familias es pequeño: se rehace con una sola consulta
+            conexion.execute("DELETE FROM resumen_familias")
+            conexion.execute(
+                """INSERT INTO resumen_familias (FAMILIA, INGRESOS, GASTOS, TRANSACCIONES)
+                   SELECT FAMILIA, SUM("ABONOS / HABER"), SUM("CARGOS / DEBE"), COUNT(*)
+                   FROM transacciones WHERE FECHA_ISO IS NOT NULL GROUP BY FAMILIA"""
+            )
+            conexion.executemany(
+                "INSERT OR REPLACE INTO metadatos (clave, valor) VALUES (?, ?)",
+                [('version', uuid.uuid4().hex),
+                 ('actualizado', datetime.now(timezone.utc).isoformat(timespec='seconds')),
+                 ('huella_familias', actual)],
+            )
+            conexion.execute("COMMIT")
+    except Exception:
+        if conexion.in_transaction:
+            conexion.execute("ROLLBACK")
+        raise
+    finally:
+        conexion.close()
+    metricas.incrementar('transacciones_reagrupadas_total', filas)
+
+    print(f"   -> 🏷️ Reglas de familias modificadas: {filas} transacciones cambiaron de familia.")
+    return filas
+
+def existe_reporte(ruta_db):
+    """Indica si el almacén existe y ya contiene un reporte completo, con sus resúmenes e índices."""
+    if not os.path.exists(ruta_db):
+        return False
+    try:
+        conexion = _conectar(ruta_db, solo_lectura=True)
+    except sqlite3.Error:
+        return False
+    try:
+        fila = conexion.execute("SELECT valor FROM metadatos WHERE clave = 'version'").fetchone()
+        # Un almacén anterior a los resúmenes o al índice de búsqueda se vuelve a publicar
+        tablas = conexion.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ('resumen_diario', 'indice_tokens')"
+        ).fetchone()[0]
+        return fila is not None and tablas == 2
+    except sqlite3.Error:
+        return False
+    finally:
+        conexion.close()
+
+def leer_instantanea(ruta_db):
+    """
+    Escaneo de las carpetas de PDFs del que sale el reporte publicado, como
+    {ruta: (mtime_ns, tamaño)}, o None si no se conoce (o no hay reporte).
+    """
+    if not existe_reporte(ruta_db):
+        return None
+    conexion = _conectar(ruta_db, solo_lectura=True)
+    try:
+        fila = conexion.execute("SELECT valor FROM metadatos WHERE clave = 'instantanea_carpetas'").fetchone()
+    finally:
+        conexion.close()
+    if fila is None:
+        return None
+    return {ruta: tuple(valores) for ruta, valores in json.loads(fila[0]).items()}
+
+def version_reporte(ruta_db):
+    """
+    Devuelve `(version, actualizado)` del reporte publicado, donde `actualizado`
+    es la fecha ISO (UTC) de la última escritura completa.
+    """
+    conexion = _conectar(ruta_db, solo_lectura=True)
+    try:
+        metadatos = dict(conexion.execute("SELECT clave, valor FROM metadatos").fetchall())
+        return metadatos.get('version'), metadatos.get('actualizado')
+    finally:
+        conexion.close()
+
+def leer_transacciones(ruta_db, desde=None, hasta=None, cuenta=None, monto_min=None,
+                       monto_max=None, cursor=None, limite=None, anio=None, texto=None):
+    """
+    Devuelve las transacciones del reporte, ordenadas por fecha, como lista de
+    diccionarios, junto con el cursor de la página siguiente (o None).
+
+    Filtros opcionales: rango de fechas ISO `desde`/`hasta` (inclusive), año,
+    cuenta de origen, rango de monto del movimiento (cargo o abono) y `texto`
+    de búsqueda. Filtrar por año o cuenta solo lee esa partición del almacén, y
+    cada palabra de `texto` se busca como prefijo en el índice de tokens de las
+    descripciones, sin recorrer las transacciones. La paginación es por
+    cursor: se devuelven como mucho `limite` filas posteriores a `cursor`.
+    """
+    condiciones, parametros = [], []
+    if desde:
+        condiciones.append("FECHA_ISO >= ?")
+        parametros.append(desde)
+    if hasta:
+        condiciones.append("FECHA_ISO <= ?")
+        parametros.append(hasta)
+    if anio is not None:
+        condiciones.append("ANIO = ?")
+        parametros.append(anio)
+    if cuenta:
+        condiciones.append("CUENTA_ORIGEN = ?")
+        parametros.append(cuenta)
+    # Los montos en soles se pasan a céntimos enteros para compararlos de forma exacta
+    if monto_min is not None:
+        condiciones.append('("CARGOS / DEBE" + "ABONOS / HABER") >= ?')
+        parametros.append(math.ceil(round(monto_min * 100, 6)))
+    if monto_max is not None:
+        condiciones.append('("CARGOS / DEBE" + "ABONOS / HABER") <= ?')
+        parametros.append(math.floor(round(monto_max * 100, 6)))
+    if cursor is not None:
+        condiciones.append("id > ?")
+        parametros.append(cursor)
+
+    # Los ids siguen el orden cronológico del reporte, así que sirven de cursor.
+    # Los montos se guardan en céntimos y se devuelven en soles.
+    columnas_sql = ", ".join(
+        f'"{c}" / 100.0' if c in COLUMNAS_MONTO else f'"{c}"' for c in ['id'] + COLUMNAS_RESPUESTA
+    )
+
+    conexion = _conectar(ruta_db, solo_lectura=True)
+    try:
+        # El filtro de texto se resuelve primero en el índice de tokens
+        filtro_texto = busqueda.condicion_de_texto(conexion, texto)
+        if filtro_texto is not None:
+            condiciones.insert(0, filtro_texto[0])
+            parametros[:0] = filtro_texto[1]
+        consulta = f"SELECT {columnas_sql} FROM transacciones"
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        consulta += " ORDER BY id"
+        if limite is not None:
+            consulta += " LIMIT ?"
+            parametros.append(limite)
+        filas = conexion.execute(consulta, parametros).fetchall()
+    finally:
+        conexion.close()
+
+    siguiente_cursor = filas[-1][0] if limite is not None and len(filas) == limite else None
+    return [dict(zip(COLUMNAS_RESPUESTA, fila[1:])) for fila in filas], siguiente_cursor
+
+def leer_resumen(ruta_db, consulta=resumenes.resumen_completo, *args):
+    """
+    Ejecuta una consulta de `resumenes` (por defecto, el resumen completo del
+    dashboard) sobre los resúmenes materializados del almacén. Su coste depende
+    del número de periodos, no del de transacciones.
+    """
+    conexion = _conectar(ruta_db, solo_lectura=True)
+    try:
+        return consulta(conexion, *args)
+    finally:
+        conexion.close()
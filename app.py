@@ -1,10 +1,32 @@
-from flask import Flask, jsonify, render_template
-import pandas as pd
+from flask import Flask, jsonify, render_template, request, make_response, url_for
 import os
+import gzip
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
-# Importar las funciones de los scripts de procesamiento
-from procesador_anual import procesar_carpeta_de_pdfs
-from unificador import unificar_y_conciliar_reportes
+# Brotli viene en requirements.txt; si aun así falta, las respuestas se comprimen con gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Los scripts de procesamiento (extractor con pdfplumber, pandas) se importan
+# solo cuando se ejecuta el pipeline: servir un reporte ya publicado no los carga.
+from cache_respuestas import CacheRespuestas
+from tareas import EjecutorPipeline
+from observador import ObservadorCarpetas, escanear
+import metricas
+from almacen import (
+    guardar_reporte, existe_reporte, leer_transacciones, leer_resumen, version_reporte, actualizar_categorias,
+    actualizar_familias, actualizar_estados, leer_instantanea
+)
+from resumenes import (
+    resumen_completo, resumen_totales, serie_mensual, totales_por_cuenta, top_grupos, totales_por_categoria,
+    COLUMNA_POR_TIPO
+)
+from busqueda import prefijos_de_consulta
 
 # Crear una instancia de la aplicación Flask
 app = Flask(__name__, template_folder='templates')
@@ -13,74 +35,623 @@ app = Flask(__name__, template_folder='templates')
 # Se establecen valores predeterminados que pueden ser sobreescritos
 # durante las pruebas o en diferentes entornos.
 app.config.from_mapping(
-    CARPETA_YAPE_PDFS="yape",
-    CARPETA_AHORRO_PDFS="ahorros",
-    CSV_YAPE_CONSOLIDADO="reporte_anual_consolidado.csv",
-    CSV_AHORRO_CONSOLIDADO="reporte_anual_consolidado_AHORRO.csv",
-    REPORTE_FINAL="reporte_maestro_limpio.csv"
+    # Cuentas propias: nombre, carpeta de sus PDFs y copia opcional en CSV de la
+    # cuenta consolidada (None para no escribirla). Las transferencias se
+    # concilian entre cualquier par de ellas.
+    CUENTAS=[
+        {'nombre': 'Yape', 'carpeta': 'yape', 'csv': 'reporte_anual_consolidado.csv'},
+        {'nombre': 'Ahorro', 'carpeta': 'ahorros', 'csv': 'reporte_anual_consolidado_AHORRO.csv'},
+    ],
+    # El reporte final se exporta a CSV, pero la API lee del almacén SQLite
+    REPORTE_FINAL="reporte_maestro_limpio.csv",
+    BASE_DATOS="reporte_maestro.db",
+    # Procesos para extraer PDFs, repartidos entre las cuentas (None = uno por núcleo, 1 = secuencial)
+    MAX_WORKERS_PDF=None,
+    # Procesos entre los que se reparten las páginas de un mismo PDF largo, también
+    # repartidos entre las cuentas (1 = sin repartir)
+    MAX_WORKERS_PAGINAS=1,
+    # Caché persistente de transacciones extraídas por PDF (una subcarpeta por carpeta de PDFs)
+    CARPETA_CACHE=".cache_extraccion",
+    # Días de diferencia admitidos al enlazar transferencias entre cuentas propias
+    TOLERANCIA_DIAS_CONCILIACION=1,
+    # Respuestas JSON a partir de este tamaño se comprimen (br o gzip)
+    COMPRESION_MIN_BYTES=1024,
+    # Máximo de transacciones por página en /api/data cuando se pagina
+    LIMITE_MAXIMO_PAGINA=10000,
+    # Resultados por página de /api/search si no se indica `limite`
+    LIMITE_BUSQUEDA=50,
+    # Memoria máxima de la caché de respuestas serializadas de la API
+    CACHE_RESPUESTAS_MAX_BYTES=64 * 1024 * 1024,
+    # Archivo de log con los eventos y tiempos de cada etapa (se activa al lanzar app.py)
+    ARCHIVO_LOG="app.log",
+    # Modo observador: al lanzar app.py, vigila las carpetas de PDFs e ingiere los
+    # cambios en segundo plano (también con la variable de entorno OBSERVAR_CARPETAS=1)
+    OBSERVAR_CARPETAS=os.environ.get('OBSERVAR_CARPETAS', '').lower() in ('1', 'true', 'si', 'sí'),
+    # Cada cuántos segundos se revisan las carpetas y cuántos deben pasar sin
+    # cambios (p. ej. mientras se copian varios PDFs) antes de lanzar la ingesta
+    INTERVALO_OBSERVADOR=2.0,
+    ESPERA_OBSERVADOR=5.0
 )
 
+# Caché en proceso de las respuestas JSON, por versión del reporte y URL
+cache_respuestas = CacheRespuestas(app.config['CACHE_RESPUESTAS_MAX_BYTES'])
+
+# Ejecutor en segundo plano: todas las peticiones comparten una única ejecución del pipeline
+ejecutor_pipeline = EjecutorPipeline()
+
+# Las reglas de categorías y de familias se comparan con las del almacén una
+# vez por proceso, sea cual sea el servidor (python app.py, flask run o WSGI)
+_cerrojo_reglas = threading.Lock()
+_reglas_revisadas = False
+
 @app.route('/')
 def home():
     """Sirve la página principal del dashboard (graf1.html)."""
     return render_template('graf1.html')
 
-def run_data_pipeline():
+def _carpeta_cache_para(carpeta_pdfs):
+    """
+    Subcarpeta de caché asociada a una carpeta de PDFs (o None si está
+    desactivada). Se identifica por la ruta absoluta de la carpeta, no solo por
+    su nombre: dos cuentas en 'a/pdfs' y 'b/pdfs' no deben compartir caché, o
+    la purga de una borraría las entradas de la otra.
+    """
+    if not app.config['CARPETA_CACHE']:
+        return None
+    ruta = os.path.normcase(os.path.abspath(carpeta_pdfs))
+    huella = hashlib.sha1(ruta.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(app.config['CARPETA_CACHE'], f"{os.path.basename(ruta)}-{huella}")
+
+def _cuentas_configuradas():
+    """
+    Devuelve la lista `CUENTAS` de la configuración después de validarla: debe
+    haber al menos una cuenta, cada una con 'nombre' y 'carpeta', y sin nombres
+    repetidos. Lanza ValueError con un mensaje legible si no es así.
+    """
+    cuentas = app.config['CUENTAS']
+    if not cuentas:
+        raise ValueError("No hay cuentas configuradas: 'CUENTAS' debe tener al menos una cuenta.")
+    for cuenta in cuentas:
+        if not cuenta.get('nombre') or not cuenta.get('carpeta'):
+            raise ValueError(f"Cada cuenta de 'CUENTAS' necesita 'nombre' y 'carpeta': {cuenta!r}")
+    nombres = [cuenta['nombre'] for cuenta in cuentas]
+    if len(set(nombres)) != len(nombres):
+        raise ValueError(f"Hay nombres de cuenta repetidos en 'CUENTAS': {nombres}")
+    return cuentas
+
+def run_data_pipeline(reiniciar_cache=False, progreso=None):
     """
     Ejecuta el pipeline completo de procesamiento de datos, utilizando la
-    configuración de la aplicación actual.
+    configuración de la aplicación actual. Con `reiniciar_cache=True` se
+    vuelven a extraer todos los PDFs aunque estén en la caché. `progreso`
+    recibe los eventos de avance (etapa actual y resultado de cada PDF).
     """
     print("🚀 Iniciando pipeline de datos...")
+    with metricas.medir('pipeline', reiniciar_cache=reiniciar_cache):
+        _ejecutar_etapas(reiniciar_cache, progreso)
+    print("✅ Pipeline de datos completado.")
 
-    # Usar la configuración de la app en lugar de constantes globales
-    procesar_carpeta_de_pdfs(
-        app.config['CARPETA_YAPE_PDFS'],
-        app.config['CSV_YAPE_CONSOLIDADO']
-    )
-    procesar_carpeta_de_pdfs(
-        app.config['CARPETA_AHORRO_PDFS'],
-        app.config['CSV_AHORRO_CONSOLIDADO']
-    )
-    unificar_y_conciliar_reportes(
-        app.config['CSV_YAPE_CONSOLIDADO'],
-        app.config['CSV_AHORRO_CONSOLIDADO'],
-        app.config['REPORTE_FINAL']
+def _ejecutar_etapas(reiniciar_cache, progreso):
+    """Extracción de las carpetas de cada cuenta, conciliación y publicación en el almacén."""
+    from unificador import unificar_y_conciliar_cuentas
+
+    cuentas = _cuentas_configuradas()
+    # El reporte sale de los PDFs presentes al empezar: lo que cambie durante
+    # la ejecución lo verá el observador en su siguiente revisión
+    instantanea = escanear([cuenta['carpeta'] for cuenta in cuentas])
+
+    _notificar_etapa(progreso, 'extraccion')
+    reportes = _extraer_cuentas(cuentas, progreso, reiniciar_cache=reiniciar_cache)
+
+    # Los datos consolidados pasan en memoria al conciliador; los CSV
+    # configurados solo se escriben como copia y nunca se vuelven a leer.
+    _notificar_etapa(progreso, 'conciliacion')
+    df_final = unificar_y_conciliar_cuentas(
+        reportes, app.config['REPORTE_FINAL'],
+        tolerancia_dias=app.config['TOLERANCIA_DIAS_CONCILIACION']
     )
 
-    print("✅ Pipeline de datos completado.")
+    # La última etapa publica el reporte en el almacén de forma transaccional
+    if df_final is not None:
+        _notificar_etapa(progreso, 'publicacion')
+        guardar_reporte(df_final, app.config['BASE_DATOS'], instantanea=instantanea)
+        # Las respuestas en memoria de la versión anterior ya no sirven
+        cache_respuestas.invalidar()
+
+def _notificar_etapa(progreso, etapa):
+    """Registra el inicio de una etapa del pipeline y la notifica a `progreso`."""
+    metricas.registrar_evento('inicio_etapa', etapa=etapa)
+    if progreso is not None:
+        progreso({'tipo': 'etapa', 'etapa': etapa})
+
+def _extraer_cuentas(cuentas, progreso, reiniciar_cache=False, archivos=None):
+    """
+    Extrae a la vez las carpetas de las `cuentas` y devuelve {nombre: reporte}.
+    Con `archivos` ({nombre: nombres de PDF}) solo se extraen esos PDFs de cada
+    cuenta y no se escriben las copias CSV de las cuentas, que quedarían
+    incompletas.
+    """
+    from procesador_anual import procesar_carpeta_de_pdfs
+
+    # Las carpetas de las cuentas son independientes, así que se procesan
+    # a la vez; cada una reparte a su vez sus PDFs entre varios procesos.
+    # Los procesos se reparten entre las cuentas, que se extraen a la vez: en
+    # total nunca hay más que `MAX_WORKERS_PDF` (por defecto, uno por núcleo),
+    # aunque cada cuenta tiene al menos un proceso
+    max_workers = max(1, (app.config['MAX_WORKERS_PDF'] or os.cpu_count() or 1) // len(cuentas))
+    max_workers_paginas = max(1, (app.config['MAX_WORKERS_PAGINAS'] or 1) // len(cuentas))
+    with ThreadPoolExecutor(max_workers=len(cuentas)) as executor:
+        futuros = {
+            cuenta['nombre']: executor.submit(
+                procesar_carpeta_de_pdfs,
+                cuenta['carpeta'],
+                cuenta.get('csv') if archivos is None else None,
+                max_workers,
+                _carpeta_cache_para(cuenta['carpeta']),
+                reiniciar_cache,
+                progreso,
+                max_workers_paginas,
+                None if archivos is None else archivos[cuenta['nombre']]
+            )
+            for cuenta in cuentas
+        }
+        return {nombre: futuro.result() for nombre, futuro in futuros.items()}
+
+def revisar_reglas():
+    """
+    Si las reglas de categorías o de familias de descripciones cambiaron desde
+    que se publicó el reporte, corrige solo las transacciones afectadas y sus
+    resúmenes. Se hace una vez por proceso: al arrancar `python app.py` o en
+    la primera petición de datos con cualquier otro servidor. Un fallo se
+    informa pero no impide servir el reporte.
+    """
+    global _reglas_revisadas
+    with _cerrojo_reglas:
+        if _reglas_revisadas:
+            return
+        _reglas_revisadas = True
+        base_datos = app.config['BASE_DATOS']
+        if not existe_reporte(base_datos):
+            return
+        try:
+            actualizar_categorias(base_datos)
+            actualizar_familias(base_datos)
+        except Exception as e:
+            print(f"   -> ⚠️ No se pudieron aplicar las reglas modificadas: {e}")
+            return
+    # Las respuestas en memoria de la versión anterior ya no sirven
+    cache_respuestas.invalidar()
+
+def _asegurar_reporte():
+    """
+    Ejecuta el pipeline si el almacén aún no tiene un reporte. Devuelve una
+    respuesta de error si ni siquiera así está disponible, o None si todo va bien.
+    """
+    base_datos = app.config['BASE_DATOS']
+
+    if not existe_reporte(base_datos):
+        print(f"   -> No se encontró un reporte en '{base_datos}'. Ejecutando el pipeline...")
+        # Si otra petición ya lanzó el pipeline, se espera a esa misma ejecución
+        tarea = ejecutor_pipeline.iniciar(run_data_pipeline)
+        ejecutor_pipeline.esperar(tarea['id'])
+
+    if not existe_reporte(base_datos):
+        msg = f"El almacén '{base_datos}' no tiene un reporte incluso después de ejecutar el pipeline."
+        print(f"   -> ❌ Error: {msg}")
+        return jsonify({"error": msg}), 500
+    revisar_reglas()
+    return None
+
+def _codificacion_aceptada():
+    """Compresión que se usará con el cliente actual: 'br', 'gzip' o None."""
+    aceptadas = request.accept_encodings
+    if brotli is not None and aceptadas['br']:
+        return 'br'
+    if aceptadas['gzip']:
+        return 'gzip'
+    return None
+
+def _comprimir(datos, codificacion):
+    """Comprime `datos` con la codificación indicada ('br' o 'gzip')."""
+    if codificacion == 'br':
+        return brotli.compress(datos)
+    return gzip.compress(datos, compresslevel=6)
+
+def _respuesta_condicional(generar):
+    """
+    Envuelve una respuesta de datos con ETag y Last-Modified derivados de la
+    versión del reporte (y de la URL pedida). Si el cliente ya tiene esa
+    versión se responde 304 sin volver a consultar el almacén, y si otra
+    petición ya la generó se reutiliza el cuerpo serializado en memoria. El
+    cuerpo se guarda ya comprimido con la codificación que acepta el cliente,
+    así que un acierto de la caché no vuelve a comprimirlo.
+    """
+    version, actualizado = version_reporte(app.config['BASE_DATOS'])
+    etag = f"{version}-{hashlib.sha1(request.full_path.encode('utf-8')).hexdigest()[:12]}"
+    ultima_modificacion = datetime.fromisoformat(actualizado) if actualizado else None
+
+    if request.if_none_match:
+        no_modificado = request.if_none_match.contains_weak(etag)
+    else:
+        no_modificado = (
+            request.if_modified_since is not None and ultima_modificacion is not None
+            and request.if_modified_since >= ultima_modificacion
+        )
+
+    if no_modificado:
+        response = app.response_class(status=304)
+    else:
+        # Mientras no cambie la versión, la misma URL (y codificación) se sirve desde memoria
+        codificacion = _codificacion_aceptada()
+        generada = {}
+        def calcular():
+            generada['response'] = make_response(generar())
+            if generada['response'].status_code != 200:
+                return None
+            cabeceras = {
+                nombre: valor for nombre, valor in generada['response'].headers
+                if nombre in ('X-Siguiente-Cursor', 'Link')
+            }
+            cuerpo = generada['response'].get_data()
+            if codificacion and len(cuerpo) >= app.config['COMPRESION_MIN_BYTES']:
+                with metricas.medir('compresion_api', ruta=request.path, codificacion=codificacion):
+                    cuerpo = _comprimir(cuerpo, codificacion)
+                cabeceras['Content-Encoding'] = codificacion
+            return cuerpo, cabeceras
+
+        cacheada = cache_respuestas.obtener_o_calcular((version, request.full_path, codificacion), calcular)
+        if cacheada is None:
+            return generada['response']
+        cuerpo, cabeceras = cacheada
+        response = app.response_class(cuerpo, mimetype='application/json', headers=cabeceras)
+        response.vary.add('Accept-Encoding')
+
+    # ETag débil: el contenido es el mismo aunque vaya comprimido o no
+    response.set_etag(etag, weak=True)
+    if ultima_modificacion is not None:
+        response.last_modified = ultima_modificacion
+    return response
+
+def _parametros_de_consulta():
+    """
+    Lee y valida los filtros y la paginación de /api/data y /api/search. Lanza ValueError con
+    un mensaje legible si algún parámetro no es válido.
+    """
+    args = request.args
+    parametros = {}
+    for nombre in ('desde', 'hasta'):
+        valor = args.get(nombre)
+        if valor:
+            try:
+                datetime.strptime(valor, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"'{nombre}' debe tener el formato AAAA-MM-DD.")
+            parametros[nombre] = valor
+    if args.get('cuenta'):
+        parametros['cuenta'] = args['cuenta']
+    for nombre, tipo in (('anio', int), ('monto_min', float), ('monto_max', float), ('cursor', int), ('limite', int)):
+        valor = args.get(nombre)
+        if valor not in (None, ''):
+            try:
+                parametros[nombre] = tipo(valor)
+            except ValueError:
+                raise ValueError(f"'{nombre}' debe ser un número.")
+    if 'limite' in parametros:
+        if parametros['limite'] <= 0:
+            raise ValueError("'limite' debe ser mayor que cero.")
+        parametros['limite'] = min(parametros['limite'], app.config['LIMITE_MAXIMO_PAGINA'])
+    return parametros
+
+def _responder_transacciones(endpoint, parametros):
+    """
+    Lee del almacén una página de transacciones con `parametros` y la devuelve
+    como JSON. Cuando hay más páginas, el cursor siguiente viaja en la cabecera
+    `X-Siguiente-Cursor` y en `Link` (rel="next", hacia `endpoint`). El enlace
+    es relativo: la respuesta se guarda en caché y se sirve a cualquier cliente,
+    sin importar el host con el que pidió la primera.
+    """
+    base_datos = app.config['BASE_DATOS']
+
+    error = _asegurar_reporte()
+    if error:
+        return error
+
+    def generar():
+        print(f"   -> Consultando el almacén '{base_datos}' para la respuesta.")
+        try:
+            with metricas.medir('consulta_almacen', ruta=request.path):
+                data, siguiente_cursor = leer_transacciones(base_datos, **parametros)
+        except Exception as e:
+            print(f"   -> ❌ Error: Ocurrió un error al consultar el almacén: {e}")
+            return jsonify({"error": f"Error al leer el almacén de datos: {e}"}), 500
+
+        with metricas.medir('serializacion_api', ruta=request.path, filas=len(data)):
+            response = jsonify(data)
+        if siguiente_cursor is not None:
+            args = request.args.to_dict()
+            args['cursor'] = siguiente_cursor
+            siguiente_url = url_for(endpoint, **args)
+            response.headers['X-Siguiente-Cursor'] = str(siguiente_cursor)
+            response.headers['Link'] = f'<{siguiente_url}>; rel="next"'
+        print("   -> Datos listos para enviar.")
+        return response
+
+    try:
+        return _respuesta_condicional(generar)
+    except Exception as e:
+        print(f"   -> ❌ Error: Ocurrió un error al consultar el almacén: {e}")
+        return jsonify({"error": f"Error al leer el almacén de datos: {e}"}), 500
 
 @app.route('/api/data')
 def get_data():
     """
-    Devuelve los datos financieros. Si el reporte no existe, ejecuta el pipeline.
+    Devuelve los datos financieros desde el almacén. Si aún no hay reporte,
+    ejecuta el pipeline.
+
+    Admite filtros por fecha (`desde`, `hasta` en formato AAAA-MM-DD), año
+    (`anio`), cuenta (`cuenta`) y monto (`monto_min`, `monto_max`), y paginación
+    por cursor con `limite` y `cursor`. Filtrar por año o cuenta solo consulta esa
+    partición del almacén. Cuando hay más páginas, el cursor siguiente viaja en la
+    cabecera `X-Siguiente-Cursor` (y en `Link` con rel="next").
     """
     print("Petición recibida en /api/data.")
-    reporte_final = app.config['REPORTE_FINAL']
+    try:
+        parametros = _parametros_de_consulta()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return _responder_transacciones('get_data', parametros)
+
+@app.route('/api/search')
+def get_search():
+    """
+    Busca transacciones por su descripción. Cada palabra de `q` se busca como
+    prefijo de las palabras de la descripción, sin distinguir mayúsculas ni
+    tildes ('yape ana' encuentra "Pago YAPE de Ana Pérez"), en el índice de
+    tokens del almacén. Admite los mismos filtros y paginación que /api/data;
+    por defecto devuelve como mucho `LIMITE_BUSQUEDA` resultados por página.
+    """
+    print("Petición recibida en /api/search.")
+    try:
+        parametros = _parametros_de_consulta()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    texto = request.args.get('q', '')
+    if not prefijos_de_consulta(texto):
+        return jsonify({"error": "'q' debe contener al menos una palabra."}), 400
+    parametros['texto'] = texto
+    parametros.setdefault('limite', app.config['LIMITE_BUSQUEDA'])
+    return _responder_transacciones('get_search', parametros)
 
-    if not os.path.exists(reporte_final):
-        print(f"   -> No se encontró '{reporte_final}'. Ejecutando el pipeline...")
-        run_data_pipeline()
+def _responder_agregado(consulta, *args):
+    """
+    Ejecuta `consulta` (de `resumenes`) sobre los resúmenes materializados del
+    almacén y devuelve el resultado (pequeño) como JSON.
+    """
+    error = _asegurar_reporte()
+    if error:
+        return error
+    def generar():
+        with metricas.medir('consulta_almacen', ruta=request.path):
+            resumen = leer_resumen(app.config['BASE_DATOS'], consulta, *args)
+        with metricas.medir('serializacion_api', ruta=request.path):
+            return jsonify(resumen)
 
-    print(f"   -> Leyendo reporte final '{reporte_final}' para la respuesta.")
     try:
-        df = pd.read_csv(reporte_final, sep=';')
-        data = df.to_dict(orient='records')
-        print("   -> Datos listos para enviar.")
-        return jsonify(data)
-    except FileNotFoundError:
-        msg = f"El archivo '{reporte_final}' no se encontró incluso después de ejecutar el pipeline."
-        print(f"   -> ❌ Error: {msg}")
-        return jsonify({"error": msg}), 500
+        return _respuesta_condicional(generar)
     except Exception as e:
-        print(f"   -> ❌ Error: Ocurrió un error al leer o convertir el CSV final: {e}")
-        return jsonify({"error": f"Error al leer el archivo CSV: {e}"}), 500
+        print(f"   -> ❌ Error: Ocurrió un error al calcular el resumen: {e}")
+        return jsonify({"error": f"Error al calcular el resumen: {e}"}), 500
+
+@app.route('/api/resumen')
+def get_resumen():
+    """
+    Todo el resumen del dashboard (totales, serie mensual, cuentas, top 5,
+    gastos por categoría y gastos atípicos) en una respuesta.
+    """
+    print("Petición recibida en /api/resumen.")
+    return _responder_agregado(resumen_completo)
+
+@app.route('/api/resumen/totales')
+def get_resumen_totales():
+    """Totales de ingresos, gastos y balance neto."""
+    return _responder_agregado(resumen_totales)
+
+@app.route('/api/resumen/mensual')
+def get_resumen_mensual():
+    """Serie mensual de ingresos y gastos."""
+    return _responder_agregado(serie_mensual)
+
+@app.route('/api/resumen/cuentas')
+def get_resumen_cuentas():
+    """Volumen movido por cada cuenta de origen."""
+    return _responder_agregado(totales_por_cuenta)
+
+@app.route('/api/resumen/categorias')
+def get_resumen_categorias():
+    """Gasto total y número de gastos por categoría, de mayor a menor."""
+    return _responder_agregado(totales_por_categoria)
+
+@app.route('/api/resumen/top')
+def get_resumen_top():
+    """
+    Ranking de grupos de descripciones. Parámetros: `tipo` ('ingresos' o
+    'gastos', por defecto 'gastos') y `n` (por defecto 5).
+    """
+    tipo = request.args.get('tipo', 'gastos')
+    if tipo not in COLUMNA_POR_TIPO:
+        return jsonify({"error": f"Tipo '{tipo}' no válido. Usa 'ingresos' o 'gastos'."}), 400
+    n = request.args.get('n', 5, type=int)
+    return _responder_agregado(top_grupos, tipo, n)
+
+@app.after_request
+def comprimir_respuesta(response):
+    """
+    Comprime las respuestas JSON grandes con Brotli (si está disponible) o gzip,
+    según lo que acepte el cliente. Las de datos ya llegan comprimidas desde la
+    caché de respuestas y no se tocan.
+    """
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+
+    datos = response.get_data()
+    codificacion = _codificacion_aceptada()
+    if len(datos) < app.config['COMPRESION_MIN_BYTES'] or codificacion is None:
+        return response
+
+    response.set_data(_comprimir(datos, codificacion))
+    response.headers['Content-Encoding'] = codificacion
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/api/data/refresh', methods=['POST'])
 def refresh_data():
-    """Forza la re-ejecución de todo el pipeline de datos."""
+    """
+    Encola la re-ejecución de todo el pipeline de datos y responde al momento
+    con el identificador de la tarea (202). Si ya hay una ejecución en curso,
+    se devuelve esa misma. Los PDFs sin cambios se toman de la caché salvo que
+    se pida `?invalidar_cache=1`.
+    """
     print("Petición recibida en /api/data/refresh. Forzando actualización...")
-    run_data_pipeline()
-    return jsonify({"status": "success", "message": "Los datos han sido actualizados."})
+    reiniciar_cache = request.args.get('invalidar_cache', '').lower() in ('1', 'true', 'si', 'sí')
+    tarea = ejecutor_pipeline.iniciar(run_data_pipeline, reiniciar_cache=reiniciar_cache)
+    response = jsonify({
+        "status": "accepted",
+        "message": "La actualización de los datos está en curso.",
+        "tarea": tarea
+    })
+    response.status_code = 202
+    response.headers['Location'] = url_for('get_tarea', tarea_id=tarea['id'])
+    return response
+
+@app.route('/api/tareas/<tarea_id>')
+def get_tarea(tarea_id):
+    """Estado y progreso (etapa y PDFs procesados) de una ejecución del pipeline."""
+    tarea = ejecutor_pipeline.obtener(tarea_id)
+    if tarea is None:
+        return jsonify({"error": f"No existe la tarea '{tarea_id}'."}), 404
+    return jsonify(tarea)
+
+@app.route('/api/cache')
+def get_cache_stats():
+    """Estadísticas de la caché de respuestas (aciertos, fallos, memoria usada)."""
+    return jsonify(cache_respuestas.estadisticas())
+
+def _estados_por_cuenta(cambios, cuentas):
+    """
+    Reparte las rutas de `cambios` entre las cuentas según su carpeta. Devuelve
+    `(extraer, estados)`: los PDFs añadidos o modificados de cada cuenta y los
+    pares (cuenta, estado) afectados, o None si alguna ruta no es de ninguna
+    cuenta configurada (p. ej. porque cambió la configuración).
+    """
+    por_carpeta = {os.path.normcase(os.path.abspath(cuenta['carpeta'])): cuenta['nombre'] for cuenta in cuentas}
+    extraer = {cuenta['nombre']: [] for cuenta in cuentas}
+    estados = []
+    for tipo, rutas in cambios.items():
+        for ruta in rutas:
+            nombre = por_carpeta.get(os.path.normcase(os.path.abspath(os.path.dirname(ruta))))
+            if nombre is None:
+                return None
+            estados.append((nombre, os.path.basename(ruta)))
+            if tipo != 'eliminados':
+                extraer[nombre].append(os.path.basename(ruta))
+    return extraer, estados
+
+def _ingerir_estados(cambios, instantanea, progreso=None):
+    """
+    Ingiere de forma incremental los PDFs de `cambios`: extrae solo los
+    añadidos o modificados, concilia solo las cuentas afectadas y reemplaza en
+    el almacén solo las transacciones de esos estados de cuenta. Las
+    transferencias entre cuentas propias se excluyen del reporte tengan o no
+    pareja, así que las filas publicadas de un estado no dependen de los demás.
+
+    Si el almacén no sabe de qué PDFs sale el reporte publicado (no hay
+    reporte, o se publicó sin escanear las carpetas) o algún cambio no es de
+    una cuenta configurada, se ejecuta el pipeline completo. Las copias CSV
+    se regeneran en la siguiente ejecución completa.
+    """
+    from unificador import unificar_y_conciliar_cuentas
+
+    base_datos = app.config['BASE_DATOS']
+    cuentas = _cuentas_configuradas()
+    repartidos = _estados_por_cuenta(cambios, cuentas)
+    if leer_instantanea(base_datos) is None or repartidos is None:
+        print("   -> No se puede ingerir solo lo que cambió: se ejecuta el pipeline completo.")
+        run_data_pipeline(progreso=progreso)
+        return
+    extraer, estados = repartidos
+
+    print(f"🚀 Ingiriendo {len(estados)} estado(s) de cuenta modificado(s)...")
+    with metricas.medir('ingesta_incremental', estados=len(estados)):
+        # Una cuenta en la que solo se eliminaron PDFs no tiene nada que extraer
+        afectadas = [cuenta for cuenta in cuentas if extraer[cuenta['nombre']]]
+        _notificar_etapa(progreso, 'extraccion')
+        reportes = _extraer_cuentas(afectadas, progreso, archivos=extraer) if afectadas else {}
+
+        _notificar_etapa(progreso, 'conciliacion')
+        df_cambios = unificar_y_conciliar_cuentas(
+            reportes, tolerancia_dias=app.config['TOLERANCIA_DIAS_CONCILIACION']
+        ) if reportes else None
+
+        _notificar_etapa(progreso, 'publicacion')
+        actualizar_estados(df_cambios, estados, base_datos, instantanea=instantanea)
+        cache_respuestas.invalidar()
+    print("✅ Ingesta incremental completada.")
+
+def ingerir_cambios(cambios=None, instantanea=None):
+    """
+    Actualiza el reporte tras un cambio en las carpetas de PDFs. Si ya hay una
+    ejecución en curso, puede haber empezado antes del cambio, así que se espera
+    a que termine y se lanza otra. Con los `cambios` del observador (y el
+    escaneo `instantanea` en el que ya están aplicados) solo se ingieren los
+    estados de cuenta afectados; sin ellos se ejecuta el pipeline completo.
+    """
+    en_curso = ejecutor_pipeline.tarea_en_curso()
+    if en_curso is not None:
+        ejecutor_pipeline.esperar(en_curso['id'])
+    if cambios is None or instantanea is None:
+        tarea = ejecutor_pipeline.iniciar(run_data_pipeline)
+    else:
+        tarea = ejecutor_pipeline.iniciar(_ingerir_estados, cambios=cambios, instantanea=instantanea)
+    return ejecutor_pipeline.esperar(tarea['id'])
+
+def crear_observador():
+    """
+    Observador de las carpetas de PDFs configuradas, listo para `iniciar()`.
+    Parte del escaneo del que sale el reporte publicado: si desde entonces no
+    cambió ningún PDF, arrancar no vuelve a procesar nada.
+    """
+    return ObservadorCarpetas(
+        [cuenta['carpeta'] for cuenta in _cuentas_configuradas()],
+        ingerir_cambios,
+        intervalo=app.config['INTERVALO_OBSERVADOR'],
+        espera=app.config['ESPERA_OBSERVADOR'],
+        procesado=leer_instantanea(app.config['BASE_DATOS']),
+    )
+
+@app.route('/api/metrics')
+def get_metrics():
+    """
+    Métricas en formato de texto de Prometheus: duración de cada etapa
+    (histograma por `etapa`), contadores del pipeline (páginas, transacciones,
+    transferencias, caché de extracción) y el estado de la caché de respuestas.
+    """
+    estadisticas = cache_respuestas.estadisticas()
+    adicionales = {
+        f"cache_respuestas_{clave}": (valor, f"Caché de respuestas de la API: {clave}.")
+        for clave, valor in estadisticas.items()
+    }
+    cuerpo = metricas.registro.formato_prometheus(adicionales)
+    return app.response_class(cuerpo, content_type='text/plain; version=0.0.4; charset=utf-8')
 
 if __name__ == '__main__':
+    # Una configuración de cuentas inválida se detecta al arrancar, no en la primera petición
+    _cuentas_configuradas()
+    metricas.configurar_log(app.config['ARCHIVO_LOG'])
+    # Si las reglas de categorías o familias cambiaron, se corrige solo lo afectado
+    revisar_reglas()
+    # Con el recargador de Flask este bloque se ejecuta también en el proceso
+    # vigilante; el observador solo se inicia en el que atiende las peticiones
+    if app.config['OBSERVAR_CARPETAS'] and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        crear_observador().iniciar()
     app.run(debug=True, port=5001)
\ No newline at end of file
@@ -0,0 +1,273 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from generador_sintetico import (generar_transacciones, escribir_csv_consolidado, escribir_estado_pdf,
+                                 escribir_estados_mensuales)
+
+# --- CONFIGURACIÓN POR DEFECTO ---
+# Transacciones totales (entre las dos cuentas) con las que se mide la conciliación y la API
+TAMANOS = [1_000, 10_000, 100_000]
+# Transacciones de los PDFs sintéticos (la extracción es la etapa más lenta)
+TAMANO_PDF = 2_000
+# Cada etapa se ejecuta varias veces y se toma el mejor tiempo
+REPETICIONES = 3
+# Un tiempo o pico de memoria mayor que la base en más de esta fracción es una regresión
+UMBRAL_REGRESION = 0.20
+# Diferencias absolutas por debajo de estas no se consideran regresión (ruido de medida)
+DIFERENCIA_MINIMA = {'segundos': 0.005, 'pico_mb': 0.5, 'rss_mb': 2}
+ARCHIVO_BASE = "benchmark_base.json"
+ARCHIVO_RESULTADOS = "benchmark_ultimo.json"
+
+@contextlib.contextmanager
+def _sin_salida():
+    """Descarta lo que las etapas imprimen por pantalla mientras se miden."""
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        yield
+
+def medir(funcion, repeticiones=REPETICIONES, memoria=True):
+    """
+    Ejecuta `funcion` `repeticiones` veces y devuelve el mejor tiempo en
+    segundos. Con `memoria=True` se hace una ejecución más bajo tracemalloc
+    para obtener el pico de memoria de Python (en MB); se mide aparte porque
+    tracemalloc ralentiza la ejecución. Los procesos hijos no se cuentan.
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        with _sin_salida():
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - inicio)
+    resultado = {'segundos': round(min(tiempos), 4)}
+
+    if memoria:
+        tracemalloc.start()
+        try:
+            with _sin_salida():
+                funcion()
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        resultado['pico_mb'] = round(pico / 2**20, 2)
+    return resultado
+
+# --- ETAPAS ---
+
+def medir_extraccion(carpeta, tamano_pdf, procesos, **opciones):
+    """
+    Mide `extraer_transacciones` sobre un PDF y `procesar_carpeta_de_pdfs` sobre
+    una carpeta de PDFs mensuales. Las etapas se etiquetan con las filas que
+    realmente lleva el PDF.
+    """
+    from extractor import extraer_transacciones
+    from procesador_anual import procesar_carpeta_de_pdfs
+
+    # Con una sola cuenta el generador sortea entre dos y descarta la segunda:
+    # se piden el doble para que el PDF tenga unas `tamano_pdf` filas
+    df = generar_transacciones(2 * tamano_pdf, proporcion_transferencias=0, cuentas=('Yape',))['Yape']
+    filas = len(df)
+    ruta_pdf = os.path.join(carpeta, "estado_anual.pdf")
+    escribir_estado_pdf(ruta_pdf, df, df['Fecha_Completa'].min(), df['Fecha_Completa'].max())
+    carpeta_pdfs = os.path.join(carpeta, "mensuales")
+    escribir_estados_mensuales(carpeta_pdfs, df, "yape")
+
+    return {
+        f"extraer_transacciones[n={filas}]":
+            medir(lambda: extraer_transacciones(ruta_pdf), **opciones),
+        f"procesar_carpeta_de_pdfs[n={filas},procesos={procesos}]":
+            medir(lambda: procesar_carpeta_de_pdfs(carpeta_pdfs, max_workers=procesos), **opciones),
+    }
+
+def medir_conciliacion_y_api(carpeta, tamano, **opciones):
+    """
+    Mide `unificar_y_conciliar_reportes` con dos cuentas sintéticas de `tamano`
+    transacciones en total, tanto con los reportes ya en memoria como leyéndolos
+    de sus CSV consolidados, y la respuesta de /api/data sobre el reporte
+    resultante, sin caché de respuestas (fría) y con ella (caliente).
+    """
+    from unificador import unificar_y_conciliar_reportes
+    from almacen import guardar_reporte
+    import app as aplicacion
+
+    cuentas = generar_transacciones(tamano)
+    conciliar = lambda: unificar_y_conciliar_reportes(cuentas['Yape'], cuentas['Ahorro'], tolerancia_dias=1)
+    resultados = {f"unificar_y_conciliar_reportes[n={tamano}]": medir(conciliar, **opciones)}
+
+    csv_yape = os.path.join(carpeta, f"consolidado_yape_{tamano}.csv")
+    csv_ahorro = os.path.join(carpeta, f"consolidado_ahorro_{tamano}.csv")
+    escribir_csv_consolidado(csv_yape, cuentas['Yape'])
+    escribir_csv_consolidado(csv_ahorro, cuentas['Ahorro'])
+    conciliar_csv = lambda: unificar_y_conciliar_reportes(csv_yape, csv_ahorro, tolerancia_dias=1)
+    resultados[f"unificar_y_conciliar_reportes[n={tamano},origen=csv]"] = medir(conciliar_csv, **opciones)
+
+    with _sin_salida():
+        df_final = conciliar()
+        base_datos = os.path.join(carpeta, f"benchmark_{tamano}.db")
+        guardar_reporte(df_final, base_datos)
+
+    aplicacion.app.config.update(BASE_DATOS=base_datos, TESTING=True)
+    cliente = aplicacion.app.test_client()
+
+    def pedir_datos():
+        respuesta = cliente.get('/api/data')
+        assert respuesta.status_code == 200, respuesta.status_code
+
+    def pedir_datos_en_frio():
+        aplicacion.cache_respuestas.invalidar()
+        pedir_datos()
+
+    resultados[f"api_data[n={tamano},cache=fria]"] = medir(pedir_datos_en_frio, **opciones)
+    with _sin_salida():
+        pedir_datos()
+    resultados[f"api_data[n={tamano},cache=caliente]"] = medir(pedir_datos, **opciones)
+    aplicacion.cache_respuestas.invalidar()
+    return resultados
+
+# Proceso hijo de `medir_arranque`: importa la app y atiende una petición
+_SCRIPT_ARRANQUE = """
+import json, resource, sys, time
+inicio = time.perf_counter()
+import app as aplicacion
+aplicacion.app.config.update(BASE_DATOS=sys.argv[1], TESTING=True)
+respuesta = aplicacion.app.test_client().get('/api/resumen')
+assert respuesta.status_code == 200, respuesta.status_code
+segundos = time.perf_counter() - inicio
+# VmHWM es el pico del propio proceso; ru_maxrss incluiría la memoria del padre antes del exec
+try:
+    with open('/proc/self/status') as estado:
+        rss_kb = next(int(linea.split()[1]) for linea in estado if linea.startswith('VmHWM:'))
+except (OSError, StopIteration):
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'segundos': segundos, 'rss_mb': rss_kb / 1024,
+                  'pipeline_cargado': any(m in sys.modules for m in ('pdfplumber', 'pandas'))}))
+"""
+
+def medir_arranque(carpeta, repeticiones=REPETICIONES, memoria=True):
+    """
+    Mide el arranque en frío de un proceso que solo sirve datos: importar la app
+    y responder /api/resumen sobre un reporte ya publicado, cada vez en un
+    proceso nuevo. Con `memoria=True` se da también la memoria residente máxima
+    de ese proceso (en MB).
+    """
+    from almacen import guardar_reporte
+    from unificador import unificar_y_conciliar_reportes
+
+    base_datos = os.path.join(carpeta, "benchmark_arranque.db")
+    with _sin_salida():
+        cuentas = generar_transacciones(1_000)
+        guardar_reporte(unificar_y_conciliar_reportes(cuentas['Yape'], cuentas['Ahorro']), base_datos)
+
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    medidas = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, '-c', _SCRIPT_ARRANQUE, base_datos], cwd=directorio,
+                                capture_output=True, text=True, check=True).stdout
+        medidas.append(json.loads(salida.strip().splitlines()[-1]))
+    if any(medida['pipeline_cargado'] for medida in medidas):
+        print("   ⚠️ Servir el reporte cargó pdfplumber o pandas.")
+
+    resultado = {'segundos': round(min(m['segundos'] for m in medidas), 4)}
+    if memoria:
+        resultado['rss_mb'] = round(min(m['rss_mb'] for m in medidas), 1)
+    return {"arranque_api": resultado}
+
+# --- BASE DE COMPARACIÓN ---
+
+def comparar_con_base(resultados, base, umbral=UMBRAL_REGRESION):
+    """
+    Compara cada medida con la de la base y devuelve la lista de regresiones
+    `(etapa, metrica, valor_base, valor_actual)` que superan el umbral relativo
+    y, además, la diferencia mínima absoluta de su métrica.
+    """
+    regresiones = []
+    print("\n" + "─"*20 + " COMPARACIÓN CON LA BASE " + "─"*20)
+    for etapa, medidas in resultados.items():
+        medidas_base = base.get(etapa)
+        if not medidas_base:
+            print(f"   🆕 {etapa}: sin medida en la base")
+            continue
+        for metrica, valor in medidas.items():
+            valor_base = medidas_base.get(metrica)
+            if not valor_base:
+                continue
+            cambio = valor / valor_base - 1
+            significativo = abs(valor - valor_base) >= DIFERENCIA_MINIMA.get(metrica, 0)
+            regresion = significativo and cambio > umbral
+            icono = "⚠️" if regresion else ("🚀" if significativo and cambio < -umbral else "✅")
+            print(f"   {icono} {etapa} {metrica}: {valor_base} -> {valor} ({cambio:+.0%})")
+            if regresion:
+                regresiones.append((etapa, metrica, valor_base, valor))
+    return regresiones
+
+def ejecutar(tamanos=TAMANOS, tamano_pdf=TAMANO_PDF, repeticiones=REPETICIONES, procesos=1, memoria=True):
+    """Ejecuta todas las etapas en una carpeta temporal y devuelve el informe con sus medidas."""
+    opciones = {'repeticiones': repeticiones, 'memoria': memoria}
+    resultados = {}
+    carpeta = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        if tamano_pdf:
+            print(f"⏱️ Extracción de PDFs ({tamano_pdf} transacciones)...")
+            resultados.update(medir_extraccion(carpeta, tamano_pdf, procesos, **opciones))
+        print("⏱️ Arranque en frío de la API...")
+        resultados.update(medir_arranque(carpeta, **opciones))
+        for tamano in tamanos:
+            print(f"⏱️ Conciliación y API ({tamano} transacciones)...")
+            resultados.update(medir_conciliacion_y_api(carpeta, tamano, **opciones))
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    for etapa, medidas in resultados.items():
+        memoria_txt = f", pico {medidas['pico_mb']} MB" if 'pico_mb' in medidas else ""
+        memoria_txt += f", residente {medidas['rss_mb']} MB" if 'rss_mb' in medidas else ""
+        print(f"   📊 {etapa}: {medidas['segundos']} s{memoria_txt}")
+
+    return {
+        'fecha': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'nucleos': os.cpu_count(),
+        'resultados': resultados,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide cada etapa del pipeline con datos sintéticos.")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=TAMANOS,
+                        help="transacciones totales para la conciliación y la API (p. ej. 1000 1000000)")
+    parser.add_argument('--tamano-pdf', type=int, default=TAMANO_PDF,
+                        help="transacciones aproximadas de los PDFs sintéticos (0 para no medir la extracción)")
+    parser.add_argument('--repeticiones', type=int, default=REPETICIONES)
+    parser.add_argument('--procesos', type=int, default=1, help="procesos de procesar_carpeta_de_pdfs")
+    parser.add_argument('--sin-memoria', action='store_true', help="no medir el pico de memoria")
+    parser.add_argument('--base', default=ARCHIVO_BASE, help="archivo JSON con la base de comparación")
+    parser.add_argument('--guardar-base', action='store_true', help="guardar estos resultados como nueva base")
+    parser.add_argument('--umbral', type=float, default=UMBRAL_REGRESION)
+    args = parser.parse_args()
+
+    informe = ejecutar(args.tamanos, args.tamano_pdf, args.repeticiones, args.procesos, not args.sin_memoria)
+    with open(ARCHIVO_RESULTADOS, 'w') as archivo:
+        json.dump(informe, archivo, indent=2)
+
+    if args.guardar_base:
+        with open(args.base, 'w') as archivo:
+            json.dump(informe, archivo, indent=2)
+        print(f"\n💾 Base guardada en '{args.base}'.")
+    elif os.path.exists(args.base):
+        with open(args.base) as archivo:
+            base = json.load(archivo)['resultados']
+        regresiones = comparar_con_base(informe['resultados'], base, args.umbral)
+        if regresiones:
+            print(f"\n❌ {len(regresiones)} regresión(es) por encima del {args.umbral:.0%}.")
+            sys.exit(1)
+        print("\n✅ Sin regresiones respecto a la base.")
+    else:
+        print(f"\nℹ️ No hay base en '{args.base}'. Usa --guardar-base para crearla.")
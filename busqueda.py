@@ -0,0 +1,98 @@
+import json
+import re
+import unicodedata
+
+# Índice invertido de las descripciones: cada token de una descripción
+# normalizada (comercios, contrapartes de Yape/Plin, números de referencia...)
+# apunta a las descripciones que lo contienen, y de ahí a sus transacciones por
+# el índice de descripciones del almacén. Los tokens solo contienen [0-9a-z],
+# así que una búsqueda por prefijo es un rango contiguo del índice.
+_PALABRA = re.compile(r'[0-9a-z]+')
+# Tramos de solo letras o solo dígitos dentro de una palabra mixta ('clar123')
+_TRAMO = re.compile(r'[0-9]+|[a-z]+')
+
+# Una palabra de la consulta que aparece en como mucho este número de
+# descripciones se resuelve con la lista explícita de esas descripciones. Si
+# todas las palabras son más comunes, SQLite filtra con el índice completo.
+MAX_DESCRIPCIONES_SELECTIVAS = 2000
+
+def normalizar(texto):
+    """Pasa un texto a minúsculas y sin tildes ni otros signos diacríticos."""
+    texto = unicodedata.normalize('NFKD', str(texto).lower())
+    return texto.encode('ascii', 'ignore').decode('ascii')
+
+def tokenizar(texto):
+    """
+    Tokens de una descripción, sin repetir: cada palabra alfanumérica y, si
+    mezcla letras y dígitos, también cada tramo ('WOW0020240762146' da 'wow',
+    '0020240762146' y la palabra entera), para encontrar comercio y referencia
+    por separado.
+    """
+    tokens = []
+    for palabra in _PALABRA.findall(normalizar(texto or '')):
+        tokens.append(palabra)
+        tramos = _TRAMO.findall(palabra)
+        if len(tramos) > 1:
+            tokens.extend(tramos)
+    return list(dict.fromkeys(tokens))
+
+def prefijos_de_consulta(consulta):
+    """Palabras normalizadas de una consulta; cada una se busca como prefijo."""
+    return list(dict.fromkeys(_PALABRA.findall(normalizar(consulta or ''))))
+
+def rango_de_prefijo(prefijo):
+    """Límites `[desde, hasta)` de los tokens que empiezan por `prefijo`."""
+    return prefijo, prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+
+def filas_del_indice(descripciones):
+    """
+    Pares (token, descripción) de las descripciones distintas de un reporte,
+    ordenados como el índice. Muchas transacciones comparten descripción, así
+    que cada una se tokeniza y se indexa una sola vez.
+    """
+    filas = {
+        (token, descripcion)
+        for descripcion in descripciones.dropna().astype(str).unique()
+        for token in tokenizar(descripcion)
+    }
+    return sorted(filas)
+
+def _contiene_prefijos(descripcion, prefijos):
+    """Indica si cada prefijo encabeza algún token de la descripción."""
+    tokens = tokenizar(descripcion)
+    return all(any(token.startswith(prefijo) for token in tokens) for prefijo in prefijos)
+
+def condicion_de_texto(conexion, texto):
+    """
+    Condición SQL sobre la tabla de transacciones (y sus parámetros) que deja
+    las transacciones cuya descripción tiene, para cada palabra de `texto`, un
+    token que empieza por ella. Devuelve None si `texto` no tiene palabras.
+
+    Se parte de la palabra que aparece en menos descripciones (contando como
+    mucho hasta `MAX_DESCRIPCIONES_SELECTIVAS`): si es selectiva, sus
+    descripciones se leen del índice, se comprueban aquí las demás palabras y
+    el resultado va al índice de descripciones del almacén.
+    """
+    prefijos = prefijos_de_consulta(texto)
+    if not prefijos:
+        return None
+
+    def contar(prefijo):
+        return conexion.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM indice_tokens WHERE TOKEN >= ? AND TOKEN < ? LIMIT ?)",
+            (*rango_de_prefijo(prefijo), MAX_DESCRIPCIONES_SELECTIVAS + 1),
+        ).fetchone()[0]
+
+    conteo, guia = min((contar(prefijo), prefijo) for prefijo in prefijos)
+    if conteo <= MAX_DESCRIPCIONES_SELECTIVAS:
+        candidatas = conexion.execute(
+            "SELECT DISTINCT DESCRIPCION FROM indice_tokens WHERE TOKEN >= ? AND TOKEN < ?", rango_de_prefijo(guia)
+        ).fetchall()
+        resto = [prefijo for prefijo in prefijos if prefijo != guia]
+        descripciones = [d for (d,) in candidatas if _contiene_prefijos(d, resto)]
+        return "DESCRIPCION IN (SELECT value FROM json_each(?))", [json.dumps(descripciones)]
+
+    condicion = "DESCRIPCION IN (SELECT DESCRIPCION FROM indice_tokens WHERE TOKEN >= ? AND TOKEN < ?)"
+    return " AND ".join([condicion] * len(prefijos)), [
+        limite for prefijo in prefijos for limite in rango_de_prefijo(prefijo)
+    ]
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import pandas as pd
+
+from extractor import VERSION_EXTRACTOR
+
+# Sufijo de los archivos de caché. Cada entrada es un DataFrame serializado
+# con pickle, que conserva los tipos y se lee mucho más rápido que un CSV.
+EXTENSION_CACHE = ".pkl"
+
+def hash_archivo(ruta, tamano_bloque=1 << 20):
+    """Calcula el SHA-256 del contenido de un archivo leyéndolo por bloques."""
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+def clave_cache(hash_pdf):
+    """
+    Clave de una entrada: versión del extractor + hash del contenido del PDF.
+    Al cambiar `VERSION_EXTRACTOR` todas las entradas antiguas dejan de coincidir.
+    """
+    return f"{VERSION_EXTRACTOR}-{hash_pdf}"
+
+def _ruta_entrada(carpeta_cache, hash_pdf):
+    return os.path.join(carpeta_cache, clave_cache(hash_pdf) + EXTENSION_CACHE)
+
+def leer_cache(carpeta_cache, hash_pdf):
+    """
+    Devuelve el DataFrame guardado para ese PDF o None si no hay entrada válida.
+    Una entrada ilegible se trata como un fallo de caché.
+    """
+    ruta = _ruta_entrada(carpeta_cache, hash_pdf)
+    if not os.path.exists(ruta):
+        return None
+    try:
+        return pd.read_pickle(ruta)
+    except Exception as e:
+        print(f"   -> ⚠️ Entrada de caché corrupta '{os.path.basename(ruta)}', se ignorará: {e}")
+        return None
+
+def guardar_cache(carpeta_cache, hash_pdf, df):
+    """Guarda las transacciones extraídas de un PDF de forma atómica."""
+    os.makedirs(carpeta_cache, exist_ok=True)
+    ruta = _ruta_entrada(carpeta_cache, hash_pdf)
+    ruta_temporal = f"{ruta}.{os.getpid()}.tmp"
+    df.to_pickle(ruta_temporal)
+    os.replace(ruta_temporal, ruta)
+
+def purgar_cache(carpeta_cache, hashes_vigentes):
+    """
+    Elimina las entradas que ya no corresponden a ningún PDF de la carpeta
+    (PDF borrado o modificado) o que pertenecen a otra versión del extractor.
+    Devuelve el número de entradas eliminadas.
+    """
+    if not os.path.isdir(carpeta_cache):
+        return 0
+    vigentes = {clave_cache(h) + EXTENSION_CACHE for h in hashes_vigentes}
+    eliminadas = 0
+    for nombre in os.listdir(carpeta_cache):
+        if nombre.endswith(EXTENSION_CACHE) and nombre not in vigentes:
+            os.remove(os.path.join(carpeta_cache, nombre))
+            eliminadas += 1
+    return eliminadas
+
+def invalidar_cache(carpeta_cache):
+    """Vacía por completo la caché (por ejemplo, tras cambiar la lógica del extractor)."""
+    return purgar_cache(carpeta_cache, [])
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+
+class CacheRespuestas:
+    """
+    Caché en memoria de respuestas ya serializadas, acotada por bytes y con
+    expulsión LRU. Las claves incluyen la versión del reporte, así que una
+    versión nueva nunca sirve datos antiguos; `invalidar` vacía todo de golpe.
+
+    Si varias peticiones piden a la vez la misma clave ausente, solo la primera
+    calcula el valor y el resto espera su resultado.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._en_curso = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    def obtener_o_calcular(self, clave, calcular):
+        """
+        Devuelve `(cuerpo, cabeceras)` de la caché o los calcula con `calcular()`.
+        `calcular` devuelve `(cuerpo, cabeceras)`, o None si el resultado no debe
+        guardarse (por ejemplo, un error); en ese caso también se devuelve None.
+        """
+        while True:
+            with self._lock:
+                if clave in self._entradas:
+                    self._entradas.move_to_end(clave)
+                    self.aciertos += 1
+                    return self._entradas[clave]
+                evento = self._en_curso.get(clave)
+                if evento is None:
+                    evento = self._en_curso[clave] = threading.Event()
+                    self.fallos += 1
+                    break
+            # Otra petición ya está calculando esta clave: esperar y reintentar
+            evento.wait()
+
+        try:
+            valor = calcular()
+            if valor is not None:
+                self._guardar(clave, valor)
+            return valor
+        finally:
+            with self._lock:
+                del self._en_curso[clave]
+            evento.set()
+
+    def _guardar(self, clave, valor):
+        tamano = len(valor[0])
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            if clave in self._entradas:
+                self._bytes -= len(self._entradas.pop(clave)[0])
+            self._entradas[clave] = valor
+            self._bytes += tamano
+            while self._bytes > self.max_bytes:
+                _, expulsado = self._entradas.popitem(last=False)
+                self._bytes -= len(expulsado[0])
+                self.expulsiones += 1
+
+    def invalidar(self):
+        """Vacía la caché de forma atómica (las estadísticas se conservan)."""
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'expulsiones': self.expulsiones,
+                'tasa_aciertos': round(self.aciertos / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,87 @@
+import hashlib
+import re
+from functools import lru_cache
+
+# numpy y pandas se importan dentro de `categorizar`: la app compara las huellas
+# de las reglas al arrancar sin cargarlos.
+
+# Reglas de categorización de gastos, en orden de prioridad: una transacción
+# pertenece a la primera categoría cuyo patrón aparezca en su descripción (sin
+# distinguir mayúsculas). Son las mismas que usaba `analizarGastosDetalladamente`
+# en el frontend; la última recoge cualquier descripción no vacía.
+REGLAS_CATEGORIAS = [
+    ('Servicios Básicos', r"pago de servicio|luz del sur|sedapal|calidda|movistar|claro|entel|directv"),
+    ('Transporte', r"beat|uber|cabify|didi|peaje|pasaje|transporte"),
+    ('Comida y Restaurantes', r"restaurante|cafe|pardo's chicken|kfc|mcdonald's|starbucks|chifa|comida|mercado"
+                              r"|plaza vea|wong|metro|tottus|vivanda"),
+    ('Suscripciones y Digital', r"netflix|spotify|disney+|hbo max|prime video|google|microsoft|apple|wow"),
+    ('Salud', r"farmacia|doctor|clínica|salud|botica"),
+    ('Compras', r"ripley|saga falabella|h&m|zara|compras|tienda|mall|jockey plaza"),
+    ('Transferencias y Retiros', r"transferencia a|retiro en|envío a"),
+    ('Otros Gastos', r"."),
+]
+
+# Categoría de las transacciones que no encajan en ninguna regla (p. ej. sin descripción)
+CATEGORIA_POR_DEFECTO = 'Otros Gastos'
+
+@lru_cache(maxsize=8)
+def _compilar(reglas):
+    """
+    Une todas las reglas en una sola expresión anclada al inicio. Cada
+    alternativa comprueba con una búsqueda anticipada si su patrón aparece en
+    algún punto de la descripción, y las alternativas se prueban en orden, así
+    que gana la primera regla que encaje (no la coincidencia más a la izquierda).
+    El grupo vacío `rN` indica qué regla encajó.
+    """
+    alternativas = "|".join(
+        f"(?=(?s:.*?)(?:{patron}))(?P<r{indice}>)" for indice, (_, patron) in enumerate(reglas)
+    )
+    return re.compile(f"^(?:{alternativas})", re.IGNORECASE)
+
+def compilar_reglas(reglas=REGLAS_CATEGORIAS):
+    """Devuelve la expresión combinada (compilada una vez por conjunto de reglas)."""
+    return _compilar(tuple(reglas))
+
+def huellas_reglas(reglas=REGLAS_CATEGORIAS):
+    """Huella corta de cada regla (categoría y patrón), para detectar cuáles cambiaron."""
+    return [
+        hashlib.sha1(f"{categoria}\x00{patron}".encode('utf-8')).hexdigest()[:12]
+        for categoria, patron in reglas
+    ]
+
+def primera_regla_cambiada(anteriores, actuales):
+    """
+    Posición de la primera regla que difiere entre dos listas de huellas, o None
+    si son iguales. Las transacciones asignadas a una regla anterior a esa
+    posición conservan su categoría: las reglas previas no cambiaron y ya
+    encajaban antes que cualquiera de las siguientes.
+    """
+    for posicion, (anterior, actual) in enumerate(zip(anteriores, actuales)):
+        if anterior != actual:
+            return posicion
+    if len(anteriores) != len(actuales):
+        return min(len(anteriores), len(actuales))
+    return None
+
+def categorizar(descripciones, reglas=REGLAS_CATEGORIAS):
+    """
+    Asigna una categoría a cada descripción. Devuelve `(categorias, reglas)`:
+    una serie con el nombre de la categoría y un array con la posición de la
+    regla que encajó (`len(reglas)` si ninguna). Cada descripción distinta se
+    evalúa una sola vez.
+    """
+    import numpy as np
+    import pandas as pd
+
+    patron = compilar_reglas(reglas)
+    sin_regla = len(reglas)
+    codigos, unicas = pd.factorize(descripciones.fillna('').astype(str))
+
+    indices_unicas = np.empty(len(unicas), dtype='int64')
+    for posicion, descripcion in enumerate(unicas):
+        coincidencia = patron.match(descripcion)
+        indices_unicas[posicion] = int(coincidencia.lastgroup[1:]) if coincidencia else sin_regla
+
+    indices = indices_unicas[codigos]
+    nombres = np.array([categoria for categoria, _ in reglas] + [CATEGORIA_POR_DEFECTO], dtype=object)
+    return pd.Series(nombres[indices], index=descripciones.index, name='CATEGORIA'), indices
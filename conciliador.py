@@ -0,0 +1,143 @@
+from collections import defaultdict, deque
+from itertools import combinations
+
+import pandas as pd
+
+from esquema import a_centimos
+
+# Columnas del DataFrame de transferencias enlazadas
+COLUMNAS_ENLAZADAS = ['INDICE_A', 'INDICE_B', 'FECHA_A', 'FECHA_B', 'MONTO', 'SENTIDO']
+
+def _a_centimos(serie):
+    """Montos en céntimos enteros (ya lo están en el esquema compacto), para compararlos de forma exacta."""
+    return a_centimos(serie, 'centimos').to_numpy()
+
+def _indexar_por_clave(transfers):
+    """
+    Construye el índice hash de una cuenta: (día, céntimos, sentido) -> cola de
+    posiciones de fila, en el orden original. Una fila con cargo y abono aparece
+    en las dos colas; las ya usadas se descartan al consultarlas.
+    """
+    indice = defaultdict(deque)
+    fechas = transfers['Fecha_Completa']
+    dias = fechas.to_numpy(dtype='datetime64[D]')
+    validas = fechas.notna().to_numpy()
+    cargos = _a_centimos(transfers['CARGOS / DEBE'])
+    abonos = _a_centimos(transfers['ABONOS / HABER'])
+    for pos in range(len(transfers)):
+        if not validas[pos]:
+            continue
+        if cargos[pos] > 0:
+            indice[(dias[pos], cargos[pos], 'salida')].append(pos)
+        if abonos[pos] > 0:
+            indice[(dias[pos], abonos[pos], 'entrada')].append(pos)
+    return indice
+
+def _primer_libre(cola, usadas):
+    """Devuelve la primera posición de la cola que aún no se ha enlazado (o None)."""
+    while cola and cola[0] in usadas:
+        cola.popleft()
+    return cola[0] if cola else None
+
+def conciliar_transferencias(transfers_a, transfers_b, tolerancia_dias=0):
+    """
+    Empareja uno a uno las transferencias entre dos cuentas propias mediante un
+    índice hash sobre (fecha, monto, sentido), en O(n + m) en lugar de comparar
+    todas las filas entre sí.
+
+    Una salida de A se enlaza con una entrada de B del mismo monto y viceversa.
+    El emparejamiento es voraz y respeta el orden de las filas: cada fila de A,
+    en orden, toma la primera fila libre de B que encaje (a igualdad, el sentido
+    A -> B tiene prioridad). Con `tolerancia_dias > 0` también se aceptan fechas
+    de B hasta esa cantidad de días antes o después, prefiriendo la más cercana.
+
+    Ambos DataFrames deben tener 'Fecha_Completa', 'CARGOS / DEBE',
+    'ABONOS / HABER' (en céntimos) y 'CUENTA_ORIGEN'. Devuelve una tupla
+    `(enlazadas, huerfanas_a, huerfanas_b)` de DataFrames: los pares enlazados
+    (con los índices originales de cada fila) y las filas sin pareja de cada cuenta.
+    """
+    indice_b = _indexar_por_clave(transfers_b)
+    usadas_b = set()
+    pares = []
+
+    fechas_a = transfers_a['Fecha_Completa']
+    dias_a = fechas_a.to_numpy(dtype='datetime64[D]')
+    validas_a = fechas_a.notna().to_numpy()
+    cargos_a = _a_centimos(transfers_a['CARGOS / DEBE'])
+    abonos_a = _a_centimos(transfers_a['ABONOS / HABER'])
+    # Desfases de fecha agrupados por distancia: [(0,), (-1, 1), (-2, 2), ...]
+    distancias = [(0,)] + [(-d, d) for d in range(1, tolerancia_dias + 1)]
+
+    for pos_a in range(len(transfers_a)):
+        if not validas_a[pos_a]:
+            continue
+
+        # Claves candidatas en B: una salida de A busca una entrada en B y viceversa
+        busquedas = []
+        if cargos_a[pos_a] > 0:
+            busquedas.append((cargos_a[pos_a], 'entrada', 'a_b'))
+        if abonos_a[pos_a] > 0:
+            busquedas.append((abonos_a[pos_a], 'salida', 'b_a'))
+
+        mejor = None
+        for desfases in distancias:
+            for desfase in desfases:
+                dia = dias_a[pos_a] + desfase
+                for prioridad, (centimos, sentido_b, sentido) in enumerate(busquedas):
+                    pos_b = _primer_libre(indice_b.get((dia, centimos, sentido_b), ()), usadas_b)
+                    if pos_b is not None:
+                        candidato = (pos_b, prioridad, sentido, centimos)
+                        if mejor is None or candidato < mejor:
+                            mejor = candidato
+            # Las fechas más cercanas tienen preferencia sobre las lejanas
+            if mejor is not None:
+                break
+
+        if mejor is not None:
+            pos_b, _, sentido, centimos = mejor
+            usadas_b.add(pos_b)
+            pares.append((pos_a, pos_b, sentido, centimos))
+
+    enlazadas = pd.DataFrame(
+        [
+            {
+                'INDICE_A': transfers_a.index[pos_a],
+                'INDICE_B': transfers_b.index[pos_b],
+                'FECHA_A': fechas_a.iloc[pos_a],
+                'FECHA_B': transfers_b['Fecha_Completa'].iloc[pos_b],
+                'MONTO': centimos / 100,
+                'SENTIDO': (
+                    f"{transfers_a['CUENTA_ORIGEN'].iloc[pos_a]} -> {transfers_b['CUENTA_ORIGEN'].iloc[pos_b]}"
+                    if sentido == 'a_b' else
+                    f"{transfers_b['CUENTA_ORIGEN'].iloc[pos_b]} -> {transfers_a['CUENTA_ORIGEN'].iloc[pos_a]}"
+                ),
+            }
+            for pos_a, pos_b, sentido, centimos in pares
+        ],
+        columns=COLUMNAS_ENLAZADAS,
+    )
+    huerfanas_a = transfers_a.drop(enlazadas['INDICE_A'])
+    huerfanas_b = transfers_b.drop(enlazadas['INDICE_B'])
+    return enlazadas, huerfanas_a, huerfanas_b
+
+
+def conciliar_cuentas(transferencias_por_cuenta, tolerancia_dias=0):
+    """
+    Concilia las transferencias de cualquier número de cuentas propias,
+    aplicando `conciliar_transferencias` a cada par de cuentas en el orden del
+    diccionario {cuenta: transferencias}. Lo que queda sin pareja en un par
+    pasa al siguiente, así que cada fila se enlaza como mucho una vez.
+
+    Devuelve `(enlazadas, huerfanas)`: todos los pares enlazados y un
+    diccionario {cuenta: filas sin pareja}.
+    """
+    huerfanas = dict(transferencias_por_cuenta)
+    enlazadas = []
+    for cuenta_a, cuenta_b in combinations(huerfanas, 2):
+        pares, huerfanas[cuenta_a], huerfanas[cuenta_b] = conciliar_transferencias(
+            huerfanas[cuenta_a], huerfanas[cuenta_b], tolerancia_dias=tolerancia_dias
+        )
+        enlazadas.append(pares)
+    if not enlazadas:
+        return pd.DataFrame(columns=COLUMNAS_ENLAZADAS), huerfanas
+    return pd.concat(enlazadas, ignore_index=True), huerfanas
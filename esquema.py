@@ -0,0 +1,53 @@
+# numpy y pandas se importan dentro de las funciones: el almacén usa las
+# constantes de este módulo también en los procesos que solo sirven datos.
+
+# Columnas de montos. En memoria y en el almacén son céntimos enteros (int64),
+# así que se suman y comparan sin errores de coma flotante; en los CSV, la API
+# y los mensajes por pantalla se expresan en soles.
+COLUMNAS_MONTO = ['CARGOS / DEBE', 'ABONOS / HABER']
+
+# Céntimos por unidad en que pueden venir los montos
+_CENTIMOS_POR_UNIDAD = {'soles': 100, 'centimos': 1}
+
+def a_centimos(serie, unidad):
+    """
+    Devuelve los montos en céntimos (int64). `unidad` indica en qué vienen:
+    'soles' (texto de un PDF o columna de un CSV) o 'centimos' (DataFrames en
+    memoria del pipeline). Los valores vacíos o no numéricos cuentan como 0.
+    Unos céntimos con fracciones no son céntimos: se rechazan con ValueError
+    en lugar de redondearlos, porque suelen ser montos en soles por error.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if unidad not in _CENTIMOS_POR_UNIDAD:
+        raise ValueError(f"Unidad de monto desconocida: '{unidad}'. Usa 'soles' o 'centimos'.")
+    if unidad == 'centimos' and pd.api.types.is_integer_dtype(serie.dtype):
+        return serie.astype('int64')
+    valores = pd.to_numeric(serie, errors='coerce').to_numpy(dtype='float64', na_value=0.0)
+    centimos = np.rint(valores * _CENTIMOS_POR_UNIDAD[unidad])
+    if unidad == 'centimos' and not np.array_equal(centimos, valores):
+        raise ValueError(f"La columna '{serie.name}' tiene fracciones de céntimo: los montos en memoria van en céntimos.")
+    return pd.Series(centimos.astype('int64'), index=serie.index, name=serie.name)
+
+def a_soles(centimos):
+    """Convierte céntimos (escalar, array o serie) a soles."""
+    return centimos / 100
+
+def en_soles(df):
+    """Copia del DataFrame con los montos en soles, para exportarlo a CSV."""
+    df = df.copy()
+    for columna in COLUMNAS_MONTO:
+        if columna in df.columns:
+            df[columna] = a_soles(a_centimos(df[columna], 'centimos'))
+    return df
+
+def leer_csv_en_centimos(ruta):
+    """Lee un CSV de transacciones (montos en soles) con los montos en céntimos."""
+    import pandas as pd
+
+    df = pd.read_csv(ruta, sep=';', dtype={columna: 'float64' for columna in COLUMNAS_MONTO})
+    for columna in COLUMNAS_MONTO:
+        if columna in df.columns:
+            df[columna] = a_centimos(df[columna], 'soles')
+    return df
@@ -1,115 +1,358 @@
 import pdfplumber
+import pdfplumber.utils
+import numpy as np
 import pandas as pd
 import os
 import re
 import locale
+from concurrent.futures import ProcessPoolExecutor
 
-def extraer_transacciones(pdf_path, csv_path):
+from esquema import COLUMNAS_MONTO, a_centimos, a_soles, en_soles, leer_csv_en_centimos
+from fechas import parsear_fechas, inferir_periodo, inferir_anio
+import metricas
+
+# Versión de la lógica de extracción. Increméntala siempre que cambie
+# `extraer_transacciones` para que la caché descarte los resultados anteriores.
+VERSION_EXTRACTOR = "4"
+
+# Columnas de cada transacción extraída, en el orden en que se exportan
+COLUMNAS_TRANSACCION = ['FECHA', 'DESCRIPCION', 'CARGOS / DEBE', 'ABONOS / HABER', 'Fecha_Completa']
+
+# Patrón de inicio de una línea de transacción (día + mes abreviado, p. ej. "04SET")
+PATRON_FECHA = re.compile(r'^\d{2}\w{3}')
+
+# Margen (en puntos) por encima y por debajo de la región de la tabla
+MARGEN_RECORTE = 2
+
+# Páginas cuyas filas se reconstruyen juntas en una misma pasada vectorizada
+PAGINAS_POR_LOTE = 32
+
+# Mínimo de páginas que debe recibir cada proceso al repartir un mismo PDF
+PAGINAS_MINIMAS_POR_WORKER = 8
+
+def _aprender_maquetacion(words, column_positions):
+    """
+    Actualiza `column_positions` con la posición horizontal de las columnas de la
+    cabecera presentes en `words`. Devuelve True si la cabecera está completa.
+    """
+    header_found = False
+    for word in words:
+        text = word['text'].upper()
+        if 'DESCRIPCION' in text:
+            column_positions['descripcion'] = word['x0']
+        elif 'CARGOS' in text:
+            column_positions['cargos'] = word['x0']
+        elif 'ABONOS' in text:
+            column_positions['abonos'] = word['x0']
+            header_found = True
+    return header_found
+
+def _frame_vacio():
+    return pd.DataFrame({
+        'FECHA': pd.Series(dtype=object),
+        'DESCRIPCION': pd.Series(dtype=object),
+        'CARGOS / DEBE': pd.Series(dtype='int64'),
+        'ABONOS / HABER': pd.Series(dtype='int64'),
+        'Fecha_Completa': pd.Series(dtype='datetime64[ns]'),
+    })
+
+def _unir_por_linea(lineas, textos, separador, lineas_destino):
+    """
+    Une los textos de cada línea (vienen ya ordenados por línea) y los alinea con
+    `lineas_destino`, también ordenado; las líneas sin textos quedan como ''.
+    """
+    unidos = np.full(len(lineas_destino), '', dtype=object)
+    if len(lineas):
+        cortes = np.flatnonzero(lineas[1:] != lineas[:-1]) + 1
+        posiciones = np.searchsorted(lineas_destino, lineas[np.r_[0, cortes]])
+        unidos[posiciones] = [separador.join(grupo) for grupo in np.split(textos, cortes)]
+    return unidos
+
+def _transacciones_de_lote(paginas):
+    """
+    Reconstruye las filas de un lote de páginas en una sola pasada vectorizada
+    y devuelve sus transacciones como DataFrame. `paginas` es una lista de
+    tuplas `(words, column_positions)` con las palabras de cada página y la
+    maquetación vigente en ella.
+
+    1. Agrupa las palabras por página y línea (posición vertical redondeada)
+       y las ordena de izquierda a derecha.
+    2. Marca como transacción cada línea cuya primera palabra empieza con una
+       fecha (p. ej. "04SET").
+    3. Asigna cada palabra posterior a las dos fechas a descripción, cargo o
+       abono según su posición horizontal y une los textos por línea.
+    4. Convierte todos los montos del lote con una sola llamada.
+
+    Los montos se devuelven en céntimos; los que no se pueden interpretar
+    valen 0.
+    """
+    paginas = [(words, posiciones) for words, posiciones in paginas if words]
+    if not paginas:
+        return _frame_vacio()
+
+    palabras_por_pagina = [len(words) for words, _ in paginas]
+    textos = np.array([w['text'] for words, _ in paginas for w in words], dtype=object)
+    x0 = np.array([w['x0'] for words, _ in paginas for w in words], dtype='float64')
+    lineas = np.rint(np.array([w['top'] for words, _ in paginas for w in words], dtype='float64')).astype('int64')
+    pagina = np.repeat(np.arange(len(paginas)), palabras_por_pagina)
+    limite_cargos = np.repeat([p.get('cargos', 999) for _, p in paginas], palabras_por_pagina)
+    limite_abonos = np.repeat([p.get('abonos', 999) for _, p in paginas], palabras_por_pagina)
+
+    # --- 1. Ordenar por página y línea y, dentro de cada línea, de izquierda a derecha ---
+    orden = np.lexsort((x0, lineas, pagina))
+    textos, x0, lineas, pagina = textos[orden], x0[orden], lineas[orden], pagina[orden]
+    limite_cargos, limite_abonos = limite_cargos[orden], limite_abonos[orden]
+    es_inicio = np.r_[True, (lineas[1:] != lineas[:-1]) | (pagina[1:] != pagina[:-1])]
+    inicio_linea = np.flatnonzero(es_inicio)
+    id_linea = np.cumsum(es_inicio) - 1
+    posicion_en_linea = np.arange(len(textos)) - inicio_linea[id_linea]
+
+    # --- 2. Líneas que parecen transacciones ---
+    primeras = pd.Series(textos[inicio_linea], dtype=object)
+    es_transaccion = primeras.str.match(PATRON_FECHA.pattern).to_numpy(dtype=bool)
+    lineas_transaccion = np.flatnonzero(es_transaccion)
+    if len(lineas_transaccion) == 0:
+        return _frame_vacio()
+
+    # --- 3. Asignar palabras a columnas (empezamos después de las dos fechas) ---
+    en_transaccion = es_transaccion[id_linea] & (posicion_en_linea >= 2)
+    columna = np.where(x0 < limite_cargos, 0, np.where(x0 < limite_abonos, 1, 2))
+    textos_tx, lineas_tx, columnas_tx = textos[en_transaccion], id_linea[en_transaccion], columna[en_transaccion]
+
+    descripcion = _unir_por_linea(lineas_tx[columnas_tx == 0], textos_tx[columnas_tx == 0], ' ', lineas_transaccion)
+    cargo_str = _unir_por_linea(lineas_tx[columnas_tx == 1], textos_tx[columnas_tx == 1], '', lineas_transaccion)
+    abono_str = _unir_por_linea(lineas_tx[columnas_tx == 2], textos_tx[columnas_tx == 2], '', lineas_transaccion)
+
+    # --- 4. Convertir todos los montos del lote de una vez, a céntimos (los ilegibles valen 0) ---
+    montos = a_centimos(
+        pd.Series(np.concatenate([cargo_str, abono_str]), dtype=object).str.replace(',', '', regex=False), 'soles'
+    ).to_numpy()
+    cargo, abono = montos[:len(lineas_transaccion)], montos[len(lineas_transaccion):]
+
+    df = pd.DataFrame({
+        'FECHA': textos[inicio_linea[lineas_transaccion]],
+        'DESCRIPCION': pd.Series(descripcion, dtype=object).str.strip().to_numpy(dtype=object),
+        'CARGOS / DEBE': cargo,
+        'ABONOS / HABER': abono,
+    })
+    return df[(cargo > 0) | (abono > 0)].reset_index(drop=True)
+
+def _periodo_por_defecto(pdf_path):
+    """
+    Periodo a usar si el PDF no indica el suyo: el año que aparezca en el nombre
+    del archivo o, si tampoco, el año en curso (sin ajuste de cambio de año).
+    """
+    anio = inferir_anio(os.path.basename(pdf_path))
+    if anio is None:
+        print("   -> ⚠️ No se encontró el periodo del estado de cuenta. Se usará el año en curso.")
+    return anio, None
+
+def _con_fecha(df, periodo):
+    """Añade la fecha completa de cada transacción según el periodo `(anio, mes_final)` del estado."""
+    df['Fecha_Completa'] = parsear_fechas(df['FECHA'], *periodo)
+    return df
+
+def _extraer_palabras(chars):
+    """Agrupa caracteres en palabras con los mismos parámetros en todo el extractor."""
+    return pdfplumber.utils.extract_words(chars, x_tolerance=3, y_tolerance=3, keep_blank_chars=False)
+
+def _region_tabla(chars, column_positions):
+    """
+    Con la maquetación ya aprendida, localiza la región de la tabla mirando solo
+    los caracteres de la franja de las columnas de fecha (a la izquierda de la
+    descripción). Devuelve los límites verticales `(superior, inferior)` de la
+    tabla (desde la cabecera o la primera fila hasta la última fila), o None si
+    la página no tiene transacciones.
+    """
+    limite_fechas = column_positions.get('descripcion')
+    if not limite_fechas:
+        return (float('-inf'), float('inf'))
+
+    palabras = _extraer_palabras([c for c in chars if c['x1'] <= limite_fechas])
+    filas = [w for w in palabras if PATRON_FECHA.match(w['text'])]
+    if not filas:
+        return None
+
+    # Se incluye la cabecera de la página (columna "FECHA") si la hay, para
+    # poder reaprender la posición de las columnas como antes
+    cabeceras = [w['top'] for w in palabras if 'FECHA' in w['text'].upper()]
+    superior = min([w['top'] for w in filas] + cabeceras) - MARGEN_RECORTE
+    inferior = max(w['bottom'] for w in filas) + MARGEN_RECORTE
+    return (superior, inferior)
+
+def _palabras_de_pagina(page, column_positions):
     """
-    Función definitiva que extrae transacciones de un PDF "aprendiendo" la posición
-    visual de las columnas, en lugar de adivinar la estructura del texto.
+    Devuelve las palabras de la página que hay que analizar (lista vacía si se
+    descarta). Mientras no se conozca la cabecera se lee la página completa;
+    después solo se agrupan en palabras los caracteres de la región de la tabla,
+    y las páginas sin filas (portadas, resúmenes) se descartan sin extraer su texto.
+    """
+    metricas.incrementar('paginas_procesadas_total')
+    with metricas.medir('pagina', pagina=page.page_number):
+        chars = page.chars
+        if column_positions:
+            region = _region_tabla(chars, column_positions)
+            if region is None:
+                print(f"   -> ⏭️ Página {page.page_number} sin filas de transacciones. Saltando.")
+                metricas.incrementar('paginas_saltadas_total', motivo='sin_filas')
+                return []
+            superior, inferior = region
+            chars = [c for c in chars if c['top'] >= superior and c['bottom'] <= inferior]
+
+        # --- 1. APRENDER LA MAQUETACIÓN DE LA PÁGINA ---
+        words = _extraer_palabras(chars)
+        header_found = _aprender_maquetacion(words, column_positions)
+
+        # Si no se encuentra la cabecera en una página, asumimos que es una continuación
+        if not header_found and not column_positions:
+            print(f"   -> ⚠️ No se encontró la cabecera en la página {page.page_number}. Saltando.")
+            metricas.incrementar('paginas_saltadas_total', motivo='sin_cabecera')
+            return []
+        return words
+
+def _extraer_paginas(pdf_path, indices_pagina, column_positions):
+    """
+    Procesa un subconjunto de páginas de un PDF partiendo de una maquetación ya
+    aprendida y devuelve sus transacciones en un DataFrame. Se define a nivel
+    de módulo para poder ejecutarse en otro proceso (con `ejecutar_con_metricas`,
+    para devolver también las métricas del proceso hijo).
+    """
+    column_positions = dict(column_positions)
+    paginas = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for indice in indices_pagina:
+            page = pdf.pages[indice]
+            paginas.append((_palabras_de_pagina(page, column_positions), dict(column_positions)))
+            page.close()
+    return _transacciones_de_lote(paginas)
+
+def iterar_lotes(pdf_path, max_workers=1):
+    """
+    Generador que recorre un PDF "aprendiendo" la posición visual de las columnas,
+    en lugar de adivinar la estructura del texto, y produce DataFrames con las
+    transacciones de cada lote de hasta `PAGINAS_POR_LOTE` páginas consecutivas.
+    Las filas de todo el lote se reconstruyen en una sola pasada vectorizada.
+    Los errores al abrir o leer el PDF se propagan al llamador.
+
+    Con `max_workers > 1`, una vez aprendida la maquetación en la primera página
+    con cabecera, el resto de páginas de un PDF largo se reparte en bloques
+    consecutivos entre varios procesos; los lotes se siguen produciendo en orden.
+
+    Cada transacción lleva su 'Fecha_Completa', con el año deducido del periodo
+    que el estado de cuenta indica en sus primeras páginas ("DEL ... AL ...").
+    """
+    periodo = None
+    with pdfplumber.open(pdf_path) as pdf:
+        column_positions = {}
+        total_paginas = len(pdf.pages)
+        lote = []
+        
+        for indice, page in enumerate(pdf.pages):
+            # El periodo se busca en las páginas previas a la tabla y en la de la cabecera
+            if periodo is None and not column_positions:
+                periodo = inferir_periodo(page.extract_text())
+
+            # --- 2. RECONSTRUIR FILAS Y ASIGNAR PALABRAS A COLUMNAS (por lotes) ---
+            lote.append((_palabras_de_pagina(page, column_positions), dict(column_positions)))
+            page.close()
+            if len(lote) == PAGINAS_POR_LOTE:
+                periodo = periodo or _periodo_por_defecto(pdf_path)
+                yield _con_fecha(_transacciones_de_lote(lote), periodo)
+                lote = []
+
+            restantes = list(range(indice + 1, total_paginas))
+            n_workers = min(max_workers, len(restantes) // PAGINAS_MINIMAS_POR_WORKER)
+            if column_positions and n_workers > 1:
+                break
+        else:
+            if lote:
+                periodo = periodo or _periodo_por_defecto(pdf_path)
+                yield _con_fecha(_transacciones_de_lote(lote), periodo)
+            return
+
+    periodo = periodo or _periodo_por_defecto(pdf_path)
+    if lote:
+        yield _con_fecha(_transacciones_de_lote(lote), periodo)
+
+    # --- 3. REPARTIR EL RESTO DE PÁGINAS ENTRE VARIOS PROCESOS ---
+    tamano_bloque = -(-len(restantes) // n_workers)
+    bloques = [restantes[i:i + tamano_bloque] for i in range(0, len(restantes), tamano_bloque)]
+    print(f"   -> ⚙️ Repartiendo {len(restantes)} páginas entre {len(bloques)} procesos...")
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=metricas.iniciar_proceso_hijo) as pool:
+        futuros = [
+            pool.submit(metricas.ejecutar_con_metricas, _extraer_paginas, pdf_path, bloque, column_positions)
+            for bloque in bloques
+        ]
+        for futuro in futuros:
+            df_bloque, metricas_bloque = futuro.result()
+            metricas.registro.fusionar(metricas_bloque)
+            yield _con_fecha(df_bloque, periodo)
+
+def iterar_transacciones(pdf_path, max_workers=1):
+    """
+    Igual que `iterar_lotes`, pero produce cada transacción como un diccionario.
+    """
+    for df_lote in iterar_lotes(pdf_path, max_workers=max_workers):
+        yield from df_lote.to_dict(orient='records')
+
+def extraer_transacciones(pdf_path, csv_path=None, max_workers=1):
+    """
+    Extrae las transacciones de un PDF con el motor de análisis visual y las
+    devuelve en memoria como DataFrame (vacío si el PDF no tiene transacciones),
+    con los montos en céntimos. Devuelve None si el PDF no se pudo leer.
+    `csv_path` es opcional y solo sirve para guardar además una copia en disco.
+    `max_workers` permite repartir las páginas de un PDF largo entre varios
+    procesos.
     """
     print(f"📄 Procesando: '{os.path.basename(pdf_path)}' con el motor de análisis visual...")
-    all_transactions = []
     
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            column_positions = {}
-            
-            for page in pdf.pages:
-                # --- 1. APRENDER LA MAQUETACIÓN DE LA PÁGINA ---
-                words = page.extract_words(x_tolerance=3, y_tolerance=3, keep_blank_chars=False)
-                
-                header_found = False
-                for word in words:
-                    text = word['text'].upper()
-                    if 'DESCRIPCION' in text:
-                        column_positions['descripcion'] = word['x0']
-                    elif 'CARGOS' in text:
-                        column_positions['cargos'] = word['x0']
-                    elif 'ABONOS' in text:
-                        column_positions['abonos'] = word['x0']
-                        header_found = True
-                
-                # Si no se encuentra la cabecera en una página, asumimos que es una continuación
-                if not header_found and not column_positions:
-                    print(f"   -> ⚠️ No se encontró la cabecera en la página {page.page_number}. Saltando.")
-                    continue
-
-                # --- 2. RECONSTRUIR FILAS Y ASIGNAR PALABRAS A COLUMNAS ---
-                lines = {}
-                for word in words:
-                    # Agrupar palabras por su posición vertical (línea)
-                    line_top = round(word['top'])
-                    if line_top not in lines:
-                        lines[line_top] = []
-                    lines[line_top].append(word)
-
-                for top_pos in sorted(lines.keys()):
-                    line_words = sorted(lines[top_pos], key=lambda w: w['x0'])
-                    line_text = " ".join([w['text'] for w in line_words])
-                    
-                    # Verificar si la línea parece una transacción
-                    if re.match(r'^\d{2}\w{3}', line_text):
-                        fecha = line_words[0]['text']
-                        descripcion, cargo_str, abono_str = "", "", ""
-                        
-                        for word in line_words[2:]: # Empezamos después de las dos fechas
-                            if word['x0'] < column_positions.get('cargos', 999):
-                                descripcion += f" {word['text']}"
-                            elif word['x0'] < column_positions.get('abonos', 999):
-                                cargo_str += word['text']
-                            else:
-                                abono_str += word['text']
-                        
-                        cargo = pd.to_numeric(cargo_str.replace(',', ''), errors='coerce') or 0.0
-                        abono = pd.to_numeric(abono_str.replace(',', ''), errors='coerce') or 0.0
-
-                        if cargo > 0 or abono > 0:
-                            all_transactions.append({
-                                'FECHA': fecha,
-                                'DESCRIPCION': descripcion.strip(),
-                                'CARGOS / DEBE': cargo,
-                                'ABONOS / HABER': abono
-                            })
-                            
+        with metricas.medir('pdf', archivo=os.path.basename(pdf_path)):
+            lotes = [df for df in iterar_lotes(pdf_path, max_workers=max_workers) if not df.empty]
     except Exception as e:
         print(f"   -> ❌ Error crítico al leer el PDF: {e}")
-        return False
+        return None
 
-    if not all_transactions:
+    if not lotes:
         print("   -> ⚠️ No se encontraron transacciones en este PDF con el motor visual.")
-        return False
+        return _frame_vacio()
 
-    df = pd.DataFrame(all_transactions).fillna(0)
-    df.to_csv(csv_path, index=False, sep=';', decimal='.')
+    df = pd.concat(lotes, ignore_index=True)
+    metricas.incrementar('transacciones_extraidas_total', len(df))
+    if csv_path:
+        en_soles(df).to_csv(csv_path, index=False, sep=';', decimal='.')
     print(f"   -> ✅ ¡Éxito! {len(df)} transacciones extraídas correctamente.")
-    return True
+    return df
 
-def analizar_reporte_consolidado(csv_path):
+def analizar_reporte_consolidado(datos):
     """
-    Lee el CSV consolidado y muestra el resumen. No necesita cambios.
+    Muestra el resumen del reporte consolidado. `datos` puede ser el DataFrame
+    ya cargado en memoria (montos en céntimos) o la ruta de un CSV consolidado.
     """
     print("\n" + "="*50)
     print("📊   ANÁLISIS CONSOLIDADO DEL REPORTE ANUAL   📊")
     print("="*50)
 
-    try:
-        df = pd.read_csv(csv_path, sep=';')
-    except pd.errors.EmptyDataError:
-        print("El archivo consolidado está vacío.")
-        return
+    if isinstance(datos, pd.DataFrame):
+        df = datos.copy()
+        for columna in COLUMNAS_MONTO:
+            df[columna] = a_centimos(df[columna], 'centimos')
+    else:
+        try:
+            df = leer_csv_en_centimos(datos)
+        except pd.errors.EmptyDataError:
+            print("El archivo consolidado está vacío.")
+            return
 
     if df.empty:
         print("No hay transacciones para analizar.")
         return
     
-    meses_es = {
-        'ENE': 'JAN', 'FEB': 'FEB', 'MAR': 'MAR', 'ABR': 'APR', 'MAY': 'MAY', 'JUN': 'JUN',
-        'JUL': 'JUL', 'AGO': 'AUG', 'SEP': 'SEP', 'OCT': 'OCT', 'NOV': 'NOV', 'DIC': 'DEC'
-    }
-    df['Fecha_Traducida'] = df['FECHA'].str.strip().str[:2] + df['FECHA'].str.strip().str[2:5].map(meses_es)
-    df['Fecha_Completa'] = pd.to_datetime(df['Fecha_Traducida'], format='%d%b', errors='coerce').apply(lambda dt: dt.replace(year=2025))
+    # La fecha completa viene ya calculada del extractor; solo se deduce si falta
+    if 'Fecha_Completa' in df.columns:
+        df['Fecha_Completa'] = pd.to_datetime(df['Fecha_Completa'], errors='coerce')
+    else:
+        df['Fecha_Completa'] = parsear_fechas(df['FECHA'])
     df.dropna(subset=['Fecha_Completa'], inplace=True)
     df = df.sort_values(by='Fecha_Completa').reset_index(drop=True)
 
@@ -120,8 +363,8 @@ def analizar_reporte_consolidado(csv_path):
     try: locale.setlocale(locale.LC_TIME, 'es_ES.UTF-8')
     except: locale.setlocale(locale.LC_TIME, '')
     
-    total_entradas = df['ABONOS / HABER'].sum()
-    total_salidas = df['CARGOS / DEBE'].sum()
+    total_entradas = a_soles(df['ABONOS / HABER'].sum())
+    total_salidas = a_soles(df['CARGOS / DEBE'].sum())
     total_balance = total_entradas - total_salidas
     
     max_entrada = df.loc[df['ABONOS / HABER'].idxmax()]
@@ -135,9 +378,9 @@ def analizar_reporte_consolidado(csv_path):
     
     print("\n" + "─"*15 + " TRANSACCIONES DESTACADAS " + "─"*14)
     print("\n✅ Mayor Entrada (Abono):")
-    print(f"   - Fecha: {max_entrada['Fecha_Completa'].strftime('%d/%m/%Y')}, Monto: S/ {max_entrada['ABONOS / HABER']:,.2f}")
+    print(f"   - Fecha: {max_entrada['Fecha_Completa'].strftime('%d/%m/%Y')}, Monto: S/ {a_soles(max_entrada['ABONOS / HABER']):,.2f}")
     print(f"   - Desc: {max_entrada['DESCRIPCION']}")
     print("\n❌ Mayor Salida (Cargo):")
-    print(f"   - Fecha: {max_salida['Fecha_Completa'].strftime('%d/%m/%Y')}, Monto: S/ {max_salida['CARGOS / DEBE']:,.2f}")
+    print(f"   - Fecha: {max_salida['Fecha_Completa'].strftime('%d/%m/%Y')}, Monto: S/ {a_soles(max_salida['CARGOS / DEBE']):,.2f}")
     print(f"   - Desc: {max_salida['DESCRIPCION']}")
     print("\n" + "="*50)
\ No newline at end of file
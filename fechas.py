@@ -0,0 +1,74 @@
+import re
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# Abreviaturas de mes que usan los estados de cuenta. El banco escribe
+# Septiembre como 'SET', pero se acepta también 'SEP'.
+MESES = {
+    'ENE': 1, 'FEB': 2, 'MAR': 3, 'ABR': 4, 'MAY': 5, 'JUN': 6,
+    'JUL': 7, 'AGO': 8, 'SET': 9, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DIC': 12
+}
+
+# Tabla de búsqueda de cada código día+mes posible ('04SET' -> (9, 4)).
+# Los días imposibles para el mes (p. ej. '31FEB') se descartan al construir la fecha.
+_CODIGOS = {f"{dia:02d}{abreviatura}": (mes, dia) for abreviatura, mes in MESES.items() for dia in range(1, 32)}
+_MES_POR_CODIGO = {codigo: mes for codigo, (mes, _) in _CODIGOS.items()}
+_DIA_POR_CODIGO = {codigo: dia for codigo, (_, dia) in _CODIGOS.items()}
+
+# Periodo del estado de cuenta, p. ej. "DEL 01/07/2025 AL 31/07/2025"
+PATRON_PERIODO = re.compile(
+    r'DEL\s+(\d{1,2})/(\d{1,2})/(\d{2}|\d{4})\s+AL\s+(\d{1,2})/(\d{1,2})/(\d{2}|\d{4})\b', re.IGNORECASE
+)
+# Un año suelto (p. ej. en el nombre del archivo "EECC_2025_07.pdf")
+PATRON_ANIO = re.compile(r'(?<!\d)(20\d{2})(?!\d)')
+
+def _anio_completo(texto):
+    anio = int(texto)
+    return anio + 2000 if anio < 100 else anio
+
+def inferir_periodo(texto):
+    """
+    Busca en el texto de un estado de cuenta su periodo y devuelve
+    `(anio, mes_final)` de la fecha en que termina, o None si no aparece.
+    """
+    coincidencia = PATRON_PERIODO.search(texto or '')
+    if coincidencia is None:
+        return None
+    mes_final, anio_final = int(coincidencia.group(5)), _anio_completo(coincidencia.group(6))
+    if not 1 <= mes_final <= 12:
+        return None
+    return anio_final, mes_final
+
+def inferir_anio(texto):
+    """Devuelve el primer año (20xx) que aparezca en el texto, o None."""
+    coincidencia = PATRON_ANIO.search(texto or '')
+    return int(coincidencia.group(1)) if coincidencia else None
+
+def parsear_fechas(codigos, anio=None, mes_final=None):
+    """
+    Convierte de forma vectorizada los códigos día+mes del banco ('04SET') en
+    fechas (datetime64). Los códigos que no se reconocen quedan como NaT.
+
+    `anio` es el año del estado de cuenta (un entero o un valor por fila); si
+    falta se usa el año en curso. Si se conoce el mes en que termina el periodo
+    (`mes_final`), los meses posteriores a él pertenecen al año anterior: así un
+    estado del 15/12/2024 al 14/01/2025 fecha '20DIC' en 2024 y '05ENE' en 2025.
+    """
+    codigos = pd.Series(codigos, dtype=object)
+    indice = codigos.index
+    codigos = codigos.str.strip()
+    meses = codigos.map(_MES_POR_CODIGO).to_numpy(dtype='float64')
+    dias = codigos.map(_DIA_POR_CODIGO).to_numpy(dtype='float64')
+
+    if anio is None:
+        anio = date.today().year
+    anios = np.broadcast_to(np.asarray(anio, dtype='float64'), meses.shape)
+    if mes_final is not None:
+        finales = np.broadcast_to(np.asarray(mes_final, dtype='float64'), meses.shape)
+        anios = np.where(meses > finales, anios - 1, anios)
+
+    return pd.to_datetime(
+        pd.DataFrame({'year': anios, 'month': meses, 'day': dias}, index=indice), errors='coerce'
+    ).astype('datetime64[ns]')
@@ -0,0 +1,175 @@
+import calendar
+import os
+
+import numpy as np
+import pandas as pd
+
+from esquema import a_soles, en_soles
+
+# Abreviaturas de mes tal como las escribe el banco (Septiembre es 'SET')
+MESES_BANCO = ['ENE', 'FEB', 'MAR', 'ABR', 'MAY', 'JUN', 'JUL', 'AGO', 'SET', 'OCT', 'NOV', 'DIC']
+
+# Descripciones de movimientos externos (compras, pagos, depósitos...)
+DESCRIPCIONES = [
+    'Pago YAPE de 19170', 'WOW0020240762146', 'ABON PLIN-LIDIA EB *', 'PLAZA VEA SURCO',
+    'UBER TRIP', 'NETFLIX.COM', 'IMPUESTO ITF *', 'DEPOSITO EFECTIVO', 'TRAN.CEL.BM.',
+    'TOTTUS ATOCONGO', 'RAPPI PERU', 'SPOTIFY P0A1B2C3', 'INTERES GANADO', 'COMISION MANTENIMIENTO',
+]
+
+# Descripción con la que el banco registra las transferencias entre cuentas propias
+DESCRIPCION_TRANSFERENCIA = 'TRAN.CTAS.PROP.BM'
+
+# Maquetación de las páginas generadas (mismas columnas que los estados del BCP)
+FILAS_POR_PAGINA = 45
+COLUMNAS_X = {'fecha': 40, 'fecha_valor': 90, 'descripcion': 140, 'cargos': 400, 'abonos': 500}
+
+def generar_transacciones(n, anio=2025, proporcion_transferencias=0.2, proporcion_huerfanas=0.05,
+                          cuentas=('Yape', 'Ahorro'), semilla=0):
+    """
+    Genera `n` transacciones sintéticas repartidas entre las `cuentas` y devuelve
+    un diccionario {cuenta: DataFrame} con el mismo formato que el extractor
+    (FECHA, DESCRIPCION, CARGOS / DEBE, ABONOS / HABER en céntimos y
+    Fecha_Completa), ordenado por fecha.
+
+    Aproximadamente `proporcion_transferencias` de las filas son transferencias
+    entre dos cuentas: una salida en una y su entrada en otra, el mismo
+    día o, a veces, al día siguiente. Una fracción `proporcion_huerfanas` de
+    ellas no tiene pareja (su entrada lleva otro monto).
+    """
+    rng = np.random.default_rng(semilla)
+    # Con una sola cuenta se sortea igual entre dos y se descarta la segunda,
+    # para que una misma semilla genere los mismos datos
+    n_cuentas = max(len(cuentas), 2)
+    dias_anio = 366 if calendar.isleap(anio) else 365
+    inicio = np.datetime64(f'{anio}-01-01')
+
+    n_pares = int(n * proporcion_transferencias) // 2
+    n_externas = n - 2 * n_pares
+
+    # --- Movimientos externos ---
+    externas = pd.DataFrame({
+        'cuenta': rng.integers(0, n_cuentas, n_externas),
+        'Fecha_Completa': inicio + rng.integers(0, dias_anio, n_externas).astype('timedelta64[D]'),
+        'DESCRIPCION': np.asarray(DESCRIPCIONES, dtype=object)[rng.integers(0, len(DESCRIPCIONES), n_externas)],
+        'centimos': rng.integers(100, 300000, n_externas),
+        'es_cargo': rng.random(n_externas) < 0.6,
+    })
+
+    # --- Transferencias entre cuentas propias: salida y entrada ---
+    origen = rng.integers(0, n_cuentas, n_pares)
+    fecha_salida = inicio + rng.integers(0, dias_anio - 1, n_pares).astype('timedelta64[D]')
+    retraso = (rng.random(n_pares) < 0.1).astype('timedelta64[D]')
+    centimos = rng.integers(1000, 500000, n_pares)
+    huerfana = rng.random(n_pares) < proporcion_huerfanas
+    destino = (origen + rng.integers(1, n_cuentas, n_pares)) % n_cuentas
+    salidas = pd.DataFrame({'cuenta': origen, 'Fecha_Completa': fecha_salida,
+                            'centimos': centimos, 'es_cargo': True})
+    entradas = pd.DataFrame({'cuenta': destino, 'Fecha_Completa': fecha_salida + retraso,
+                             'centimos': np.where(huerfana, centimos + 1, centimos), 'es_cargo': False})
+    transferencias = pd.concat([salidas, entradas], ignore_index=True)
+    transferencias['DESCRIPCION'] = DESCRIPCION_TRANSFERENCIA
+
+    df = pd.concat([externas, transferencias], ignore_index=True)
+    df['Fecha_Completa'] = df['Fecha_Completa'].astype('datetime64[ns]')
+    df['CARGOS / DEBE'] = np.where(df['es_cargo'], df['centimos'], 0).astype('int64')
+    df['ABONOS / HABER'] = np.where(df['es_cargo'], 0, df['centimos']).astype('int64')
+    # Código día+mes del banco ('04SET'), calculado una vez por fecha distinta
+    codigos = {f: f"{f.day:02d}{MESES_BANCO[f.month - 1]}" for f in df['Fecha_Completa'].unique()}
+    df['FECHA'] = df['Fecha_Completa'].map(codigos)
+
+    columnas = ['FECHA', 'DESCRIPCION', 'CARGOS / DEBE', 'ABONOS / HABER', 'Fecha_Completa']
+    return {
+        nombre: df[df['cuenta'] == i].sort_values('Fecha_Completa', kind='stable')[columnas].reset_index(drop=True)
+        for i, nombre in enumerate(cuentas)
+    }
+
+def escribir_pdf(ruta, paginas, ancho=612, alto=792):
+    """
+    Escribe un PDF mínimo (Helvetica 8 pt) sin dependencias externas. `paginas`
+    es una lista de páginas y cada página una lista de `(x, top, texto)`, con
+    `top` medido desde el borde superior como en pdfplumber.
+    """
+    objetos = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    hijas = []
+    for lineas in paginas:
+        partes = []
+        for x, top, texto in lineas:
+            texto = texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            partes.append(f"BT /F1 8 Tf {x:.2f} {alto - top - 8:.2f} Td ({texto}) Tj ET")
+        contenido = "\n".join(partes).encode("latin-1")
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(contenido) + contenido + b"\nendstream")
+        objetos.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {ancho} {alto}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objetos)} 0 R >>".encode()
+        )
+        hijas.append(len(objetos))
+    objetos[1] = f"<< /Type /Pages /Kids [{' '.join(f'{h} 0 R' for h in hijas)}] /Count {len(hijas)} >>".encode()
+
+    salida = bytearray(b"%PDF-1.4\n")
+    posiciones = []
+    for numero, objeto in enumerate(objetos, 1):
+        posiciones.append(len(salida))
+        salida += b"%d 0 obj\n" % numero + objeto + b"\nendobj\n"
+    inicio_xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    for posicion in posiciones:
+        salida += b"%010d 00000 n \n" % posicion
+    salida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref)
+    with open(ruta, "wb") as archivo:
+        archivo.write(salida)
+
+def escribir_estado_pdf(ruta, df, desde, hasta):
+    """
+    Escribe un estado de cuenta en PDF con las transacciones de `df`: una
+    portada con el periodo (`desde`/`hasta`, fechas), páginas de
+    `FILAS_POR_PAGINA` filas con la cabecera de columnas y una página final de
+    resumen, como los estados reales.
+    """
+    paginas = [[(40, 40, f"ESTADO DE CUENTA DEL {desde:%d/%m/%Y} AL {hasta:%d/%m/%Y}"),
+                (40, 60, "Cliente: CLIENTE DE PRUEBA")]]
+    x = COLUMNAS_X
+    filas = zip(df['FECHA'], df['DESCRIPCION'], df['CARGOS / DEBE'], df['ABONOS / HABER'])
+    for i, (fecha, descripcion, cargo, abono) in enumerate(filas):
+        if i % FILAS_POR_PAGINA == 0:
+            pagina = [(40, 40, "BANCO DE CREDITO BCP"), (x['fecha'], 80, "FECHA"), (x['fecha_valor'], 80, "FECHA"),
+                      (x['descripcion'], 80, "DESCRIPCION"), (x['cargos'], 80, "CARGOS/DEBE"),
+                      (x['abonos'], 80, "ABONOS/HABER")]
+            paginas.append(pagina)
+        top = 100 + 12 * (i % FILAS_POR_PAGINA)
+        pagina += [(x['fecha'], top, fecha), (x['fecha_valor'], top, fecha), (x['descripcion'], top, descripcion)]
+        if cargo > 0:
+            pagina.append((x['cargos'], top, f"{a_soles(cargo):,.2f}"))
+        else:
+            pagina.append((x['abonos'], top, f"{a_soles(abono):,.2f}"))
+    paginas.append([(40, 40, "RESUMEN"), (40, 60, f"Total cargos {a_soles(df['CARGOS / DEBE'].sum()):,.2f}")])
+    escribir_pdf(ruta, paginas)
+
+def escribir_estados_mensuales(carpeta, df, prefijo):
+    """
+    Escribe en `carpeta` un estado de cuenta en PDF por cada mes con
+    transacciones en `df` ('<prefijo>_<año>_<mes>.pdf') y devuelve sus rutas.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    rutas = []
+    for periodo, df_mes in df.groupby(df['Fecha_Completa'].dt.to_period('M'), sort=True):
+        ruta = os.path.join(carpeta, f"{prefijo}_{periodo.year}_{periodo.month:02d}.pdf")
+        escribir_estado_pdf(ruta, df_mes, periodo.start_time, periodo.end_time)
+        rutas.append(ruta)
+    return rutas
+
+def escribir_csv_consolidado(ruta, df):
+    """Guarda un reporte consolidado con el mismo formato que `procesar_carpeta_de_pdfs`."""
+    en_soles(df).to_csv(ruta, index=False, sep=';', decimal='.')
+
+
+if __name__ == "__main__":
+    # --- CONFIGURACIÓN PRINCIPAL ---
+    CARPETA_SALIDA = "datos_sinteticos"
+    TRANSACCIONES = 5000
+
+    cuentas = generar_transacciones(TRANSACCIONES)
+    for nombre, df in cuentas.items():
+        rutas = escribir_estados_mensuales(os.path.join(CARPETA_SALIDA, nombre.lower()), df, nombre.lower())
+        escribir_csv_consolidado(os.path.join(CARPETA_SALIDA, f"consolidado_{nombre.lower()}.csv"), df)
+        print(f"✅ {nombre}: {len(df)} transacciones en {len(rutas)} estados de cuenta.")
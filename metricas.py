@@ -0,0 +1,203 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Prefijo de todas las métricas exportadas
+PREFIJO = "analisis"
+
+# Límites (en segundos) de los buckets del histograma de duraciones
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Métricas conocidas: nombre -> (tipo Prometheus, descripción)
+DEFINICIONES = {
+    'duracion_segundos': ('histogram', "Duración de cada etapa del pipeline y de la API."),
+    'pdfs_total': ('counter', "PDFs procesados, por resultado (cache, extraido, sin_transacciones, error)."),
+    'paginas_procesadas_total': ('counter', "Páginas de PDF analizadas."),
+    'paginas_saltadas_total': ('counter', "Páginas de PDF descartadas, por motivo."),
+    'transacciones_extraidas_total': ('counter', "Transacciones extraídas de los PDFs."),
+    'cache_extraccion_total': ('counter', "Consultas a la caché de extracción, por resultado (acierto o fallo)."),
+    'transferencias_enlazadas_total': ('counter', "Pares de transferencias entre cuentas propias enlazados."),
+    'transferencias_huerfanas_total': ('counter', "Transferencias entre cuentas propias sin pareja."),
+    'transacciones_publicadas_total': ('counter', "Transacciones escritas en el almacén."),
+    'transacciones_recategorizadas_total': ('counter', "Transacciones reevaluadas al cambiar las reglas de categorías."),
+    'transacciones_reagrupadas_total': ('counter', "Transacciones que cambiaron de familia al cambiar sus reglas."),
+    'observador_disparos_total': ('counter', "Veces que el observador de carpetas lanzó la ingesta."),
+}
+
+logger = logging.getLogger(__name__)
+
+def _claves(etiquetas):
+    return tuple(sorted(etiquetas.items()))
+
+class RegistroMetricas:
+    """
+    Contadores e histogramas de duración en memoria, seguros entre hilos. Los
+    procesos hijos tienen su propio registro: exportan su contenido con
+    `exportar()` y el proceso principal lo suma con `fusionar()`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._histogramas = {}
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = (nombre, _claves(etiquetas))
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, segundos, **etiquetas):
+        clave = (nombre, _claves(etiquetas))
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = {'buckets': [0] * len(BUCKETS_SEGUNDOS), 'suma': 0.0, 'total': 0}
+            posicion = bisect_left(BUCKETS_SEGUNDOS, segundos)
+            if posicion < len(BUCKETS_SEGUNDOS):
+                histograma['buckets'][posicion] += 1
+            histograma['suma'] += segundos
+            histograma['total'] += 1
+
+    def exportar(self):
+        """Copia serializable (picklable) del contenido del registro."""
+        with self._lock:
+            return {
+                'contadores': dict(self._contadores),
+                'histogramas': {clave: {'buckets': list(h['buckets']), 'suma': h['suma'], 'total': h['total']}
+                                for clave, h in self._histogramas.items()},
+            }
+
+    def fusionar(self, exportado):
+        """Suma al registro lo exportado por otro proceso."""
+        if not exportado:
+            return
+        with self._lock:
+            for clave, valor in exportado['contadores'].items():
+                self._contadores[clave] = self._contadores.get(clave, 0) + valor
+            for clave, otro in exportado['histogramas'].items():
+                histograma = self._histogramas.setdefault(
+                    clave, {'buckets': [0] * len(BUCKETS_SEGUNDOS), 'suma': 0.0, 'total': 0}
+                )
+                histograma['buckets'] = [a + b for a, b in zip(histograma['buckets'], otro['buckets'])]
+                histograma['suma'] += otro['suma']
+                histograma['total'] += otro['total']
+
+    def reiniciar(self):
+        with self._lock:
+            self._contadores.clear()
+            self._histogramas.clear()
+
+    def formato_prometheus(self, adicionales=None):
+        """
+        Devuelve el registro en el formato de texto de Prometheus. `adicionales`
+        es un diccionario opcional {nombre: (valor, descripción)} de medidores
+        calculados en el momento (p. ej. el estado de una caché).
+        """
+        exportado = self.exportar()
+        por_nombre = {}
+        for (nombre, etiquetas), valor in exportado['contadores'].items():
+            por_nombre.setdefault(nombre, []).append((etiquetas, valor))
+        for (nombre, etiquetas), histograma in exportado['histogramas'].items():
+            por_nombre.setdefault(nombre, []).append((etiquetas, histograma))
+
+        lineas = []
+        for nombre in sorted(set(DEFINICIONES) | set(por_nombre)):
+            tipo, ayuda = DEFINICIONES.get(nombre, ('counter', nombre))
+            completo = f"{PREFIJO}_{nombre}"
+            lineas += [f"# HELP {completo} {ayuda}", f"# TYPE {completo} {tipo}"]
+            for etiquetas, valor in sorted(por_nombre.get(nombre, []), key=lambda par: par[0]):
+                if tipo == 'histogram':
+                    acumulado = 0
+                    for limite, cantidad in zip(BUCKETS_SEGUNDOS, valor['buckets']):
+                        acumulado += cantidad
+                        lineas.append(f"{completo}_bucket{_etiquetas_txt(etiquetas, le=limite)} {acumulado}")
+                    lineas.append(f"{completo}_bucket{_etiquetas_txt(etiquetas, le='+Inf')} {valor['total']}")
+                    lineas.append(f"{completo}_sum{_etiquetas_txt(etiquetas)} {valor['suma']:.6f}")
+                    lineas.append(f"{completo}_count{_etiquetas_txt(etiquetas)} {valor['total']}")
+                else:
+                    lineas.append(f"{completo}{_etiquetas_txt(etiquetas)} {valor}")
+
+        for nombre, (valor, ayuda) in sorted((adicionales or {}).items()):
+            completo = f"{PREFIJO}_{nombre}"
+            lineas += [f"# HELP {completo} {ayuda}", f"# TYPE {completo} gauge", f"{completo} {valor}"]
+        return "\n".join(lineas) + "\n"
+
+def _etiquetas_txt(etiquetas, **extra):
+    """Formatea las etiquetas como `{clave="valor",...}`, escapando barras y comillas."""
+    pares = list(etiquetas) + list(extra.items())
+    if not pares:
+        return ""
+    escapar = lambda valor: str(valor).replace('\\', '\\\\').replace('"', '\\"')
+    return "{" + ",".join(f'{clave}="{escapar(valor)}"' for clave, valor in pares) + "}"
+
+# Registro del proceso actual, compartido por todo el pipeline
+registro = RegistroMetricas()
+
+def incrementar(nombre, valor=1, **etiquetas):
+    """Suma `valor` al contador `nombre` con las etiquetas dadas."""
+    registro.incrementar(nombre, valor, **etiquetas)
+
+def registrar_evento(evento, nivel=logging.INFO, **campos):
+    """Escribe en el log una línea estructurada: `evento clave=valor ...`."""
+    if logger.isEnabledFor(nivel):
+        detalle = " ".join(f"{clave}={valor}" for clave, valor in campos.items())
+        logger.log(nivel, "%s %s", evento, detalle)
+
+@contextmanager
+def medir(etapa, **campos):
+    """
+    Mide la duración del bloque, la añade al histograma `duracion_segundos`
+    con la etiqueta `etapa` y la registra en el log junto con `campos` (que
+    no se usan como etiquetas para no multiplicar las series).
+    """
+    inicio = time.perf_counter()
+    estado = 'ok'
+    try:
+        yield
+    except Exception:
+        estado = 'error'
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        registro.observar('duracion_segundos', segundos, etapa=etapa)
+        registrar_evento('etapa', nivel=logging.DEBUG if etapa == 'pagina' else logging.INFO,
+                         nombre=etapa, estado=estado, duracion_s=f"{segundos:.4f}", **campos)
+
+def iniciar_proceso_hijo():
+    """
+    Inicializador de los pools de procesos. El hijo creado con fork hereda el
+    registro del padre con su cerrojo tal como estaba: si en ese momento otro
+    hilo (la otra cuenta, una petición de la API) lo tenía tomado, el hijo se
+    bloquearía al usarlo. Por eso empieza con un registro nuevo, sin tocar el
+    heredado.
+    """
+    global registro
+    registro = RegistroMetricas()
+
+def ejecutar_con_metricas(funcion, *args):
+    """
+    Ejecuta `funcion(*args)` en un proceso hijo con un registro vacío y devuelve
+    `(resultado, metricas)` para que el proceso principal las fusione. El
+    registro se sustituye por uno nuevo en cada tarea (nunca se vacía el
+    heredado, por lo explicado en `iniciar_proceso_hijo`).
+    """
+    iniciar_proceso_hijo()
+    resultado = funcion(*args)
+    return resultado, registro.exportar()
+
+def configurar_log(ruta_archivo, nivel=logging.INFO):
+    """
+    Envía los logs de la aplicación a `ruta_archivo`, con fecha, nivel y módulo.
+    No añade un segundo manejador si ese archivo ya está configurado.
+    """
+    raiz = logging.getLogger()
+    ruta_absoluta = os.path.abspath(ruta_archivo)
+    if any(isinstance(h, logging.FileHandler) and h.baseFilename == ruta_absoluta for h in raiz.handlers):
+        return
+    destino = logging.FileHandler(ruta_absoluta, encoding='utf-8')
+    destino.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    raiz.addHandler(destino)
+    raiz.setLevel(nivel)
@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+import time
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+def escanear(carpetas):
+    """
+    Devuelve {ruta: (mtime_ns, tamaño)} de los PDFs de las carpetas. Una
+    carpeta que no existe se trata como vacía. El pipeline guarda este
+    escaneo junto al reporte publicado para saber de qué PDFs sale.
+    """
+    estado = {}
+    for carpeta in carpetas:
+        try:
+            entradas = list(os.scandir(carpeta))
+        except FileNotFoundError:
+            continue
+        for entrada in entradas:
+            if entrada.is_file() and entrada.name.lower().endswith('.pdf'):
+                info = entrada.stat()
+                estado[entrada.path] = (info.st_mtime_ns, info.st_size)
+    return estado
+
+def _diferencias(anterior, actual):
+    """Clasifica los PDFs que cambiaron entre dos escaneos."""
+    return {
+        'anadidos': sorted(set(actual) - set(anterior)),
+        'modificados': sorted(r for r in set(actual) & set(anterior) if actual[r] != anterior[r]),
+        'eliminados': sorted(set(anterior) - set(actual)),
+    }
+
+class ObservadorCarpetas:
+    """
+    Vigila por sondeo las carpetas de PDFs y llama a
+    `al_cambiar(cambios, instantanea)` cuando se añaden, modifican o eliminan
+    estados de cuenta.
+
+    Para no lanzar el pipeline a mitad de una copia de varios archivos, los
+    cambios se agrupan: solo se notifica cuando las carpetas llevan `espera`
+    segundos sin cambiar. `cambios` indica las rutas 'anadidos', 'modificados'
+    y 'eliminados' desde la última notificación, e `instantanea` es el escaneo
+    (ver `escanear`) en el que ya están aplicados. El primer escaneo compara
+    con `procesado`, el escaneo del que sale el reporte publicado: al arrancar
+    solo se notifica lo que cambió mientras la app no corría. Sin él se
+    compara con carpetas vacías y se notifican todos los PDFs presentes.
+    """
+
+    def __init__(self, carpetas, al_cambiar, intervalo=2.0, espera=5.0, procesado=None):
+        self.carpetas = list(carpetas)
+        self.al_cambiar = al_cambiar
+        self.intervalo = intervalo
+        self.espera = espera
+        self._procesado = dict(procesado or {})
+        self._ultimo_visto = None
+        self._ultimo_cambio = None
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def revisar(self, ahora=None):
+        """
+        Escanea una vez las carpetas. Devuelve los cambios notificados o None si
+        no hay cambios pendientes o aún no ha pasado el tiempo de espera.
+        """
+        ahora = time.monotonic() if ahora is None else ahora
+        actual = escanear(self.carpetas)
+
+        if actual != self._ultimo_visto:
+            # Algo sigue cambiando: se reinicia la espera
+            self._ultimo_visto = actual
+            self._ultimo_cambio = ahora
+            return None
+        if actual == self._procesado or ahora - self._ultimo_cambio < self.espera:
+            return None
+
+        cambios = _diferencias(self._procesado, actual)
+        self._procesado = actual
+        metricas.incrementar('observador_disparos_total')
+        metricas.registrar_evento('observador_cambios', **{tipo: len(rutas) for tipo, rutas in cambios.items()})
+        print(f"👀 Cambios en los estados de cuenta: {len(cambios['anadidos'])} nuevo(s), "
+              f"{len(cambios['modificados'])} modificado(s), {len(cambios['eliminados'])} eliminado(s).")
+        try:
+            self.al_cambiar(cambios, actual)
+        except Exception:
+            logger.exception("observador_error")
+        return cambios
+
+    def iniciar(self):
+        """Empieza a vigilar en un hilo en segundo plano."""
+        if self._hilo is not None:
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="observador-pdfs", daemon=True)
+        self._hilo.start()
+        print(f"👀 Vigilando {', '.join(self.carpetas)} cada {self.intervalo:g} s.")
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+            self._hilo = None
+
+    def _bucle(self):
+        while True:
+            self.revisar()
+            if self._detener.wait(self.intervalo):
+                break
@@ -1,61 +1,162 @@
 import os
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
 # Importamos las funciones de nuestro otro archivo
 from extractor import extraer_transacciones, analizar_reporte_consolidado
-def procesar_carpeta_de_pdfs(carpeta_entrada, archivo_salida_final):
+from cache_extraccion import hash_archivo, leer_cache, guardar_cache, purgar_cache, invalidar_cache
+from esquema import en_soles
+import metricas
+
+def _resultado_extraccion(df):
+    """Resume en una palabra el resultado de extraer un PDF, para informar del progreso."""
+    if df is None:
+        return 'error'
+    return 'sin_transacciones' if df.empty else 'extraido'
+
+def procesar_carpeta_de_pdfs(carpeta_entrada, archivo_salida_final=None, max_workers=None,
+                             carpeta_cache=None, reiniciar_cache=False, progreso=None,
+                             max_workers_paginas=1, archivos=None):
     """
     Función principal que orquesta el proceso completo:
     1. Busca todos los PDFs en una carpeta.
-    2. Usa el extractor para procesar cada uno.
-    3. Une todos los resultados en un único CSV.
-    4. Limpia los archivos temporales.
+    2. Reutiliza de `carpeta_cache` (si se indica) las transacciones de los PDFs
+       cuyo contenido no ha cambiado desde la última ejecución.
+    3. Usa el extractor para procesar el resto, repartiendo los PDFs entre
+       varios procesos (`max_workers`; por defecto, uno por núcleo y con
+       `max_workers=1` se procesan en secuencia dentro del mismo proceso).
+       Con `max_workers_paginas > 1`, cuando los PDFs se procesan en secuencia
+       (p. ej. si solo hay uno por extraer) se reparten las páginas de cada PDF
+       largo entre varios procesos; nunca se anidan los dos repartos.
+    4. Une todos los resultados en memoria, siempre en orden alfabético de
+       archivo para que el resultado sea determinista, y devuelve el DataFrame
+       consolidado (o None si no se obtuvo ningún dato). Si se indica
+       `archivo_salida_final`, además se guarda una copia en CSV.
+    5. Limpia las entradas de caché de PDFs que ya no existen. Con
+       `reiniciar_cache=True` se descarta toda la caché antes.
+
+    Con `archivos` (nombres de PDF de la carpeta) solo se procesan esos PDFs,
+    p. ej. los que cambiaron desde la última publicación; en ese caso la caché
+    no se purga, porque no se conocen los hashes del resto de la carpeta.
+
+    Un PDF que falle se reporta y se omite sin detener el resto del lote.
+    Si se pasa `progreso`, se le notifica el total de PDFs de la carpeta y el
+    resultado de cada uno en cuanto se conoce.
     """
     print("🚀 Iniciando el Procesador Anual de Estados de Cuenta 🚀")
-    
-    # Lista para guardar los datos de todos los PDFs
-    lista_de_datos = []
-    
-    # Buscamos todos los archivos en la carpeta de entrada
-    for nombre_archivo in os.listdir(carpeta_entrada):
-        if nombre_archivo.lower().endswith('.pdf'):
-            ruta_pdf_completa = os.path.join(carpeta_entrada, nombre_archivo)
-            
-            # Creamos un nombre de archivo temporal para el CSV de este PDF
-            ruta_csv_temporal = os.path.join(carpeta_entrada, f"temp_{nombre_archivo}.csv")
-            
-            # Usamos nuestra función importada para extraer los datos
-            exito = extraer_transacciones(ruta_pdf_completa, ruta_csv_temporal)
-            
-            if exito:
-                # Si la extracción fue exitosa, leemos el CSV temporal y lo añadimos a nuestra lista
+
+    # Buscamos todos los PDFs de la carpeta de entrada, en orden estable
+    nombres_pdf = sorted(
+        nombre for nombre in os.listdir(carpeta_entrada)
+        if nombre.lower().endswith('.pdf') and (archivos is None or nombre in archivos)
+    )
+    rutas_pdf = [os.path.join(carpeta_entrada, nombre) for nombre in nombres_pdf]
+
+    def notificar(ruta_pdf, resultado):
+        metricas.incrementar('pdfs_total', resultado=resultado)
+        metricas.registrar_evento('pdf', archivo=os.path.basename(ruta_pdf), resultado=resultado)
+        if progreso is not None:
+            progreso({'tipo': 'pdf', 'carpeta': carpeta_entrada,
+                      'archivo': os.path.basename(ruta_pdf), 'resultado': resultado})
+
+    if progreso is not None:
+        progreso({'tipo': 'carpeta', 'carpeta': carpeta_entrada, 'total': len(rutas_pdf)})
+
+    # Resultados indexados por ruta para poder consolidarlos en orden
+    resultados = {}
+    hashes = {}
+    pendientes = rutas_pdf
+
+    # --- Caché de extracción ---
+    if carpeta_cache:
+        if reiniciar_cache:
+            eliminadas = invalidar_cache(carpeta_cache)
+            print(f"   -> 🗑️ Caché de extracción reiniciada ({eliminadas} entrada(s) eliminada(s)).")
+
+        hashes = {ruta: hash_archivo(ruta) for ruta in rutas_pdf}
+        pendientes = []
+        for ruta_pdf in rutas_pdf:
+            df_cache = leer_cache(carpeta_cache, hashes[ruta_pdf])
+            if df_cache is None:
+                metricas.incrementar('cache_extraccion_total', resultado='fallo')
+                pendientes.append(ruta_pdf)
+            else:
+                metricas.incrementar('cache_extraccion_total', resultado='acierto')
+                resultados[ruta_pdf] = df_cache
+                notificar(ruta_pdf, 'cache')
+
+        eliminadas = purgar_cache(carpeta_cache, hashes.values()) if archivos is None else 0
+        print(f"   -> 💾 Caché: {len(resultados)} PDF(s) reutilizado(s), {len(pendientes)} por extraer"
+              f", {eliminadas} entrada(s) obsoleta(s) eliminada(s).")
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(pendientes) or 1))
+
+    if max_workers == 1:
+        for ruta_pdf in pendientes:
+            try:
+                resultados[ruta_pdf] = extraer_transacciones(ruta_pdf, max_workers=max_workers_paginas)
+            except Exception as e:
+                print(f"   -> ❌ Error inesperado procesando '{os.path.basename(ruta_pdf)}': {e}")
+            notificar(ruta_pdf, _resultado_extraccion(resultados.get(ruta_pdf)))
+    else:
+        print(f"   -> ⚙️ Procesando {len(pendientes)} PDF(s) con {max_workers} procesos en paralelo...")
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=metricas.iniciar_proceso_hijo) as pool:
+            # Cada proceso devuelve también sus métricas (páginas, tiempos...) para sumarlas aquí.
+            # Sus páginas no se reparten en otro pool: serían max_workers × max_workers_paginas procesos.
+            futuros = {
+                pool.submit(metricas.ejecutar_con_metricas, extraer_transacciones, ruta, None, 1): ruta
+                for ruta in pendientes
+            }
+            for futuro in as_completed(futuros):
+                ruta_pdf = futuros[futuro]
                 try:
-                    df_temporal = pd.read_csv(ruta_csv_temporal, sep=';')
-                    lista_de_datos.append(df_temporal)
-                except pd.errors.EmptyDataError:
-                    print(f"   -> El archivo temporal para '{nombre_archivo}' está vacío, se ignora.")
-                
-                # --- Limpieza ---
-                # Eliminamos el archivo CSV temporal para mantener la carpeta limpia
-                os.remove(ruta_csv_temporal)
-                print(f"   -> 🧹 Archivo temporal '{os.path.basename(ruta_csv_temporal)}' eliminado.")
+                    resultados[ruta_pdf], metricas_pdf = futuro.result()
+                    metricas.registro.fusionar(metricas_pdf)
+                except Exception as e:
+                    print(f"   -> ❌ Error inesperado procesando '{os.path.basename(ruta_pdf)}': {e}")
+                notificar(ruta_pdf, _resultado_extraccion(resultados.get(ruta_pdf)))
+
+    # Solo se guardan en caché las extracciones recién hechas que no fallaron
+    # (un PDF sin transacciones también se guarda, como DataFrame vacío)
+    if carpeta_cache:
+        for ruta_pdf in pendientes:
+            if resultados.get(ruta_pdf) is not None:
+                guardar_cache(carpeta_cache, hashes[ruta_pdf], resultados[ruta_pdf])
+
+    # Lista con los datos de todos los PDFs, en el orden de los archivos. Cada
+    # transacción lleva el nombre del PDF del que salió ('ESTADO'), para que el
+    # almacén actualice sus resúmenes solo con los estados de cuenta que cambian.
+    lista_de_datos = [
+        resultados[ruta].assign(ESTADO=os.path.basename(ruta)) for ruta in rutas_pdf
+        if resultados.get(ruta) is not None and not resultados[ruta].empty
+    ]
 
     # --- Consolidación ---
     if not lista_de_datos:
         print("\n❌ No se pudo extraer datos de ningún PDF. Proceso terminado.")
-        return
+        return None
 
     print(f"\n consolidating Consolidando los datos de {len(lista_de_datos)} archivo(s)...")
     
-    # Unimos todos los DataFrames de la lista en uno solo
-    df_consolidado = pd.concat(lista_de_datos, ignore_index=True)
-    
-    # Guardamos el resultado final en el archivo CSV conglomerado
-    df_consolidado.to_csv(archivo_salida_final, index=False, sep=';', decimal='.')
+    with metricas.medir('consolidacion', carpeta=carpeta_entrada, archivos=len(lista_de_datos)):
+        # Unimos todos los DataFrames de la lista en uno solo
+        df_consolidado = pd.concat(lista_de_datos, ignore_index=True)
+        df_consolidado['ESTADO'] = df_consolidado['ESTADO'].astype('category')
+
+        # Si se pidió, guardamos una copia en el archivo CSV conglomerado
+        if archivo_salida_final:
+            en_soles(df_consolidado.drop(columns='ESTADO')).to_csv(archivo_salida_final, index=False, sep=';', decimal='.')
     
-    print(f"🎉 ¡Proceso completado! Todas las transacciones han sido guardadas en '{archivo_salida_final}' 🎉")
+    if archivo_salida_final:
+        print(f"🎉 ¡Proceso completado! Todas las transacciones han sido guardadas en '{archivo_salida_final}' 🎉")
+    else:
+        print(f"🎉 ¡Proceso completado! {len(df_consolidado)} transacciones consolidadas en memoria 🎉")
     
-    # Finalmente, ejecutamos el análisis sobre el gran archivo consolidado
-    analizar_reporte_consolidado(archivo_salida_final)
+    # Finalmente, ejecutamos el análisis sobre los datos consolidados
+    analizar_reporte_consolidado(df_consolidado)
+
+    return df_consolidado
 
 
 if __name__ == "__main__":
@@ -69,4 +170,4 @@ if __name__ == "__main__":
     REPORTE_CONSOLIDADO_CSV = "reporte_anual_consolidado.csv"
     
     # --- EJECUCIÓN ---
-    procesar_carpeta_de_pdfs(CARPETA_CON_PDFS, REPORTE_CONSOLIDADO_CSV)
\ No newline at end of file
+    procesar_carpeta_de_pdfs(CARPETA_CON_PDFS, REPORTE_CONSOLIDADO_CSV)
@@ -0,0 +1,274 @@
+import json
+
+# Resúmenes materializados del reporte. Se guardan en el almacén junto a las
+# transacciones y se mantienen de forma incremental: al publicar un reporte
+# solo se suman las contribuciones de los estados de cuenta nuevos y se restan
+# las de los que desaparecieron, así que las consultas del dashboard recorren
+# periodos (días, meses, cuentas, categorías) y no transacciones.
+# Los montos están en céntimos. Solo cuentan las transacciones con fecha
+# completa, igual que en el antiguo dashboard.
+ESQUEMA = [
+    # Estados de cuenta publicados, con la huella de sus transacciones
+    """CREATE TABLE IF NOT EXISTS estados (
+        CUENTA_ORIGEN TEXT NOT NULL,
+        ESTADO TEXT NOT NULL,
+        HUELLA TEXT NOT NULL,
+        FILAS INTEGER NOT NULL,
+        PRIMARY KEY (CUENTA_ORIGEN, ESTADO)
+    )""",
+    """CREATE TABLE IF NOT EXISTS resumen_diario (
+        DIA TEXT NOT NULL,
+        CUENTA_ORIGEN TEXT NOT NULL,
+        CATEGORIA TEXT NOT NULL,
+        INGRESOS INTEGER NOT NULL,
+        GASTOS INTEGER NOT NULL,
+        TRANSACCIONES INTEGER NOT NULL,
+        NUM_GASTOS INTEGER NOT NULL,
+        CUADRADOS_GASTOS INTEGER NOT NULL,
+        MAYOR_INGRESO INTEGER NOT NULL,
+        MAYOR_GASTO INTEGER NOT NULL,
+        PRIMARY KEY (DIA, CUENTA_ORIGEN, CATEGORIA)
+    )""",
+    """CREATE TABLE IF NOT EXISTS resumen_mensual (
+        MES TEXT NOT NULL,
+        CUENTA_ORIGEN TEXT NOT NULL,
+        CATEGORIA TEXT NOT NULL,
+        INGRESOS INTEGER NOT NULL,
+        GASTOS INTEGER NOT NULL,
+        TRANSACCIONES INTEGER NOT NULL,
+        NUM_GASTOS INTEGER NOT NULL,
+        CUADRADOS_GASTOS INTEGER NOT NULL,
+        PRIMARY KEY (MES, CUENTA_ORIGEN, CATEGORIA)
+    )""",
+    """CREATE TABLE IF NOT EXISTS resumen_familias (
+        FAMILIA TEXT PRIMARY KEY,
+        INGRESOS INTEGER NOT NULL,
+        GASTOS INTEGER NOT NULL,
+        TRANSACCIONES INTEGER NOT NULL
+    )""",
+]
+
+TABLAS = ['estados', 'resumen_diario', 'resumen_mensual', 'resumen_familias']
+
+# Columna de los resúmenes para cada tipo de movimiento
+COLUMNA_POR_TIPO = {'ingresos': 'INGRESOS', 'gastos': 'GASTOS'}
+
+# Columnas que se suman (o restan) al combinar contribuciones
+_SUMABLES = ['INGRESOS', 'GASTOS', 'TRANSACCIONES', 'NUM_GASTOS', 'CUADRADOS_GASTOS']
+
+def _en_soles(centimos):
+    """Monto en céntimos a soles con dos decimales, para la respuesta JSON."""
+    return round(float(centimos) / 100, 2)
+
+def contribuciones(tabla):
+    """
+    Agrupa las transacciones de `tabla` (columnas del almacén, montos en
+    céntimos) en las filas de los tres resúmenes: por día, cuenta y categoría;
+    por mes, cuenta y categoría; y por familia de descripciones.
+    """
+    # Solo se usa al escribir: las consultas de lectura no necesitan pandas
+    import pandas as pd
+    from categorias import CATEGORIA_POR_DEFECTO
+
+    tabla = tabla[tabla['FECHA_ISO'].notna()]
+    cargos = tabla['CARGOS / DEBE'].astype('int64')
+    filas = pd.DataFrame({
+        'DIA': tabla['FECHA_ISO'].astype(str),
+        'CUENTA_ORIGEN': tabla['CUENTA_ORIGEN'].fillna('Desconocida').astype(str),
+        'CATEGORIA': tabla['CATEGORIA'].fillna(CATEGORIA_POR_DEFECTO).astype(str),
+        'FAMILIA': tabla['FAMILIA'].astype(str),
+        'INGRESOS': tabla['ABONOS / HABER'].astype('int64'),
+        'GASTOS': cargos,
+        'TRANSACCIONES': 1,
+        'NUM_GASTOS': (cargos > 0).astype('int64'),
+        'CUADRADOS_GASTOS': cargos * cargos,
+    })
+
+    diario = filas.groupby(['DIA', 'CUENTA_ORIGEN', 'CATEGORIA'], sort=False).agg(
+        **{columna: (columna, 'sum') for columna in _SUMABLES},
+        MAYOR_INGRESO=('INGRESOS', 'max'),
+        MAYOR_GASTO=('GASTOS', 'max'),
+    ).reset_index()
+
+    diario['MES'] = diario['DIA'].str[:7]
+    mensual = diario.groupby(['MES', 'CUENTA_ORIGEN', 'CATEGORIA'], sort=False)[_SUMABLES].sum().reset_index()
+
+    familias = filas.groupby('FAMILIA', sort=False)[['INGRESOS', 'GASTOS', 'TRANSACCIONES']].sum().reset_index()
+    return diario.drop(columns='MES'), mensual, familias
+
+def _filas(df, columnas, signo=1):
+    """Filas de un DataFrame como tuplas de tipos nativos, con las sumables multiplicadas por `signo`."""
+    return zip(*[
+        (df[columna] * signo if columna in _SUMABLES else df[columna]).tolist()
+        for columna in columnas
+    ])
+
+def _sentencia_acumular(tabla, claves, columnas, maximos=()):
+    """INSERT que suma las columnas sumables a la fila existente (y se queda con el mayor de los máximos)."""
+    actualizaciones = [f"{c} = {c} + excluded.{c}" for c in columnas if c in _SUMABLES]
+    actualizaciones += [f"{c} = MAX({c}, excluded.{c})" for c in maximos]
+    return (
+        f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))}) "
+        f"ON CONFLICT ({', '.join(claves)}) DO UPDATE SET {', '.join(actualizaciones)}"
+    )
+
+def sumar(conexion, tabla, signo=1):
+    """
+    Suma (`signo=1`) o resta (`signo=-1`) a los resúmenes la contribución de
+    las transacciones de `tabla`. Al restar, los máximos diarios pueden quedar
+    desfasados: se devuelven las claves (día, cuenta, categoría) tocadas para
+    recalcularlos con `recalcular_maximos` una vez actualizado el almacén.
+    """
+    diario, mensual, familias = contribuciones(tabla)
+    maximos = ['MAYOR_INGRESO', 'MAYOR_GASTO']
+    columnas_diario = ['DIA', 'CUENTA_ORIGEN', 'CATEGORIA', *_SUMABLES, *maximos]
+    conexion.executemany(
+        _sentencia_acumular('resumen_diario', columnas_diario[:3], columnas_diario, maximos),
+        _filas(diario, columnas_diario, signo),
+    )
+    columnas_mensual = ['MES', 'CUENTA_ORIGEN', 'CATEGORIA', *_SUMABLES]
+    conexion.executemany(
+        _sentencia_acumular('resumen_mensual', columnas_mensual[:3], columnas_mensual),
+        _filas(mensual, columnas_mensual, signo),
+    )
+    columnas_familias = ['FAMILIA', 'INGRESOS', 'GASTOS', 'TRANSACCIONES']
+    conexion.executemany(
+        _sentencia_acumular('resumen_familias', columnas_familias[:1], columnas_familias),
+        _filas(familias, columnas_familias, signo),
+    )
+    return list(zip(diario['DIA'], diario['CUENTA_ORIGEN'], diario['CATEGORIA']))
+
+def recalcular_maximos(conexion, claves):
+    """
+    Elimina los periodos que se quedaron sin transacciones y recalcula desde
+    el almacén los máximos de las claves (día, cuenta, categoría) indicadas,
+    leyendo solo las transacciones de esos días.
+    """
+    for tabla in ('resumen_diario', 'resumen_mensual', 'resumen_familias'):
+        conexion.execute(f"DELETE FROM {tabla} WHERE TRANSACCIONES = 0")
+    if not claves:
+        return
+    claves = set(claves)
+    dias = sorted({dia for dia, _, _ in claves})
+    maximos = conexion.execute(
+        """SELECT FECHA_ISO, CUENTA_ORIGEN, CATEGORIA, MAX("ABONOS / HABER"), MAX("CARGOS / DEBE")
+           FROM transacciones WHERE FECHA_ISO IN (SELECT value FROM json_each(?))
+           GROUP BY FECHA_ISO, CUENTA_ORIGEN, CATEGORIA""",
+        (json.dumps(dias),),
+    ).fetchall()
+    conexion.executemany(
+        """UPDATE resumen_diario SET MAYOR_INGRESO = ?, MAYOR_GASTO = ?
+           WHERE DIA = ? AND CUENTA_ORIGEN = ? AND CATEGORIA = ?""",
+        [(ingreso, gasto, dia, cuenta, categoria) for dia, cuenta, categoria, ingreso, gasto in maximos
+         if (dia, cuenta, categoria) in claves],
+    )
+
+def vaciar(conexion):
+    """Borra los resúmenes y el registro de estados, para reconstruirlos desde cero."""
+    for tabla in TABLAS:
+        conexion.execute(f"DELETE FROM {tabla}")
+
+# --- Consultas del dashboard (recorren periodos, no transacciones) ---
+
+def resumen_totales(conexion):
+    """Totales de ingresos, gastos y balance, periodo cubierto y mayores movimientos."""
+    ingresos, gastos, transacciones, desde, hasta, mayor_ingreso, mayor_gasto = conexion.execute(
+        """SELECT COALESCE(SUM(INGRESOS), 0), COALESCE(SUM(GASTOS), 0), COALESCE(SUM(TRANSACCIONES), 0),
+                  MIN(DIA), MAX(DIA), MAX(MAYOR_INGRESO), MAX(MAYOR_GASTO)
+           FROM resumen_diario"""
+    ).fetchone()
+    return {
+        'total_ingresos': _en_soles(ingresos),
+        'total_gastos': _en_soles(gastos),
+        'balance_neto': _en_soles(ingresos - gastos),
+        'num_transacciones': transacciones,
+        'desde': desde,
+        'hasta': hasta,
+        'mayor_ingreso': _en_soles(mayor_ingreso) if mayor_ingreso is not None else None,
+        'mayor_gasto': _en_soles(mayor_gasto) if mayor_gasto is not None else None,
+    }
+
+def serie_mensual(conexion):
+    """Ingresos y gastos por mes ('AAAA-MM'), en orden cronológico."""
+    filas = conexion.execute(
+        "SELECT MES, SUM(INGRESOS), SUM(GASTOS) FROM resumen_mensual GROUP BY MES ORDER BY MES"
+    ).fetchall()
+    return [{'mes': mes, 'ingresos': _en_soles(ingresos), 'gastos': _en_soles(gastos)} for mes, ingresos, gastos in filas]
+
+def totales_por_cuenta(conexion):
+    """Volumen movido (ingresos + gastos) por cuenta, en el orden en que aparece cada una."""
+    filas = conexion.execute(
+        """SELECT CUENTA_ORIGEN, SUM(INGRESOS + GASTOS) FROM resumen_diario
+           GROUP BY CUENTA_ORIGEN ORDER BY MIN(DIA), CUENTA_ORIGEN"""
+    ).fetchall()
+    return [{'cuenta': cuenta, 'total': _en_soles(total)} for cuenta, total in filas]
+
+def totales_por_categoria(conexion):
+    """Gasto total y número de gastos por categoría, de mayor a menor."""
+    filas = conexion.execute(
+        """SELECT CATEGORIA, SUM(GASTOS), SUM(NUM_GASTOS) FROM resumen_diario
+           GROUP BY CATEGORIA HAVING SUM(NUM_GASTOS) > 0
+           ORDER BY SUM(GASTOS) DESC, MIN(DIA), CATEGORIA"""
+    ).fetchall()
+    return [
+        {'categoria': categoria, 'total': _en_soles(total), 'transacciones': cantidad}
+        for categoria, total, cantidad in filas
+    ]
+
+def top_grupos(conexion, tipo, n=5):
+    """Las `n` familias de descripciones con mayor monto para 'ingresos' o 'gastos'."""
+    columna = COLUMNA_POR_TIPO[tipo]
+    filas = conexion.execute(
+        f"SELECT FAMILIA, {columna} FROM resumen_familias WHERE {columna} > 0 "
+        f"ORDER BY {columna} DESC, FAMILIA LIMIT ?",
+        (max(n, 0),),
+    ).fetchall()
+    return [{'descripcion': familia, 'total': _en_soles(total)} for familia, total in filas]
+
+def gastos_atipicos(conexion):
+    """
+    Gastos mayores que la media más dos desviaciones típicas, calculados igual
+    que en el antiguo dashboard: la media es la de los gastos y la varianza
+    divide entre el total de transacciones (no solo los gastos). Ambas salen
+    de las sumas (y sumas de cuadrados) mensuales, calculadas con enteros
+    exactos; solo se leen del almacén las transacciones que superan el umbral.
+    """
+    suma = num_gastos = total = cuadrados = 0
+    for gastos, n_gastos, transacciones, suma_cuadrados in conexion.execute(
+        "SELECT GASTOS, NUM_GASTOS, TRANSACCIONES, CUADRADOS_GASTOS FROM resumen_mensual"
+    ):
+        suma += gastos
+        num_gastos += n_gastos
+        total += transacciones
+        cuadrados += suma_cuadrados
+    if num_gastos == 0:
+        return {'umbral': None, 'transacciones': []}
+
+    media = suma / num_gastos
+    desviacion = ((num_gastos * cuadrados - suma * suma) / (num_gastos * total)) ** 0.5
+    umbral = media + 2 * desviacion
+    filas = conexion.execute(
+        """SELECT FECHA, DESCRIPCION, "CARGOS / DEBE" FROM transacciones
+           WHERE "CARGOS / DEBE" > ? AND FECHA_ISO IS NOT NULL
+           ORDER BY "CARGOS / DEBE" DESC, id""",
+        (umbral,),
+    ).fetchall()
+    return {
+        'umbral': _en_soles(umbral),
+        'transacciones': [
+            {'fecha': fecha, 'descripcion': descripcion, 'monto': _en_soles(monto)}
+            for fecha, descripcion, monto in filas
+        ],
+    }
+
+def resumen_completo(conexion, n_top=5):
+    """Todo lo que necesita el dashboard en una sola respuesta compacta."""
+    return {
+        'totales': resumen_totales(conexion),
+        'mensual': serie_mensual(conexion),
+        'por_cuenta': totales_por_cuenta(conexion),
+        'top_ingresos': top_grupos(conexion, 'ingresos', n_top),
+        'top_gastos': top_grupos(conexion, 'gastos', n_top),
+        'categorias': totales_por_categoria(conexion),
+        'atipicos': gastos_atipicos(conexion),
+    }
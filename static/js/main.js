@@ -25,19 +25,22 @@ document.addEventListener('DOMContentLoaded', function() {
         showLoading(isRefreshing);
         destroyCharts();
 
-        fetch('/api/data')
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error(`Error en la red: ${response.statusText}`);
-                }
-                return response.json();
-            })
-            .then(transacciones => {
+        const pedirJSON = (url) => fetch(url).then(response => {
+            if (!response.ok) {
+                throw new Error(`Error en la red: ${response.statusText}`);
+            }
+            return response.json();
+        });
+
+        // Los totales, series, rankings y categorías llegan ya calculados desde
+        // el backend, así que no hace falta descargar las transacciones
+        pedirJSON('/api/resumen')
+            .then(resumen => {
                 hideLoading();
-                if (transacciones.error) {
-                    throw new Error(transacciones.error);
+                if (resumen.error) {
+                    throw new Error(resumen.error);
                 }
-                procesarYVisualizarDatos(transacciones);
+                procesarYVisualizarDatos(resumen);
             })
             .catch(error => {
                 console.error('Error al obtener los datos:', error);
@@ -53,6 +56,25 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
+    function seguirTarea(tareaId) {
+        // Consulta el progreso del pipeline hasta que termine
+        return fetch(`/api/tareas/${tareaId}`)
+            .then(response => response.json())
+            .then(tarea => {
+                if (tarea.estado === 'completada') {
+                    return tarea;
+                }
+                if (tarea.estado === 'fallida' || tarea.error) {
+                    throw new Error(tarea.error || 'La actualización falló.');
+                }
+                const detalle = tarea.pdfs_total > 0
+                    ? `Actualizando datos... (${tarea.pdfs_procesados}/${tarea.pdfs_total} PDFs)`
+                    : 'Actualizando datos...';
+                loadingOverlay.querySelector('p.text-lg').textContent = detalle;
+                return new Promise(resolve => setTimeout(resolve, 1000)).then(() => seguirTarea(tareaId));
+            });
+    }
+
     function refreshData() {
         showLoading(true);
         destroyCharts();
@@ -60,8 +82,8 @@ document.addEventListener('DOMContentLoaded', function() {
         fetch('/api/data/refresh', { method: 'POST' })
             .then(response => response.json())
             .then(result => {
-                if (result.status === 'success') {
-                    fetchDataAndRender(true);
+                if (result.status === 'accepted') {
+                    return seguirTarea(result.tarea.id).then(() => fetchDataAndRender(true));
                 } else {
                     throw new Error(result.message || 'La actualización falló.');
                 }
@@ -73,27 +95,10 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
-    function procesarYVisualizarDatos(transacciones) {
-        const mesesEs = { 'ENE': 'JAN', 'FEB': 'FEB', 'MAR': 'MAR', 'ABR': 'APR', 'MAY': 'MAY', 'JUN': 'JUN', 'JUL': 'JUL', 'AGO': 'AUG', 'SEP': 'SEP', 'OCT': 'OCT', 'NOV': 'NOV', 'DIC': 'DEC' };
-
-        transacciones.forEach(t => {
-            t.Gastos = parseFloat(t['CARGOS / DEBE']) || 0;
-            t.Ingresos = parseFloat(t['ABONOS / HABER']) || 0;
-
-            const fechaRaw = t.FECHA;
-            const dia = fechaRaw.substring(0, 2);
-            const mesAbbr = fechaRaw.substring(2, 5).toUpperCase();
-            const mesEn = mesesEs[mesAbbr];
-            const anio = new Date().getFullYear();
-
-            t.FechaObj = mesEn ? new Date(`${mesEn} ${dia}, ${anio}`) : null;
-        });
-
-        const transaccionesValidas = transacciones.filter(t => t.FechaObj && !isNaN(t.FechaObj));
-
-        const totalIngresos = transaccionesValidas.reduce((sum, t) => sum + t.Ingresos, 0);
-        const totalGastos = transaccionesValidas.reduce((sum, t) => sum + t.Gastos, 0);
-        const balanceNeto = totalIngresos - totalGastos;
+    function procesarYVisualizarDatos(resumen) {
+        const totalIngresos = resumen.totales.total_ingresos;
+        const totalGastos = resumen.totales.total_gastos;
+        const balanceNeto = resumen.totales.balance_neto;
 
         const formatoMoneda = (valor) => valor.toLocaleString('es-PE', { style: 'currency', currency: 'PEN' });
 
@@ -108,42 +113,17 @@ document.addEventListener('DOMContentLoaded', function() {
             balanceEl.classList.add('text-red-500');
         }
 
-        const mensual = {};
-        transaccionesValidas.forEach(t => {
-            const month = t.FechaObj.toISOString().slice(0, 7);
-            if (!mensual[month]) {
-                mensual[month] = { ingresos: 0, gastos: 0 };
-            }
-            mensual[month].ingresos += t.Ingresos;
-            mensual[month].gastos += t.Gastos;
-        });
-        const labelsMensual = Object.keys(mensual).sort();
-        const dataIngresosMensual = labelsMensual.map(m => mensual[m].ingresos);
-        const dataGastosMensual = labelsMensual.map(m => mensual[m].gastos);
+        const labelsMensual = resumen.mensual.map(m => m.mes);
+        const dataIngresosMensual = resumen.mensual.map(m => m.ingresos);
+        const dataGastosMensual = resumen.mensual.map(m => m.gastos);
 
-        const porCuenta = transaccionesValidas.reduce((acc, t) => {
-            const cuenta = t.CUENTA_ORIGEN || 'Desconocida';
-            if (!acc[cuenta]) {
-                acc[cuenta] = { total: 0 };
-            }
-            acc[cuenta].total += t.Ingresos + t.Gastos;
-            return acc;
-        }, {});
+        const porCuenta = {};
+        resumen.por_cuenta.forEach(c => {
+            porCuenta[c.cuenta] = { total: c.total };
+        });
 
-        function getTop5(data, descriptionField, amountField) {
-            const grouped = data.filter(d => d[amountField] > 0).reduce((acc, curr) => {
-                let key = curr[descriptionField] || 'Sin descripción';
-                key = key.replace(/Pago YAPE (de|a) \d+/i, 'Pago YAPE a Terceros').trim();
-                key = key.replace(/CLAR\d+/i, 'Servicios (Claro)').trim();
-                key = key.replace(/WOW\d+/i, 'Suscripción (WOW)').trim();
-                key = key.replace(/ABON PLIN-[\w\s\*]+/i, 'Recepción PLIN').trim();
-                acc[key] = (acc[key] || 0) + curr[amountField];
-                return acc;
-            }, {});
-            return Object.entries(grouped).sort(([, a], [, b]) => b - a).slice(0, 5);
-        }
-        const topIngresos = getTop5(transaccionesValidas, 'DESCRIPCION', 'Ingresos');
-        const topGastos = getTop5(transaccionesValidas, 'DESCRIPCION', 'Gastos');
+        const topIngresos = resumen.top_ingresos.map(g => [g.descripcion, g.total]);
+        const topGastos = resumen.top_gastos.map(g => [g.descripcion, g.total]);
 
         Chart.defaults.font.family = "'Inter', sans-serif";
         Chart.defaults.color = '#64748b';
@@ -223,74 +203,42 @@ document.addEventListener('DOMContentLoaded', function() {
         };
         activeCharts.push(...Object.values(charts));
 
-        analizarGastosDetalladamente(transaccionesValidas, totalGastos);
+        analizarGastosDetalladamente(resumen.categorias, resumen.atipicos, totalGastos);
 
     }
 
-    function analizarGastosDetalladamente(transacciones, totalGastosGeneral) {
+    function analizarGastosDetalladamente(categorias, atipicos, totalGastosGeneral) {
         const contenedor = document.getElementById('analisis-gastos-detallado');
         if (!contenedor) return;
         contenedor.innerHTML = '';
 
         const formatoMoneda = (valor) => valor.toLocaleString('es-PE', { style: 'currency', currency: 'PEN' });
 
-        const reglasCategorias = {
-            'Servicios Básicos': /pago de servicio|luz del sur|sedapal|calidda|movistar|claro|entel|directv/i,
-            'Transporte': /beat|uber|cabify|didi|peaje|pasaje|transporte/i,
-            'Comida y Restaurantes': /restaurante|cafe|pardo's chicken|kfc|mcdonald's|starbucks|chifa|comida|mercado|plaza vea|wong|metro|tottus|vivanda/i,
-            'Suscripciones y Digital': /netflix|spotify|disney+|hbo max|prime video|google|microsoft|apple|wow/i,
-            'Salud': /farmacia|doctor|clínica|salud|botica/i,
-            'Compras': /ripley|saga falabella|h&m|zara|compras|tienda|mall|jockey plaza/i,
-            'Transferencias y Retiros': /transferencia a|retiro en|envío a/i,
-            'Otros Gastos': /./
-        };
-
-        let gastosPorCategoria = {};
-
-        transacciones.filter(t => t.Gastos > 0).forEach(t => {
-            let categoriaAsignada = 'Otros Gastos';
-            for (const categoria in reglasCategorias) {
-                if (reglasCategorias[categoria].test(t.DESCRIPCION)) {
-                    categoriaAsignada = categoria;
-                    break;
-                }
-            }
-            if (!gastosPorCategoria[categoriaAsignada]) {
-                gastosPorCategoria[categoriaAsignada] = [];
-            }
-            gastosPorCategoria[categoriaAsignada].push(t);
-        });
-
+        // Cada gasto ya viene categorizado desde el pipeline; aquí solo se pintan los totales
         let analisisHTML = '<div class="space-y-8">';
 
         // 1. Acumulación de Dinero por Destino
         analisisHTML += '<div>';
         analisisHTML += '<h3 class="text-xl font-semibold text-gray-800 mb-3">Acumulación de Gastos por Categoría</h3>';
         analisisHTML += '<ul class="space-y-2 text-gray-700">';
-        Object.entries(gastosPorCategoria).sort(([, a], [, b]) => b.reduce((s, t) => s + t.Gastos, 0) - a.reduce((s, t) => s + t.Gastos, 0)).forEach(([categoria, gastos]) => {
-            const totalCategoria = gastos.reduce((sum, t) => sum + t.Gastos, 0);
-            const porcentaje = (totalCategoria / totalGastosGeneral) * 100;
+        categorias.forEach(c => {
+            const porcentaje = (c.total / totalGastosGeneral) * 100;
             analisisHTML += `<li class="flex justify-between items-center bg-gray-100 p-3 rounded-lg">
-                <span>${categoria}</span>
-                <span class="font-medium">${formatoMoneda(totalCategoria)} (${porcentaje.toFixed(2)}%)</span>
+                <span>${c.categoria}</span>
+                <span class="font-medium">${formatoMoneda(c.total)} (${porcentaje.toFixed(2)}%)</span>
             </li>`;
         });
         analisisHTML += '</ul></div>';
 
         // 2. Valores Extraños (Anomalías)
-        const mediaGeneral = totalGastosGeneral / transacciones.filter(t => t.Gastos > 0).length;
-        const desviacionEstandar = Math.sqrt(transacciones.filter(t => t.Gastos > 0).reduce((sum, t) => sum + Math.pow(t.Gastos - mediaGeneral, 2), 0) / transacciones.length);
-        const umbralAnomalia = mediaGeneral + (2 * desviacionEstandar); // Umbral: media + 2 * stddev
-        const gastosAnomalos = transacciones.filter(t => t.Gastos > umbralAnomalia);
-
-        if (gastosAnomalos.length > 0) {
+        if (atipicos.transacciones.length > 0) {
             analisisHTML += '<div>';
-            analisisHTML += `<h3 class="text-xl font-semibold text-gray-800 mb-3">Posibles Gastos Atípicos (Mayores a ${formatoMoneda(umbralAnomalia)})</h3>`;
+            analisisHTML += `<h3 class="text-xl font-semibold text-gray-800 mb-3">Posibles Gastos Atípicos (Mayores a ${formatoMoneda(atipicos.umbral)})</h3>`;
             analisisHTML += '<ul class="space-y-2">';
-            gastosAnomalos.sort((a,b) => b.Gastos - a.Gastos).forEach(g => {
+            atipicos.transacciones.forEach(g => {
                 analisisHTML += `<li class="p-3 bg-yellow-100 border-l-4 border-yellow-400 rounded">
-                    <p class="font-semibold">${g.DESCRIPCION}</p>
-                    <p class="text-sm text-gray-600">${g.FECHA} - <span class="font-bold text-yellow-800">${formatoMoneda(g.Gastos)}</span></p>
+                    <p class="font-semibold">${g.descripcion}</p>
+                    <p class="text-sm text-gray-600">${g.fecha} - <span class="font-bold text-yellow-800">${formatoMoneda(g.monto)}</span></p>
                 </li>`;
             });
             analisisHTML += '</ul></div>';
@@ -300,21 +248,20 @@ document.addEventListener('DOMContentLoaded', function() {
         analisisHTML += '<div>';
         analisisHTML += '<h3 class="text-xl font-semibold text-gray-800 mb-3">Recomendaciones y Oportunidades de Mejora</h3>';
         analisisHTML += '<div class="space-y-3">';
-        const categoriaMasCara = Object.entries(gastosPorCategoria).sort(([, a], [, b]) => b.reduce((s, t) => s + t.Gastos, 0) - a.reduce((s, t) => s + t.Gastos, 0))[0];
+        // Las categorías llegan ordenadas de mayor a menor gasto
+        const categoriaMasCara = categorias[0];
         if (categoriaMasCara) {
-             const totalCategoria = categoriaMasCara[1].reduce((s, t) => s + t.Gastos, 0);
-             const porcentaje = (totalCategoria / totalGastosGeneral) * 100;
+             const porcentaje = (categoriaMasCara.total / totalGastosGeneral) * 100;
              analisisHTML += `<div class="p-4 bg-blue-100 border-l-4 border-blue-400 rounded">
-                <h4 class="font-bold text-blue-800">Foco Principal: ${categoriaMasCara[0]}</h4>
-                <p class="text-gray-700">Has gastado ${formatoMoneda(totalCategoria)}, que representa el ${porcentaje.toFixed(2)}% de tus gastos totales. Revisa las transacciones en esta categoría para identificar posibles ahorros.</p>
+                <h4 class="font-bold text-blue-800">Foco Principal: ${categoriaMasCara.categoria}</h4>
+                <p class="text-gray-700">Has gastado ${formatoMoneda(categoriaMasCara.total)}, que representa el ${porcentaje.toFixed(2)}% de tus gastos totales. Revisa las transacciones en esta categoría para identificar posibles ahorros.</p>
              </div>`;
         }
-        const suscripciones = gastosPorCategoria['Suscripciones y Digital'];
-        if (suscripciones && suscripciones.length > 1) {
-            const totalSuscripciones = suscripciones.reduce((s, t) => s + t.Gastos, 0);
+        const suscripciones = categorias.find(c => c.categoria === 'Suscripciones y Digital');
+        if (suscripciones && suscripciones.transacciones > 1) {
             analisisHTML += `<div class="p-4 bg-indigo-100 border-l-4 border-indigo-400 rounded">
                 <h4 class="font-bold text-indigo-800">Revisa tus Suscripciones</h4>
-                <p class="text-gray-700">Detectamos ${suscripciones.length} gastos en suscripciones y servicios digitales por un total de ${formatoMoneda(totalSuscripciones)}. ¿Sigues usando todos estos servicios?</p>
+                <p class="text-gray-700">Detectamos ${suscripciones.transacciones} gastos en suscripciones y servicios digitales por un total de ${formatoMoneda(suscripciones.total)}. ¿Sigues usando todos estos servicios?</p>
             </div>`;
         }
         analisisHTML += '</div></div>';
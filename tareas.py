@@ -0,0 +1,129 @@
+import logging
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+def _ahora():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+class EjecutorPipeline:
+    """
+    Ejecuta el pipeline en un hilo en segundo plano con garantía "single-flight":
+    mientras haya una ejecución en curso, cualquier nueva solicitud recibe esa
+    misma tarea en lugar de lanzar otra extracción en paralelo.
+
+    Cada tarea guarda su estado ('en_progreso', 'completada' o 'fallida') y el
+    progreso que el pipeline va notificando a través de `progreso(evento)`.
+    """
+
+    def __init__(self, max_historial=20):
+        self.max_historial = max_historial
+        self._tareas = OrderedDict()
+        self._eventos_fin = {}
+        self._actual = None
+        self._lock = threading.Lock()
+
+    def iniciar(self, funcion, **kwargs):
+        """
+        Lanza `funcion(progreso=..., **kwargs)` en segundo plano, o devuelve la
+        tarea en curso si ya hay una. Devuelve una copia del estado de la tarea.
+        """
+        with self._lock:
+            if self._actual is not None:
+                return self._copiar(self._tareas[self._actual])
+
+            tarea_id = uuid.uuid4().hex
+            self._tareas[tarea_id] = {
+                'id': tarea_id,
+                'estado': 'en_progreso',
+                'etapa': 'pendiente',
+                'creada': _ahora(),
+                'finalizada': None,
+                'error': None,
+                'pdfs_total': 0,
+                'pdfs_procesados': 0,
+                'pdfs': [],
+            }
+            self._eventos_fin[tarea_id] = threading.Event()
+            self._actual = tarea_id
+            while len(self._tareas) > self.max_historial:
+                antigua, _ = self._tareas.popitem(last=False)
+                self._eventos_fin.pop(antigua, None)
+            tarea = self._copiar(self._tareas[tarea_id])
+
+        hilo = threading.Thread(
+            target=self._ejecutar, args=(tarea_id, funcion, kwargs), name=f"pipeline-{tarea_id[:8]}", daemon=True
+        )
+        hilo.start()
+        return tarea
+
+    def _ejecutar(self, tarea_id, funcion, kwargs):
+        def progreso(evento):
+            self._registrar_progreso(tarea_id, evento)
+
+        try:
+            funcion(progreso=progreso, **kwargs)
+            estado, error = 'completada', None
+        except Exception as e:
+            traceback.print_exc()
+            logger.exception("tarea_fallida id=%s", tarea_id)
+            estado, error = 'fallida', str(e)
+
+        with self._lock:
+            tarea = self._tareas.get(tarea_id)
+            if tarea is not None:
+                tarea['estado'] = estado
+                tarea['error'] = error
+                tarea['etapa'] = 'finalizada'
+                tarea['finalizada'] = _ahora()
+            self._actual = None
+            evento_fin = self._eventos_fin.get(tarea_id)
+        if evento_fin is not None:
+            evento_fin.set()
+
+    def _registrar_progreso(self, tarea_id, evento):
+        """
+        Aplica un evento de progreso del pipeline. Tipos admitidos:
+        {'tipo': 'etapa', 'etapa': ...}, {'tipo': 'carpeta', 'total': n} y
+        {'tipo': 'pdf', 'archivo': ..., 'resultado': ...}.
+        """
+        with self._lock:
+            tarea = self._tareas.get(tarea_id)
+            if tarea is None:
+                return
+            if evento['tipo'] == 'etapa':
+                tarea['etapa'] = evento['etapa']
+            elif evento['tipo'] == 'carpeta':
+                tarea['pdfs_total'] += evento['total']
+            elif evento['tipo'] == 'pdf':
+                tarea['pdfs_procesados'] += 1
+                tarea['pdfs'].append({'archivo': evento['archivo'], 'resultado': evento['resultado']})
+
+    def tarea_en_curso(self):
+        """Devuelve una copia de la tarea en ejecución o None si no hay ninguna."""
+        with self._lock:
+            return self._copiar(self._tareas[self._actual]) if self._actual is not None else None
+
+    def obtener(self, tarea_id):
+        """Devuelve una copia del estado de la tarea o None si no existe."""
+        with self._lock:
+            tarea = self._tareas.get(tarea_id)
+            return self._copiar(tarea) if tarea is not None else None
+
+    def esperar(self, tarea_id, timeout=None):
+        """Bloquea hasta que la tarea termine (o venza `timeout`) y devuelve su estado."""
+        with self._lock:
+            evento_fin = self._eventos_fin.get(tarea_id)
+        if evento_fin is not None:
+            evento_fin.wait(timeout)
+        return self.obtener(tarea_id)
+
+    @staticmethod
+    def _copiar(tarea):
+        copia = dict(tarea)
+        copia['pdfs'] = list(tarea['pdfs'])
+        return copia
@@ -1,7 +1,15 @@
 import pytest
-from app import app as flask_app
+import pandas as pd
+from app import app as flask_app, cache_respuestas, ejecutor_pipeline, ingerir_cambios
+from almacen import guardar_reporte, leer_transacciones
 import os
 import json
+import gzip
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
 from unittest.mock import patch
 
 # --- Fixtures de Pytest ---
@@ -12,16 +20,20 @@ def client():
     Configura la aplicación Flask para pruebas y proporciona un cliente de prueba.
     Este fixture se ejecuta antes de cada prueba que lo solicita.
     """
-    # Usar un archivo de reporte final específico para las pruebas
+    # Usar un archivo de reporte final y un almacén específicos para las pruebas
     reporte_final_prueba = "test_reporte_maestro.csv"
+    base_datos_prueba = "test_reporte_maestro.db"
+    archivos_prueba = [reporte_final_prueba] + [base_datos_prueba + sufijo for sufijo in ("", "-wal", "-shm")]
 
     # Configuración de la app para el entorno de prueba
     flask_app.config['TESTING'] = True
     flask_app.config['REPORTE_FINAL'] = reporte_final_prueba
+    flask_app.config['BASE_DATOS'] = base_datos_prueba
 
     # Limpiar cualquier archivo de prueba residual antes de empezar
-    if os.path.exists(reporte_final_prueba):
-        os.remove(reporte_final_prueba)
+    for archivo in archivos_prueba:
+        if os.path.exists(archivo):
+            os.remove(archivo)
 
     # El 'yield' pasa el control al código de la prueba
     with flask_app.test_client() as client:
@@ -29,15 +41,18 @@ def client():
 
     # --- Limpieza post-prueba ---
     # Este código se ejecuta después de que la prueba ha terminado
-    if os.path.exists(reporte_final_prueba):
-        os.remove(reporte_final_prueba)
+    for archivo in archivos_prueba:
+        if os.path.exists(archivo):
+            os.remove(archivo)
 
 def create_dummy_report(path):
-    """Función de ayuda para crear un archivo de reporte falso."""
-    with open(path, "w") as f:
-        f.write("FECHA;DESCRIPCION;CARGOS / DEBE;ABONOS / HABER;CUENTA_ORIGEN\n")
-        f.write("15JUL;Compra online;150.0;0.0;Ahorro\n")
-        f.write("16JUL;Salario;0.0;3500.0;Ahorro\n")
+    """Función de ayuda para publicar un reporte falso en el almacén."""
+    df = pd.DataFrame([
+        {'FECHA': '15JUL', 'DESCRIPCION': 'Compra online', 'CARGOS / DEBE': 15000, 'ABONOS / HABER': 0, 'CUENTA_ORIGEN': 'Ahorro'},
+        {'FECHA': '16JUL', 'DESCRIPCION': 'Salario', 'CARGOS / DEBE': 0, 'ABONOS / HABER': 350000, 'CUENTA_ORIGEN': 'Ahorro'},
+    ])
+    df['Fecha_Completa'] = pd.to_datetime(['2025-07-15', '2025-07-16'])
+    guardar_reporte(df, path)
 
 # --- Pruebas de la API ---
 
@@ -50,7 +65,7 @@ def test_get_data_when_file_exists(mock_run_pipeline, client):
     print("\n🧪 Prueba: /api/data con archivo existente")
 
     # Preparación: Crear un reporte falso
-    create_dummy_report(flask_app.config['REPORTE_FINAL'])
+    create_dummy_report(flask_app.config['BASE_DATOS'])
 
     # Ejecución: Llamar al endpoint
     response = client.get('/api/data')
@@ -72,9 +87,9 @@ def test_get_data_when_file_does_not_exist(mock_run_pipeline, client):
     print("\n🧪 Prueba: /api/data sin archivo existente")
 
     # Configurar el mock para que "cree" el archivo cuando se llame
-    def side_effect():
+    def side_effect(**kwargs):
         print("   -> Mock de run_data_pipeline llamado. Creando archivo...")
-        create_dummy_report(flask_app.config['REPORTE_FINAL'])
+        create_dummy_report(flask_app.config['BASE_DATOS'])
     mock_run_pipeline.side_effect = side_effect
 
     # Ejecución: Llamar al endpoint
@@ -92,7 +107,7 @@ def test_get_data_when_file_does_not_exist(mock_run_pipeline, client):
 def test_refresh_data_endpoint(mock_run_pipeline, client):
     """
     Prueba el endpoint POST /api/data/refresh.
-    Debe forzar la ejecución del pipeline de datos.
+    Debe encolar la ejecución del pipeline y devolver la tarea al momento.
     """
     print("\n🧪 Prueba: /api/data/refresh")
 
@@ -100,12 +115,121 @@ def test_refresh_data_endpoint(mock_run_pipeline, client):
     response = client.post('/api/data/refresh')
 
     # Verificación
-    assert response.status_code == 200
-    mock_run_pipeline.assert_called_once() # El pipeline debe ser llamado
+    assert response.status_code == 202
     data = json.loads(response.data)
-    assert data['status'] == 'success'
+    assert data['status'] == 'accepted'
+    tarea_id = data['tarea']['id']
+    assert response.headers['Location'].endswith(f'/api/tareas/{tarea_id}')
+
+    ejecutor_pipeline.esperar(tarea_id, timeout=5)
+    mock_run_pipeline.assert_called_once() # El pipeline debe ser llamado
+    estado = json.loads(client.get(f'/api/tareas/{tarea_id}').data)
+    assert estado['estado'] == 'completada'
     print("   -> ✅ Éxito: Endpoint de actualización funciona correctamente.")
 
+@patch('app.run_data_pipeline')
+def test_refresh_concurrentes_comparten_una_ejecucion(mock_run_pipeline, client):
+    """
+    Varias peticiones de actualización mientras el pipeline está en curso
+    reciben la misma tarea y el pipeline se ejecuta una sola vez.
+    """
+    print("\n🧪 Prueba: Single-flight de /api/data/refresh")
+    liberar = threading.Event()
+
+    def pipeline_lento(progreso=None, **kwargs):
+        progreso({'tipo': 'carpeta', 'total': 1})
+        progreso({'tipo': 'pdf', 'archivo': 'enero.pdf', 'resultado': 'extraido'})
+        liberar.wait(5)
+    mock_run_pipeline.side_effect = pipeline_lento
+
+    ids = {json.loads(client.post('/api/data/refresh').data)['tarea']['id'] for _ in range(3)}
+    assert len(ids) == 1
+    tarea_id = ids.pop()
+
+    liberar.set()
+    estado = ejecutor_pipeline.esperar(tarea_id, timeout=5)
+    assert estado['estado'] == 'completada'
+    assert estado['pdfs_total'] == 1 and estado['pdfs_procesados'] == 1
+    mock_run_pipeline.assert_called_once()
+    assert client.get('/api/tareas/no-existe').status_code == 404
+    print("   -> ✅ Éxito: Las peticiones concurrentes comparten una ejecución.")
+
+@patch('app.run_data_pipeline')
+def test_ingesta_del_observador_no_se_pierde_con_pipeline_en_curso(mock_run_pipeline, client):
+    """
+    Si el observador detecta cambios mientras ya corre una actualización (que
+    pudo empezar antes de la copia), espera a que termine y lanza otra.
+    """
+    print("\n🧪 Prueba: Ingesta del observador con el pipeline en curso")
+    liberar = threading.Event()
+    mock_run_pipeline.side_effect = lambda progreso=None, **kwargs: liberar.wait(5)
+
+    en_curso = json.loads(client.post('/api/data/refresh').data)['tarea']
+    hilo = threading.Thread(target=ingerir_cambios)
+    hilo.start()
+    liberar.set()
+    hilo.join(timeout=5)
+
+    assert mock_run_pipeline.call_count == 2
+    assert ejecutor_pipeline.obtener(en_curso['id'])['estado'] == 'completada'
+    print("   -> ✅ Éxito: Los cambios detectados se ingieren en una nueva ejecución.")
+
+def test_observador_ingiere_solo_los_estados_que_cambian(client, tmp_path, monkeypatch):
+    """
+    Con un reporte publicado por el pipeline, el observador no reprocesa nada
+    al arrancar. Al añadir y eliminar estados de cuenta solo extrae los PDFs
+    nuevos, sin ejecutar el pipeline completo, y el resultado es el mismo que
+    daría una ejecución completa.
+    """
+    import app as aplicacion
+    import procesador_anual
+    from extractor import extraer_transacciones
+    from generador_sintetico import escribir_estados_mensuales, generar_transacciones
+
+    print("\n🧪 Prueba: Ingesta incremental del observador")
+    sinteticas = generar_transacciones(300, semilla=7)
+    cuentas = [{'nombre': nombre, 'carpeta': str(tmp_path / nombre.lower()), 'csv': None} for nombre in sinteticas]
+    for cuenta in cuentas:
+        df = sinteticas[cuenta['nombre']]
+        escribir_estados_mensuales(cuenta['carpeta'], df[df['Fecha_Completa'].dt.month <= 3], cuenta['nombre'].lower())
+    monkeypatch.setitem(flask_app.config, 'CUENTAS', cuentas)
+    monkeypatch.setitem(flask_app.config, 'CARPETA_CACHE', str(tmp_path / "cache"))
+    monkeypatch.setitem(flask_app.config, 'MAX_WORKERS_PDF', 1)
+    monkeypatch.setitem(flask_app.config, 'ESPERA_OBSERVADOR', 0)
+    aplicacion.run_data_pipeline()
+
+    observador = aplicacion.crear_observador()
+    assert observador.revisar(ahora=0) is None
+    assert observador.revisar(ahora=1) is None      # el reporte publicado está al día
+
+    yape = sinteticas['Yape']
+    escribir_estados_mensuales(cuentas[0]['carpeta'], yape[yape['Fecha_Completa'].dt.month == 4], 'yape')
+    os.remove(os.path.join(cuentas[1]['carpeta'], 'ahorro_2025_02.pdf'))
+    extraidos = []
+
+    def extraer_contando(ruta, *args, **kwargs):
+        extraidos.append(os.path.basename(ruta))
+        return extraer_transacciones(ruta, *args, **kwargs)
+
+    monkeypatch.setattr(procesador_anual, 'extraer_transacciones', extraer_contando)
+    with patch('app.run_data_pipeline') as mock_run_pipeline:
+        assert observador.revisar(ahora=2) is None
+        cambios = observador.revisar(ahora=3)
+    mock_run_pipeline.assert_not_called()
+    assert [os.path.basename(r) for r in cambios['anadidos']] == ['yape_2025_04.pdf']
+    assert extraidos == ['yape_2025_04.pdf']
+
+    def publicado():
+        data = json.loads(client.get('/api/data').data)
+        assert [t['FECHA_ISO'] for t in data] == sorted(t['FECHA_ISO'] for t in data)
+        return sorted(json.dumps(t, sort_keys=True) for t in data), json.loads(client.get('/api/resumen').data)
+
+    incremental = publicado()
+    assert any(t.startswith('{"ABONOS') and '2025-04-' in t for t in incremental[0])
+    aplicacion.run_data_pipeline()
+    assert publicado() == incremental
+    print("   -> ✅ Éxito: Solo se ingieren los estados de cuenta que cambian.")
+
 def test_home_page_loads_correctly(client):
     """
     Prueba que la página de inicio se carga sin errores.
@@ -116,16 +240,16 @@ def test_home_page_loads_correctly(client):
     assert 'Análisis Financiero Anual'.encode('utf-8') in response.data
     print("   -> ✅ Éxito: La página de inicio se carga.")
 
-@patch('app.pd.read_csv')
-def test_get_data_handles_read_error(mock_read_csv, client):
+@patch('app.leer_transacciones')
+def test_get_data_handles_read_error(mock_leer_transacciones, client):
     """
-    Prueba cómo maneja el endpoint /api/data un error al leer el CSV.
+    Prueba cómo maneja el endpoint /api/data un error al consultar el almacén.
     """
     print("\n🧪 Prueba: Manejo de errores en /api/data")
 
-    # Preparación: Crear el archivo, pero hacer que la lectura falle
-    create_dummy_report(flask_app.config['REPORTE_FINAL'])
-    mock_read_csv.side_effect = Exception("Fallo de lectura simulado")
+    # Preparación: Crear el reporte, pero hacer que la lectura falle
+    create_dummy_report(flask_app.config['BASE_DATOS'])
+    mock_leer_transacciones.side_effect = Exception("Fallo de lectura simulado")
 
     # Ejecución
     response = client.get('/api/data')
@@ -135,4 +259,337 @@ def test_get_data_handles_read_error(mock_read_csv, client):
     data = json.loads(response.data)
     assert 'error' in data
     assert 'Fallo de lectura simulado' in data['error']
-    print("   -> ✅ Éxito: La API maneja correctamente los errores de lectura.")
\ No newline at end of file
+    print("   -> ✅ Éxito: La API maneja correctamente los errores de lectura.")
+
+def test_guardar_reporte_fallido_conserva_version_anterior(client):
+    """
+    Si la escritura de un nuevo reporte falla a mitad, el almacén conserva
+    completo el reporte anterior.
+    """
+    print("\n🧪 Prueba: Escritura transaccional del almacén")
+    create_dummy_report(flask_app.config['BASE_DATOS'])
+
+    df_roto = pd.DataFrame([{'FECHA': None, 'DESCRIPCION': 'Fila inválida', 'CARGOS / DEBE': 100,
+                             'ABONOS / HABER': 0, 'CUENTA_ORIGEN': 'Yape'}])
+    with pytest.raises(Exception):
+        guardar_reporte(df_roto, flask_app.config['BASE_DATOS'])
+
+    data = json.loads(client.get('/api/data').data)
+    assert [t['DESCRIPCION'] for t in data] == ['Compra online', 'Salario']
+    assert [t['FECHA_ISO'] for t in data] == ['2025-07-15', '2025-07-16']
+    print("   -> ✅ Éxito: El reporte anterior sigue disponible.")
+
+def test_cache_de_extraccion_separada_por_carpeta(client, monkeypatch):
+    """
+    Dos cuentas cuyas carpetas de PDFs se llaman igual ('a/pdfs', 'b/pdfs') no
+    comparten subcarpeta de caché: la purga de una no borra la de la otra.
+    """
+    print("\n🧪 Prueba: Caché de extracción por carpeta de PDFs")
+    from app import _carpeta_cache_para
+    monkeypatch.setitem(flask_app.config, 'CARPETA_CACHE', 'cache_prueba')
+
+    cache_a = _carpeta_cache_para(os.path.join('a', 'pdfs'))
+    cache_b = _carpeta_cache_para(os.path.join('b', 'pdfs'))
+    assert cache_a != cache_b
+    assert cache_a == _carpeta_cache_para(os.path.join('a', 'pdfs', ''))
+    assert os.path.dirname(cache_a) == 'cache_prueba'
+
+    monkeypatch.setitem(flask_app.config, 'CARPETA_CACHE', None)
+    assert _carpeta_cache_para('yape') is None
+    print("   -> ✅ Éxito: Cada carpeta tiene su propia caché.")
+
+def test_pipeline_sin_cuentas_falla_con_un_mensaje_claro(client, monkeypatch):
+    """
+    Sin cuentas configuradas, la actualización falla con un error legible (y
+    no con una división entre cero al repartir los procesos).
+    """
+    print("\n🧪 Prueba: Pipeline sin cuentas configuradas")
+    monkeypatch.setitem(flask_app.config, 'CUENTAS', [])
+
+    tarea = json.loads(client.post('/api/data/refresh').data)['tarea']
+    estado = ejecutor_pipeline.esperar(tarea['id'], timeout=5)
+
+    assert estado['estado'] == 'fallida'
+    assert "CUENTAS" in estado['error']
+    print("   -> ✅ Éxito: La configuración inválida se informa en la tarea.")
+
+@patch('app.run_data_pipeline')
+def test_reglas_modificadas_se_aplican_sin_lanzar_app_py(mock_run_pipeline, client, monkeypatch):
+    """
+    Con cualquier servidor (no solo `python app.py`), la primera petición de
+    datos aplica las reglas de categorías y de familias que cambiaron desde que
+    se publicó el reporte, y corrige sus resúmenes.
+    """
+    import agregaciones
+    import app as aplicacion
+    import categorias
+
+    print("\n🧪 Prueba: Reglas modificadas con el reporte ya publicado")
+    create_dummy_report(flask_app.config['BASE_DATOS'])
+    monkeypatch.setattr(aplicacion, '_reglas_revisadas', False)
+    monkeypatch.setattr(categorias, 'REGLAS_CATEGORIAS',
+                        [('Compras en Línea', r"online")] + categorias.REGLAS_CATEGORIAS)
+    monkeypatch.setattr(agregaciones, 'REGLAS_NORMALIZACION',
+                        agregaciones.REGLAS_NORMALIZACION + [(re.compile(r'Compra \w+'), 'Compras')])
+
+    data = json.loads(client.get('/api/resumen').data)
+
+    mock_run_pipeline.assert_not_called()
+    assert data['categorias'][0]['categoria'] == 'Compras en Línea'
+    assert data['top_gastos'] == [{'descripcion': 'Compras', 'total': 150.0}]
+    assert [t['CATEGORIA'] for t in json.loads(client.get('/api/data').data)][0] == 'Compras en Línea'
+    print("   -> ✅ Éxito: Las reglas nuevas se aplican en la primera petición.")
+
+@patch('app.run_data_pipeline')
+def test_resumen_endpoint(mock_run_pipeline, client):
+    """
+    Prueba que /api/resumen devuelve los totales, la serie mensual, el reparto
+    por cuenta y los rankings ya calculados en el backend.
+    """
+    print("\n🧪 Prueba: /api/resumen")
+    create_dummy_report(flask_app.config['BASE_DATOS'])
+
+    response = client.get('/api/resumen')
+
+    assert response.status_code == 200
+    mock_run_pipeline.assert_not_called()
+    data = json.loads(response.data)
+    assert data['totales']['total_ingresos'] == 3500.0
+    assert data['totales']['total_gastos'] == 150.0
+    assert data['totales']['balance_neto'] == 3350.0
+    assert data['mensual'] == [{'mes': '2025-07', 'ingresos': 3500.0, 'gastos': 150.0}]
+    assert data['por_cuenta'] == [{'cuenta': 'Ahorro', 'total': 3650.0}]
+    assert data['top_gastos'] == [{'descripcion': 'Compra online', 'total': 150.0}]
+    assert data['categorias'] == [{'categoria': 'Otros Gastos', 'total': 150.0, 'transacciones': 1}]
+    assert data['atipicos']['transacciones'] == []
+
+    categorias = json.loads(client.get('/api/resumen/categorias').data)
+    assert categorias == data['categorias']
+    assert client.get('/api/resumen/top?tipo=otro').status_code == 400
+    print("   -> ✅ Éxito: El resumen se calcula en el servidor.")
+
+@patch('app.run_data_pipeline')
+def test_get_data_filtros_paginacion_y_cache_condicional(mock_run_pipeline, client):
+    """
+    Prueba los filtros y la paginación por cursor de /api/data, y que una
+    petición repetida con el ETag recibido obtiene un 304 sin cuerpo.
+    """
+    print("\n🧪 Prueba: /api/data con filtros, cursor y ETag")
+    create_dummy_report(flask_app.config['BASE_DATOS'])
+
+    primera = client.get('/api/data?limite=1')
+    assert primera.status_code == 200
+    assert [t['DESCRIPCION'] for t in json.loads(primera.data)] == ['Compra online']
+    cursor = primera.headers['X-Siguiente-Cursor']
+    # El enlace a la página siguiente es relativo, así que la copia en caché
+    # sirve igual a un cliente que llega por otro host
+    assert primera.headers['Link'] == f'</api/data?limite=1&cursor={cursor}>; rel="next"'
+    otro_host = client.get('/api/data?limite=1', base_url='http://otro-host.example')
+    assert otro_host.headers['Link'] == primera.headers['Link']
+
+    segunda = client.get(f'/api/data?limite=1&cursor={cursor}')
+    assert [t['DESCRIPCION'] for t in json.loads(segunda.data)] == ['Salario']
+
+    filtrada = client.get('/api/data?desde=2025-07-16&cuenta=Ahorro&monto_min=1000')
+    assert [t['DESCRIPCION'] for t in json.loads(filtrada.data)] == ['Salario']
+    assert client.get('/api/data?desde=16/07/2025').status_code == 400
+
+    repetida = client.get('/api/data?limite=1', headers={'If-None-Match': primera.headers['ETag']})
+    assert repetida.status_code == 304
+    assert repetida.data == b''
+    print("   -> ✅ Éxito: Filtros, cursor y 304 funcionan.")
+
+@patch('app.run_data_pipeline')
+def test_get_data_filtra_por_particion_de_anio_y_cuenta(mock_run_pipeline, client):
+    """
+    Un reporte de varios años y cuentas se filtra por `anio` y `cuenta`, y esas
+    consultas usan el índice de particiones en lugar de recorrer todo el historial.
+    """
+    print("\n🧪 Prueba: /api/data por año y cuenta")
+    base_datos = flask_app.config['BASE_DATOS']
+    df = pd.DataFrame({
+        'FECHA': ['20DIC', '05ENE', '06ENE', '07ENE'],
+        'DESCRIPCION': ['Regalo', 'Compra', 'Sueldo', 'Intereses'],
+        'CARGOS / DEBE': [3000, 1250, 0, 0],
+        'ABONOS / HABER': [0, 0, 200000, 420],
+        'CUENTA_ORIGEN': ['Yape', 'Yape', 'Ahorro', 'CTS'],
+        'Fecha_Completa': pd.to_datetime(['2024-12-20', '2025-01-05', '2025-01-06', '2025-01-07']),
+    })
+    guardar_reporte(df, base_datos)
+
+    del_anio = json.loads(client.get('/api/data?anio=2025').data)
+    assert [t['DESCRIPCION'] for t in del_anio] == ['Compra', 'Sueldo', 'Intereses']
+    de_cuenta = json.loads(client.get('/api/data?anio=2025&cuenta=Yape').data)
+    assert [t['DESCRIPCION'] for t in de_cuenta] == ['Compra']
+    assert client.get('/api/data?anio=dosmil').status_code == 400
+
+    conexion = sqlite3.connect(base_datos)
+    try:
+        plan = conexion.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM transacciones WHERE ANIO = 2025 AND CUENTA_ORIGEN = 'Yape'"
+        ).fetchall()
+    finally:
+        conexion.close()
+    assert 'idx_transacciones_particion' in str(plan)
+    print("   -> ✅ Éxito: Solo se consulta la partición pedida.")
+
+@patch('app.run_data_pipeline')
+def test_search_por_prefijo_con_filtros(mock_run_pipeline, client):
+    """
+    /api/search encuentra las transacciones cuyas palabras empiezan por las de
+    `q` (sin distinguir mayúsculas ni tildes), combinado con los filtros de
+    /api/data, tanto por la vía selectiva como por la del índice completo.
+    """
+    print("\n🧪 Prueba: /api/search")
+    base_datos = flask_app.config['BASE_DATOS']
+    df = pd.DataFrame({
+        'FECHA': ['20DIC', '05ENE', '06ENE', '07ENE'],
+        'DESCRIPCION': ['Pago YAPE de José Pérez', 'WOW0020240762146', 'Pago YAPE a Josefina', 'Pago YAPE de José Pérez'],
+        'CARGOS / DEBE': [0, 8990, 2500, 0],
+        'ABONOS / HABER': [4000, 0, 0, 1500],
+        'CUENTA_ORIGEN': ['Yape', 'Ahorro', 'Yape', 'Yape'],
+        'Fecha_Completa': pd.to_datetime(['2024-12-20', '2025-01-05', '2025-01-06', '2025-01-07']),
+    })
+    guardar_reporte(df, base_datos)
+
+    def buscar(consulta):
+        return [(t['FECHA'], t['DESCRIPCION']) for t in json.loads(client.get(consulta).data)]
+
+    for selectivas in (2000, 0):
+        with patch('busqueda.MAX_DESCRIPCIONES_SELECTIVAS', selectivas):
+            assert buscar('/api/search?q=jose') == [
+                ('20DIC', 'Pago YAPE de José Pérez'), ('06ENE', 'Pago YAPE a Josefina'),
+                ('07ENE', 'Pago YAPE de José Pérez'),
+            ]
+            assert buscar('/api/search?q=yape+PER&anio=2025') == [('07ENE', 'Pago YAPE de José Pérez')]
+            assert buscar('/api/search?q=wow&cuenta=Ahorro') == [('05ENE', 'WOW0020240762146')]
+            assert buscar('/api/search?q=00202407&hasta=2025-01-05') == [('05ENE', 'WOW0020240762146')]
+            assert buscar('/api/search?q=plin') == []
+        # La misma URL se serviría desde la caché de respuestas
+        cache_respuestas.invalidar()
+
+    pagina = client.get('/api/search?q=pago&limite=2')
+    assert len(json.loads(pagina.data)) == 2
+    assert '/api/search?' in pagina.headers['Link']
+    assert client.get('/api/search?q=%20-').status_code == 400
+    print("   -> ✅ Éxito: La búsqueda por prefijo respeta los filtros.")
+
+@patch('app.run_data_pipeline')
+def test_get_data_comprime_respuestas_grandes(mock_run_pipeline, client):
+    """
+    Las respuestas JSON grandes se envían comprimidas si el cliente acepta gzip.
+    La caché guarda el cuerpo ya comprimido: repetir la petición no vuelve a
+    comprimirlo, y un cliente sin gzip recibe su propia variante sin comprimir.
+    """
+    print("\n🧪 Prueba: Compresión de /api/data")
+    create_dummy_report(flask_app.config['BASE_DATOS'])
+    flask_app.config['COMPRESION_MIN_BYTES'] = 0
+    try:
+        with patch('app.gzip.compress', wraps=gzip.compress) as mock_compress:
+            response = client.get('/api/data', headers={'Accept-Encoding': 'gzip'})
+            repetida = client.get('/api/data', headers={'Accept-Encoding': 'gzip'})
+            sin_comprimir = client.get('/api/data')
+    finally:
+        flask_app.config['COMPRESION_MIN_BYTES'] = 1024
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    data = json.loads(gzip.decompress(response.data))
+    assert len(data) == 2
+    assert repetida.headers['Content-Encoding'] == 'gzip' and repetida.data == response.data
+    assert mock_compress.call_count == 1
+    assert 'Content-Encoding' not in sin_comprimir.headers
+    assert json.loads(sin_comprimir.data) == data
+    print("   -> ✅ Éxito: La respuesta llega comprimida.")
+
+@patch('app.run_data_pipeline')
+def test_get_data_prefiere_brotli(mock_run_pipeline, client):
+    """
+    Si el cliente acepta Brotli, las respuestas grandes se comprimen con él (y
+    no con gzip), tanto las de datos como las de los resúmenes.
+    """
+    import brotli
+
+    print("\n🧪 Prueba: Compresión Brotli")
+    create_dummy_report(flask_app.config['BASE_DATOS'])
+    flask_app.config['COMPRESION_MIN_BYTES'] = 0
+    try:
+        datos = client.get('/api/data', headers={'Accept-Encoding': 'gzip, br'})
+        resumen = client.get('/api/resumen', headers={'Accept-Encoding': 'br'})
+    finally:
+        flask_app.config['COMPRESION_MIN_BYTES'] = 1024
+
+    assert datos.headers['Content-Encoding'] == 'br'
+    assert [t['DESCRIPCION'] for t in json.loads(brotli.decompress(datos.data))] == ['Compra online', 'Salario']
+    assert resumen.headers['Content-Encoding'] == 'br'
+    assert 'totales' in json.loads(brotli.decompress(resumen.data))
+    print("   -> ✅ Éxito: La respuesta llega comprimida con Brotli.")
+
+@patch('app.leer_transacciones', wraps=leer_transacciones)
+def test_get_data_reutiliza_respuesta_en_cache(mock_leer_transacciones, client):
+    """
+    Mientras la versión del reporte no cambie, repetir la misma petición no
+    vuelve a consultar el almacén y cuenta como acierto de la caché.
+    """
+    print("\n🧪 Prueba: Caché de respuestas de /api/data")
+    create_dummy_report(flask_app.config['BASE_DATOS'])
+    aciertos_previos = json.loads(client.get('/api/cache').data)['aciertos']
+
+    primera = client.get('/api/data')
+    segunda = client.get('/api/data')
+
+    assert primera.data == segunda.data
+    assert mock_leer_transacciones.call_count == 1
+    assert json.loads(client.get('/api/cache').data)['aciertos'] == aciertos_previos + 1
+
+    # Un reporte nuevo cambia la versión y obliga a volver a consultar
+    create_dummy_report(flask_app.config['BASE_DATOS'])
+    client.get('/api/data')
+    assert mock_leer_transacciones.call_count == 2
+    print("   -> ✅ Éxito: La segunda petición se sirve desde memoria.")
+
+@patch('app.run_data_pipeline')
+def test_metrics_endpoint_formato_prometheus(mock_run_pipeline, client):
+    """
+    /api/metrics expone en texto de Prometheus los tiempos por etapa (escritura
+    del almacén, consulta y serialización de la API, cada una por separado) y
+    los contadores del pipeline.
+    """
+    print("\n🧪 Prueba: /api/metrics")
+    create_dummy_report(flask_app.config['BASE_DATOS'])
+    client.get('/api/data')
+    client.get('/api/resumen/totales')
+
+    response = client.get('/api/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    texto = response.get_data(as_text=True)
+    assert '# TYPE analisis_duracion_segundos histogram' in texto
+    assert 'analisis_duracion_segundos_count{etapa="escritura_almacen"}' in texto
+    assert 'analisis_duracion_segundos_count{etapa="serializacion_api"}' in texto
+    assert 'analisis_duracion_segundos_count{etapa="consulta_almacen"}' in texto
+    assert 'analisis_duracion_segundos_bucket{etapa="serializacion_api",le="+Inf"}' in texto
+    assert '# TYPE analisis_transferencias_huerfanas_total counter' in texto
+    assert 'analisis_cache_respuestas_aciertos ' in texto
+    print("   -> ✅ Éxito: Las métricas se exponen en formato Prometheus.")
+
+def test_servir_reporte_publicado_no_carga_el_pipeline(client):
+    """
+    Un proceso nuevo que importa la app y sirve un reporte ya publicado no
+    carga pdfplumber ni pandas: el pipeline solo se importa al ejecutarse.
+    """
+    print("\n🧪 Prueba: Arranque sin el pipeline")
+    create_dummy_report(flask_app.config['BASE_DATOS'])
+    script = (
+        "import sys, app\n"
+        "app.app.config.update(BASE_DATOS=sys.argv[1], TESTING=True)\n"
+        "cliente = app.app.test_client()\n"
+        "assert cliente.get('/api/data').status_code == 200\n"
+        "assert cliente.get('/api/resumen').status_code == 200\n"
+        "print(sorted(m for m in ('pdfplumber', 'pandas', 'numpy') if m in sys.modules))\n"
+    )
+    salida = subprocess.run([sys.executable, '-c', script, flask_app.config['BASE_DATOS']],
+                            capture_output=True, text=True, check=True).stdout
+    assert salida.strip().splitlines()[-1] == '[]'
+    print("   -> ✅ Éxito: Servir datos no carga el pipeline.")
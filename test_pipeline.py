@@ -0,0 +1,644 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import sqlite3
+import time
+import pandas as pd
+import pdfplumber
+import pytest
+
+import cache_extraccion
+from agregaciones import normalizar_descripciones
+from almacen import (
+    _tabla_almacen, guardar_reporte, actualizar_categorias, actualizar_familias, leer_transacciones, leer_resumen
+)
+from cache_extraccion import hash_archivo, leer_cache, guardar_cache, purgar_cache
+from categorias import REGLAS_CATEGORIAS, categorizar
+from conciliador import conciliar_transferencias, conciliar_cuentas
+from esquema import a_centimos, en_soles
+from extractor import _region_tabla, _transacciones_de_lote, extraer_transacciones
+from fechas import parsear_fechas, inferir_periodo
+from generador_sintetico import COLUMNAS_X, FILAS_POR_PAGINA, generar_transacciones, escribir_estado_pdf, escribir_pdf
+import metricas
+import procesador_anual
+from metricas import RegistroMetricas
+from observador import ObservadorCarpetas, escanear
+import resumenes
+
+# --- Pruebas de la caché de extracción ---
+
+def test_cache_guarda_y_purga_entradas(tmp_path, monkeypatch):
+    """
+    Una entrada se recupera mientras su PDF exista y se elimina al purgar con
+    los hashes vigentes o al cambiar la versión del extractor.
+    """
+    pdf = tmp_path / "estado.pdf"
+    pdf.write_bytes(b"contenido del estado de cuenta")
+    carpeta_cache = str(tmp_path / "cache")
+    df = pd.DataFrame([{'FECHA': '15JUL', 'DESCRIPCION': 'Compra', 'CARGOS / DEBE': 10.0, 'ABONOS / HABER': 0.0}])
+
+    h = hash_archivo(str(pdf))
+    assert leer_cache(carpeta_cache, h) is None
+    guardar_cache(carpeta_cache, h, df)
+    pd.testing.assert_frame_equal(leer_cache(carpeta_cache, h), df)
+
+    # Mismo PDF vigente: no se elimina nada
+    assert purgar_cache(carpeta_cache, [h]) == 0
+
+    # Nueva versión del extractor: la entrada anterior ya no coincide
+    monkeypatch.setattr(cache_extraccion, 'VERSION_EXTRACTOR', 'otra')
+    assert leer_cache(carpeta_cache, h) is None
+    assert purgar_cache(carpeta_cache, [h]) == 1
+
+# --- Pruebas de la reconstrucción de filas del extractor ---
+
+def _palabra(texto, x0, top):
+    return {'text': texto, 'x0': x0, 'top': top}
+
+def test_lote_reconstruye_filas_y_montos():
+    """
+    Las palabras desordenadas se agrupan por página y línea, se asignan a su
+    columna según la maquetación de cada página y los montos se convierten a céntimos.
+    """
+    columnas = {'cargos': 400, 'abonos': 500}
+    pagina_1 = [
+        _palabra('150.00', 400, 100.2), _palabra('PLAZA', 180, 100), _palabra('04SET', 40, 100),
+        _palabra('04SET', 90, 100), _palabra('COMPRA', 140, 99.8),
+        _palabra('Saldo', 40, 120), _palabra('1,250.50', 500, 140), _palabra('05SET', 40, 140),
+        _palabra('05SET', 90, 140), _palabra('ABONO', 140, 140),
+    ]
+    # La misma línea vertical en otra página es una fila distinta
+    pagina_2 = [_palabra('06SET', 40, 100), _palabra('06SET', 90, 100), _palabra('X', 140, 100),
+                _palabra('--', 400, 100)]
+
+    df = _transacciones_de_lote([(pagina_1, columnas), ([], columnas), (pagina_2, columnas)])
+
+    assert df['FECHA'].tolist() == ['04SET', '05SET']
+    assert df['DESCRIPCION'].tolist() == ['COMPRA PLAZA', 'ABONO']
+    assert df['CARGOS / DEBE'].tolist() == [15000, 0]
+    assert df['ABONOS / HABER'].tolist() == [0, 125050]
+
+def test_extraccion_de_estado_sintetico(tmp_path):
+    """
+    Un estado de cuenta generado con el generador sintético (varias páginas y
+    periodo en la portada) se extrae exactamente con sus fechas completas.
+    """
+    df = generar_transacciones(120, anio=2024, cuentas=('Yape',), semilla=1)['Yape']
+    pdf = str(tmp_path / "estado.pdf")
+    escribir_estado_pdf(pdf, df, df['Fecha_Completa'].min(), df['Fecha_Completa'].max())
+
+    extraido = extraer_transacciones(pdf)
+
+    pd.testing.assert_frame_equal(extraido, df, check_dtype=False)
+
+def _contador(nombre, **etiquetas):
+    """Valor actual de un contador del registro de métricas del proceso."""
+    return metricas.registro.exportar()['contadores'].get((nombre, tuple(sorted(etiquetas.items()))), 0)
+
+def test_extraccion_repartida_entre_procesos_da_el_mismo_resultado(tmp_path, capsys):
+    """
+    Un estado de cuenta largo extraído en un solo proceso o repartiendo sus
+    páginas entre varios da exactamente las mismas transacciones, en el mismo
+    orden, y las páginas que procesan los hijos se suman a las métricas.
+    """
+    df = generar_transacciones(1800, anio=2024, cuentas=('Yape',), semilla=2)['Yape']
+    paginas = 2 + -(-len(df) // FILAS_POR_PAGINA)
+    pdf = str(tmp_path / "estado.pdf")
+    escribir_estado_pdf(pdf, df, df['Fecha_Completa'].min(), df['Fecha_Completa'].max())
+
+    antes = _contador('paginas_procesadas_total')
+    secuencial = extraer_transacciones(pdf, max_workers=1)
+    assert _contador('paginas_procesadas_total') - antes == paginas
+
+    antes = _contador('paginas_procesadas_total')
+    repartida = extraer_transacciones(pdf, max_workers=2)
+    assert _contador('paginas_procesadas_total') - antes == paginas
+    assert "Repartiendo" in capsys.readouterr().out
+
+    pd.testing.assert_frame_equal(repartida, secuencial)
+    pd.testing.assert_frame_equal(secuencial, df, check_dtype=False)
+
+def test_paginas_sin_filas_se_saltan_y_se_recorta_la_tabla(tmp_path):
+    """
+    La portada (antes de la cabecera) cuenta como página sin cabecera; una
+    página intermedia de avisos y la de resumen, como páginas sin filas. El
+    texto fuera de la tabla (pie de página) no se mezcla con las transacciones.
+    """
+    x = COLUMNAS_X
+    cabecera = [(x['fecha'], 80, "FECHA"), (x['fecha_valor'], 80, "FECHA"), (x['descripcion'], 80, "DESCRIPCION"),
+                (x['cargos'], 80, "CARGOS/DEBE"), (x['abonos'], 80, "ABONOS/HABER")]
+    pdf = str(tmp_path / "estado.pdf")
+    escribir_pdf(pdf, [
+        [(40, 40, "ESTADO DE CUENTA DEL 01/03/2025 AL 31/03/2025")],
+        cabecera + [(x['fecha'], 100, "04MAR"), (x['fecha_valor'], 100, "04MAR"),
+                    (x['descripcion'], 100, "COMPRA PLAZA"), (x['cargos'], 100, "150.00"),
+                    (x['descripcion'], 700, "Total de la pagina"), (x['cargos'], 700, "150.00")],
+        [(40, 40, "AVISO IMPORTANTE"), (40, 60, "Consulte sus tasas en la web")],
+        [(x['fecha'], 100, "20MAR"), (x['fecha_valor'], 100, "20MAR"),
+         (x['descripcion'], 100, "ABONO"), (x['abonos'], 100, "1,250.50")],
+        [(40, 40, "RESUMEN"), (40, 60, "Total cargos 150.00")],
+    ])
+
+    sin_filas, sin_cabecera = _contador('paginas_saltadas_total', motivo='sin_filas'), \
+        _contador('paginas_saltadas_total', motivo='sin_cabecera')
+    df = extraer_transacciones(pdf)
+
+    assert df['DESCRIPCION'].tolist() == ['COMPRA PLAZA', 'ABONO']
+    assert df['CARGOS / DEBE'].tolist() == [15000, 0]
+    assert _contador('paginas_saltadas_total', motivo='sin_filas') - sin_filas == 2
+    assert _contador('paginas_saltadas_total', motivo='sin_cabecera') - sin_cabecera == 1
+
+    # La región analizada va de la cabecera a la última fila, sin el pie
+    with pdfplumber.open(pdf) as documento:
+        superior, inferior = _region_tabla(documento.pages[1].chars, {'descripcion': x['descripcion']})
+    assert superior < 80 and 100 < inferior < 700
+
+# --- Pruebas del procesador de carpetas ---
+
+def _carpeta_de_estados(carpeta):
+    """
+    Escribe tres estados de cuenta ('a.pdf', 'b.pdf', 'c.pdf') con partes
+    consecutivas de un mismo historial, más un PDF corrupto que va primero en
+    orden alfabético, y devuelve las transacciones esperadas en orden.
+    """
+    df = generar_transacciones(300, anio=2024, cuentas=('Yape',), semilla=4)['Yape']
+    partes = [df.iloc[len(df) * i // 3:len(df) * (i + 1) // 3] for i in range(3)]
+    for nombre, parte in zip('abc', partes):
+        escribir_estado_pdf(str(carpeta / f"{nombre}.pdf"), parte,
+                            parte['Fecha_Completa'].min(), parte['Fecha_Completa'].max())
+    (carpeta / "00roto.pdf").write_bytes(b"%PDF-1.4 esto no es un PDF valido")
+    return pd.concat([parte.assign(ESTADO=f"{nombre}.pdf") for nombre, parte in zip('abc', partes)],
+                     ignore_index=True)
+
+def _extraer_en_orden_inverso(ruta, csv_path=None, max_workers=1):
+    """Extrae un PDF tardando más cuanto antes va en orden alfabético."""
+    time.sleep({'a.pdf': 0.6, 'b.pdf': 0.3}.get(os.path.basename(ruta), 0))
+    return extraer_transacciones(ruta, csv_path, max_workers)
+
+def test_procesador_consolida_en_orden_aunque_terminen_desordenados(tmp_path, monkeypatch):
+    """
+    Con varios procesos, los PDFs terminan en otro orden pero el consolidado
+    sale siempre en orden alfabético de archivo, igual que en secuencia; un
+    PDF corrupto se reporta como error sin detener el resto del lote.
+    """
+    esperado = _carpeta_de_estados(tmp_path)
+    monkeypatch.setattr(procesador_anual, 'extraer_transacciones', _extraer_en_orden_inverso)
+
+    resultados = {}
+    for max_workers in (1, 4):
+        eventos = []
+        resultados[max_workers] = procesador_anual.procesar_carpeta_de_pdfs(
+            str(tmp_path), max_workers=max_workers, progreso=eventos.append)
+        terminados = [(e['archivo'], e['resultado']) for e in eventos if e['tipo'] == 'pdf']
+        assert dict(terminados) == {'00roto.pdf': 'error', 'a.pdf': 'extraido', 'b.pdf': 'extraido',
+                                    'c.pdf': 'extraido'}
+    assert [archivo for archivo, _ in terminados][-1] == 'a.pdf'
+
+    pd.testing.assert_frame_equal(resultados[4], resultados[1])
+    pd.testing.assert_frame_equal(resultados[1], esperado, check_dtype=False, check_categorical=False)
+
+def test_procesador_devuelve_el_consolidado_sin_escribir_en_la_carpeta(tmp_path):
+    """
+    El consolidado se devuelve en memoria: en la carpeta de PDFs no aparece
+    ningún CSV temporal, y la copia en CSV solo se escribe si se pide.
+    """
+    carpeta = tmp_path / "pdfs"
+    carpeta.mkdir()
+    esperado = _carpeta_de_estados(carpeta)
+    archivos = sorted(os.listdir(carpeta))
+
+    df = procesador_anual.procesar_carpeta_de_pdfs(str(carpeta), max_workers=1)
+    pd.testing.assert_frame_equal(df, esperado, check_dtype=False, check_categorical=False)
+    assert sorted(os.listdir(carpeta)) == archivos
+
+    copia = tmp_path / "consolidado.csv"
+    procesador_anual.procesar_carpeta_de_pdfs(str(carpeta), str(copia), max_workers=1)
+    assert sorted(os.listdir(carpeta)) == archivos
+    assert len(pd.read_csv(copia, sep=';')) == len(esperado)
+
+# --- Pruebas del intérprete de fechas ---
+
+def test_fechas_con_anio_del_periodo():
+    """
+    Los códigos día+mes aceptan SET y SEP, los inválidos quedan como NaT y en un
+    periodo que cruza de año los meses posteriores al final van al año anterior.
+    """
+    assert inferir_periodo("ESTADO DE CUENTA DEL 15/12/24 AL 14/01/25") == (2025, 1)
+    assert inferir_periodo("Sin periodo") is None
+
+    fechas = parsear_fechas(pd.Series(['20DIC', '05ENE', '04SET', '04SEP', '31FEB', 'xx']), 2025, 1)
+    esperadas = ['2024-12-20', '2025-01-05', '2024-09-04', '2024-09-04', None, None]
+    assert [f.strftime('%Y-%m-%d') if pd.notna(f) else None for f in fechas] == esperadas
+
+def test_montos_en_centimos_exactos():
+    """
+    Los montos en soles (número o texto) pasan a céntimos enteros sin errores de
+    redondeo y al exportar se vuelven a soles. La unidad siempre se indica: un
+    entero en soles no se confunde con céntimos, y unos céntimos con fracciones
+    se rechazan.
+    """
+    soles = pd.Series([0.1, 0.2, 1250.5, None])
+    assert a_centimos(soles, 'soles').tolist() == [10, 20, 125050, 0]
+    assert a_centimos(pd.Series(['0.1', '19.99', '']), 'soles').tolist() == [10, 1999, 0]
+    assert a_centimos(pd.Series([150, 20]), 'soles').tolist() == [15000, 2000]
+    assert a_centimos(pd.Series([150, 20]), 'centimos').tolist() == [150, 20]
+    assert a_centimos(pd.Series([150.0, None]), 'centimos').tolist() == [150, 0]
+    assert a_centimos(soles, 'soles').sum() == 125080
+    with pytest.raises(ValueError):
+        a_centimos(soles, 'centimos')
+
+    df = pd.DataFrame({'CARGOS / DEBE': a_centimos(soles, 'soles'), 'ABONOS / HABER': [0] * 4})
+    assert en_soles(df)['CARGOS / DEBE'].tolist() == [0.1, 0.2, 1250.5, 0.0]
+
+def test_familia_y_categoria_del_almacen_son_categorias():
+    """
+    La tabla que se publica lleva la familia y la categoría como categorías,
+    que ocupan una fracción de la memoria de las mismas columnas como texto.
+    """
+    descripciones = ['Pago YAPE a 987654321', 'Pago YAPE de 912345678', 'PLAZA VEA SURCO',
+                     'CLAR123456', 'Netflix.com']
+    df = pd.DataFrame({
+        'FECHA': '15JUL', 'DESCRIPCION': descripciones * 400,
+        'CARGOS / DEBE': 1000, 'ABONOS / HABER': 0, 'CUENTA_ORIGEN': 'Yape',
+    })
+    tabla = _tabla_almacen(df)
+
+    assert isinstance(tabla['FAMILIA'].dtype, pd.CategoricalDtype)
+    assert isinstance(tabla['CATEGORIA'].dtype, pd.CategoricalDtype)
+    assert tabla['CATEGORIA'].iloc[2] == 'Comida y Restaurantes'
+    columnas = ['FAMILIA', 'CATEGORIA']
+    compacta = tabla[columnas].memory_usage(deep=True).sum()
+    como_texto = tabla[columnas].astype(object).memory_usage(deep=True).sum()
+    assert compacta * 4 < como_texto
+
+# --- Pruebas del motor de conciliación ---
+
+def _transferencias(cuenta, filas):
+    """Crea un DataFrame de transferencias a partir de tuplas (fecha, cargo, abono), en céntimos."""
+    df = pd.DataFrame(filas, columns=['Fecha_Completa', 'CARGOS / DEBE', 'ABONOS / HABER'])
+    df['Fecha_Completa'] = pd.to_datetime(df['Fecha_Completa'])
+    df['CUENTA_ORIGEN'] = cuenta
+    df['DESCRIPCION'] = 'TRAN.CTAS.PROP.BM'
+    return df
+
+def test_conciliacion_uno_a_uno_con_montos_repetidos():
+    """
+    Dos salidas iguales el mismo día solo pueden enlazarse con las dos entradas
+    equivalentes; la tercera queda huérfana.
+    """
+    yape = _transferencias('Yape', [('2025-01-05', 5000, 0), ('2025-01-05', 5000, 0), ('2025-01-05', 5000, 0)])
+    ahorro = _transferencias('Ahorro', [('2025-01-05', 0, 5000), ('2025-01-05', 0, 5000), ('2025-01-06', 0, 5000)])
+
+    enlazadas, huerfanas_yape, huerfanas_ahorro = conciliar_transferencias(yape, ahorro)
+
+    assert list(enlazadas['INDICE_A']) == [0, 1]
+    assert list(enlazadas['INDICE_B']) == [0, 1]
+    assert set(enlazadas['SENTIDO']) == {'Yape -> Ahorro'}
+    assert list(huerfanas_yape.index) == [2]
+    assert list(huerfanas_ahorro.index) == [2]
+
+def test_conciliacion_con_tolerancia_de_un_dia():
+    """Con tolerancia, un abono registrado al día siguiente también se enlaza."""
+    yape = _transferencias('Yape', [('2025-01-05', 0, 30)])
+    ahorro = _transferencias('Ahorro', [('2025-01-06', 30, 0)])
+
+    enlazadas, _, _ = conciliar_transferencias(yape, ahorro)
+    assert enlazadas.empty
+
+    enlazadas, huerfanas_yape, huerfanas_ahorro = conciliar_transferencias(yape, ahorro, tolerancia_dias=1)
+    assert list(enlazadas['SENTIDO']) == ['Ahorro -> Yape']
+    assert enlazadas['MONTO'].iloc[0] == 0.3
+    assert huerfanas_yape.empty and huerfanas_ahorro.empty
+
+def test_conciliacion_entre_cualquier_par_de_cuentas():
+    """
+    Con tres cuentas se enlazan las transferencias de cada par; una salida ya
+    enlazada con una cuenta no vuelve a usarse con otra.
+    """
+    yape = _transferencias('Yape', [('2025-03-01', 8000, 0), ('2025-03-02', 0, 2000)])
+    ahorro = _transferencias('Ahorro', [('2025-03-01', 0, 8000), ('2025-03-03', 4500, 0)])
+    cts = _transferencias('CTS', [('2025-03-01', 0, 8000), ('2025-03-02', 2000, 0), ('2025-03-03', 0, 4500)])
+
+    enlazadas, huerfanas = conciliar_cuentas({'Yape': yape, 'Ahorro': ahorro, 'CTS': cts})
+
+    assert sorted(enlazadas['SENTIDO']) == ['Ahorro -> CTS', 'CTS -> Yape', 'Yape -> Ahorro']
+    assert huerfanas['Yape'].empty and huerfanas['Ahorro'].empty
+    assert list(huerfanas['CTS'].index) == [0]
+
+# --- Pruebas de las categorías y los resúmenes ---
+
+def test_categorias_respetan_el_orden_de_las_reglas():
+    """
+    Gana la primera regla que encaje aunque otra aparezca antes en el texto,
+    igual que la cadena de expresiones del antiguo dashboard.
+    """
+    descripciones = pd.Series(['UBER viaje con claro', 'Plaza Vea', 'clínica San Borja', '', None])
+    categorias, reglas = categorizar(descripciones)
+    assert list(categorias) == ['Servicios Básicos', 'Comida y Restaurantes', 'Salud', 'Otros Gastos', 'Otros Gastos']
+    assert list(reglas) == [0, 2, 4, len(REGLAS_CATEGORIAS), len(REGLAS_CATEGORIAS)]
+
+def test_recategoriza_solo_las_transacciones_afectadas(tmp_path):
+    """
+    Al cambiar una regla solo se reevalúan las transacciones asignadas a ella o
+    a reglas posteriores; sin cambios no se toca el almacén.
+    """
+    ruta_db = str(tmp_path / "reporte.db")
+    df = pd.DataFrame({
+        'FECHA': ['01ENE', '02ENE', '03ENE'],
+        'DESCRIPCION': ['LUZ DEL SUR', 'NETFLIX.COM', 'GIMNASIO SMART FIT'],
+        'CARGOS / DEBE': [8000, 4500, 12000],
+        'ABONOS / HABER': [0, 0, 0],
+        'CUENTA_ORIGEN': 'Yape',
+        'Fecha_Completa': pd.to_datetime(['2025-01-01', '2025-01-02', '2025-01-03']),
+    })
+    guardar_reporte(df, ruta_db)
+    assert actualizar_categorias(ruta_db) == 0
+
+    reglas = list(REGLAS_CATEGORIAS)
+    posicion_salud = [categoria for categoria, _ in reglas].index('Salud')
+    reglas[posicion_salud] = ('Salud', reglas[posicion_salud][1] + '|gimnasio')
+    # Netflix y la luz encajan en reglas anteriores a la modificada
+    assert actualizar_categorias(ruta_db, reglas) == 1
+
+    transacciones, _ = leer_transacciones(ruta_db)
+    assert [t['CATEGORIA'] for t in transacciones] == ['Servicios Básicos', 'Suscripciones y Digital', 'Salud']
+    assert actualizar_categorias(ruta_db, reglas) == 0
+    # El resumen por categoría se corrige con la diferencia
+    assert leer_resumen(ruta_db, resumenes.totales_por_categoria) == [
+        {'categoria': 'Salud', 'total': 120.0, 'transacciones': 1},
+        {'categoria': 'Servicios Básicos', 'total': 80.0, 'transacciones': 1},
+        {'categoria': 'Suscripciones y Digital', 'total': 45.0, 'transacciones': 1},
+    ]
+
+def _resumen_recorriendo_transacciones(ruta_db):
+    """
+    Resumen del dashboard calculado con pandas sobre todas las transacciones
+    publicadas, como referencia para los resúmenes materializados.
+    """
+    conexion = sqlite3.connect(ruta_db)
+    try:
+        df = pd.read_sql_query("SELECT * FROM transacciones WHERE FECHA_ISO IS NOT NULL ORDER BY id", conexion)
+    finally:
+        conexion.close()
+
+    def soles(centimos):
+        return round(float(centimos) / 100, 2)
+
+    cargos, abonos = df['CARGOS / DEBE'], df['ABONOS / HABER']
+    gastos = df[cargos > 0]
+    mensual = df.groupby(df['FECHA_ISO'].str[:7])[['ABONOS / HABER', 'CARGOS / DEBE']].sum()
+    cuentas = (cargos + abonos).groupby(df['CUENTA_ORIGEN']).sum()
+
+    def top(columna):
+        totales = df[df[columna] > 0].groupby('FAMILIA')[columna].sum()
+        orden = sorted(totales.items(), key=lambda par: (-par[1], par[0]))[:5]
+        return [{'descripcion': familia, 'total': soles(total)} for familia, total in orden]
+
+    categorias = gastos.groupby('CATEGORIA').agg(
+        total=('CARGOS / DEBE', 'sum'), cantidad=('CARGOS / DEBE', 'count'), desde=('FECHA_ISO', 'min'))
+    categorias = categorias.reset_index().sort_values(['total', 'desde', 'CATEGORIA'], ascending=[False, True, True])
+
+    # Igual que el antiguo dashboard: la varianza divide entre todas las transacciones
+    media = gastos['CARGOS / DEBE'].sum() / len(gastos)
+    umbral = media + 2 * (((gastos['CARGOS / DEBE'] - media) ** 2).sum() / len(df)) ** 0.5
+    atipicos = df[cargos > umbral].sort_values('CARGOS / DEBE', ascending=False, kind='stable')
+    return {
+        'totales': {
+            'total_ingresos': soles(abonos.sum()), 'total_gastos': soles(cargos.sum()),
+            'balance_neto': soles(abonos.sum() - cargos.sum()), 'num_transacciones': len(df),
+            'desde': df['FECHA_ISO'].min(), 'hasta': df['FECHA_ISO'].max(),
+            'mayor_ingreso': soles(abonos.max()), 'mayor_gasto': soles(cargos.max()),
+        },
+        'mensual': [
+            {'mes': mes, 'ingresos': soles(fila['ABONOS / HABER']), 'gastos': soles(fila['CARGOS / DEBE'])}
+            for mes, fila in mensual.iterrows()
+        ],
+        'por_cuenta': [{'cuenta': cuenta, 'total': soles(total)} for cuenta, total in cuentas.items()],
+        'top_ingresos': top('ABONOS / HABER'),
+        'top_gastos': top('CARGOS / DEBE'),
+        'categorias': [
+            {'categoria': fila.CATEGORIA, 'total': soles(fila.total), 'transacciones': fila.cantidad}
+            for fila in categorias.itertuples()
+        ],
+        'atipicos': {
+            'umbral': soles(umbral),
+            'transacciones': [
+                {'fecha': fecha, 'descripcion': descripcion, 'monto': soles(monto)}
+                for fecha, descripcion, monto in zip(atipicos['FECHA'], atipicos['DESCRIPCION'], atipicos['CARGOS / DEBE'])
+            ],
+        },
+    }
+
+def test_resumenes_incrementales_por_estado_de_cuenta(tmp_path):
+    """
+    Al volver a publicar el reporte, los resúmenes materializados solo suman
+    los estados de cuenta nuevos o modificados y restan los que desaparecen, y
+    coinciden con lo que se calcula recorriendo todas las transacciones.
+    """
+    ruta_db = str(tmp_path / "reporte.db")
+    cuentas = generar_transacciones(3000, semilla=3)
+    df = pd.concat([df.assign(CUENTA_ORIGEN=cuenta) for cuenta, df in cuentas.items()], ignore_index=True)
+    df = df.sort_values('Fecha_Completa', kind='stable', ignore_index=True)
+    df['ESTADO'] = df['Fecha_Completa'].dt.strftime('%Y-%m.pdf')
+
+    def comprobar():
+        esperado = _resumen_recorriendo_transacciones(ruta_db)
+        obtenido = leer_resumen(ruta_db)
+        for clave in ('totales', 'mensual', 'top_ingresos', 'top_gastos', 'categorias', 'atipicos'):
+            assert obtenido[clave] == esperado[clave], clave
+        assert sorted(obtenido['por_cuenta'], key=str) == sorted(esperado['por_cuenta'], key=str)
+
+    guardar_reporte(df, ruta_db)
+    comprobar()
+
+    # Desaparece un estado de cuenta y cambia un monto de otro
+    df = df[df['ESTADO'] != '2025-03.pdf'].reset_index(drop=True)
+    df.loc[df.index[df['ESTADO'] == '2025-05.pdf'][0], 'CARGOS / DEBE'] += 1_000_000
+    guardar_reporte(df, ruta_db)
+    comprobar()
+    assert leer_resumen(ruta_db)['totales']['mayor_gasto'] >= 10000
+
+def test_actualizar_estados_equivale_a_publicar_todo(tmp_path):
+    """
+    Reemplazar solo los estados de cuenta que cambian (uno nuevo, uno
+    modificado y uno eliminado) deja el almacén igual que publicar el reporte
+    completo: mismas transacciones en orden cronológico, mismos resúmenes y
+    mismo índice de búsqueda.
+    """
+    from almacen import actualizar_estados
+
+    cuentas = generar_transacciones(3000, semilla=5)
+    df = pd.concat([df.assign(CUENTA_ORIGEN=cuenta) for cuenta, df in cuentas.items()], ignore_index=True)
+    df = df.sort_values('Fecha_Completa', kind='stable', ignore_index=True)
+    df['ESTADO'] = df['Fecha_Completa'].dt.strftime('%Y-%m.pdf')
+
+    def estado(cuenta, nombre):
+        return (df['CUENTA_ORIGEN'] == cuenta) & (df['ESTADO'] == nombre)
+
+    incremental = str(tmp_path / "incremental.db")
+    guardar_reporte(df[~estado('Yape', '2025-04.pdf')], incremental)
+
+    modificado = df[estado('Ahorro', '2025-06.pdf')].iloc[1:].copy()
+    modificado.iloc[0, modificado.columns.get_loc('CARGOS / DEBE')] += 777
+    cambios = pd.concat([df[estado('Yape', '2025-04.pdf')], modificado])
+    actualizar_estados(cambios, [('Yape', '2025-04.pdf'), ('Ahorro', '2025-06.pdf'), ('Yape', '2025-09.pdf')],
+                       incremental)
+
+    final = pd.concat([df[~estado('Ahorro', '2025-06.pdf') & ~estado('Yape', '2025-09.pdf')], modificado])
+    completo = str(tmp_path / "completo.db")
+    guardar_reporte(final.sort_values('Fecha_Completa', kind='stable'), completo)
+
+    def transacciones(ruta_db):
+        filas, _ = leer_transacciones(ruta_db)
+        assert [t['FECHA_ISO'] for t in filas] == sorted(t['FECHA_ISO'] for t in filas)
+        return sorted(tuple(map(str, t.values())) for t in filas)
+
+    def indice(ruta_db):
+        conexion = sqlite3.connect(ruta_db)
+        try:
+            return conexion.execute("SELECT TOKEN, DESCRIPCION FROM indice_tokens ORDER BY 1, 2").fetchall()
+        finally:
+            conexion.close()
+
+    assert transacciones(incremental) == transacciones(completo)
+    assert leer_resumen(incremental) == leer_resumen(completo)
+    assert indice(incremental) == indice(completo)
+    # Sin cambios en los estados indicados no se resta ni suma nada
+    actualizar_estados(final[final['ESTADO'] == '2025-01.pdf'], [('Yape', '2025-01.pdf')], incremental)
+    assert transacciones(incremental) == transacciones(completo)
+
+def test_reagrupa_familias_al_cambiar_sus_reglas(tmp_path):
+    """
+    Al cambiar las reglas de familias se actualizan solo las transacciones que
+    cambian de familia y el resumen por familias coincide con el recalculado;
+    sin cambios no se toca el almacén. Publicar con reglas nuevas rehace los
+    resúmenes.
+    """
+    import agregaciones
+
+    ruta_db = str(tmp_path / "reporte.db")
+    cuentas = generar_transacciones(1500, semilla=4)
+    df = pd.concat([df.assign(CUENTA_ORIGEN=cuenta) for cuenta, df in cuentas.items()], ignore_index=True)
+    guardar_reporte(df, ruta_db)
+    assert actualizar_familias(ruta_db) == 0
+
+    reglas = agregaciones.REGLAS_NORMALIZACION + [(re.compile(r'^\S+'), 'Primera palabra')]
+    afectadas = actualizar_familias(ruta_db, reglas)
+    assert afectadas > 0
+    assert actualizar_familias(ruta_db, reglas) == 0
+
+    esperado = _resumen_recorriendo_transacciones(ruta_db)
+    obtenido = leer_resumen(ruta_db)
+    assert obtenido['top_ingresos'] == esperado['top_ingresos']
+    assert obtenido['top_gastos'] == esperado['top_gastos']
+    assert obtenido['top_gastos'][0]['descripcion'] == 'Primera palabra'
+
+    # Al volver a publicar con las reglas originales, las familias se rehacen desde cero
+    guardar_reporte(df, ruta_db)
+    assert leer_resumen(ruta_db)['top_gastos'] == _resumen_recorriendo_transacciones(ruta_db)['top_gastos']
+    assert leer_resumen(ruta_db)['top_gastos'][0]['descripcion'] != 'Primera palabra'
+
+def test_normalizacion_de_descripciones_como_en_el_dashboard():
+    """Las reglas de agrupación replican las del antiguo getTop5 del frontend."""
+    descripciones = pd.Series(['Pago YAPE de 19170', 'pago yape a 55', 'CLAR123 recarga', 'WOW0020240762146',
+                               'ABON PLIN-LIDIA EB *', '', None, 'PLAZA VEA'])
+    assert list(normalizar_descripciones(descripciones)) == [
+        'Pago YAPE a Terceros', 'Pago YAPE a Terceros', 'Servicios (Claro) recarga', 'Suscripción (WOW)',
+        'Recepción PLIN', 'Sin descripción', 'Sin descripción', 'PLAZA VEA',
+    ]
+
+# --- Pruebas del registro de métricas ---
+
+def test_metricas_de_otro_proceso_se_fusionan():
+    """Lo exportado por un proceso hijo se suma al registro principal, contadores e histogramas."""
+    principal, hijo = RegistroMetricas(), RegistroMetricas()
+    principal.incrementar('paginas_saltadas_total', motivo='sin_filas')
+    principal.observar('duracion_segundos', 0.2, etapa='pdf')
+    hijo.incrementar('paginas_saltadas_total', 2, motivo='sin_filas')
+    hijo.observar('duracion_segundos', 3.0, etapa='pdf')
+
+    principal.fusionar(hijo.exportar())
+    texto = principal.formato_prometheus()
+
+    assert 'analisis_paginas_saltadas_total{motivo="sin_filas"} 3' in texto
+    assert 'analisis_duracion_segundos_bucket{etapa="pdf",le="0.25"} 1' in texto
+    assert 'analisis_duracion_segundos_bucket{etapa="pdf",le="+Inf"} 2' in texto
+    assert 'analisis_duracion_segundos_sum{etapa="pdf"} 3.200000' in texto
+
+def test_proceso_hijo_no_usa_el_cerrojo_heredado_de_metricas():
+    """
+    Aunque otro hilo tenga tomado el cerrojo del registro al crear el pool, los
+    procesos hijos miden con su propio registro en lugar de bloquearse.
+    """
+    pool = ProcessPoolExecutor(max_workers=1, initializer=metricas.iniciar_proceso_hijo)
+    try:
+        with metricas.registro._lock:
+            futuro = pool.submit(metricas.ejecutar_con_metricas, metricas.incrementar, 'pdfs_cache_total')
+            _, exportadas = futuro.result(timeout=30)
+    finally:
+        # Si el hijo se hubiera bloqueado, no se le espera
+        for proceso in list(pool._processes.values()):
+            proceso.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+    assert exportadas['contadores'] == {('pdfs_cache_total', ()): 1}
+
+# --- Pruebas del observador de carpetas ---
+
+def test_observador_agrupa_cambios_hasta_que_las_carpetas_se_estabilizan(tmp_path):
+    """
+    Una ráfaga de copias se notifica una sola vez, cuando la carpeta lleva el
+    tiempo de espera sin cambios, y después se detectan las eliminaciones.
+    """
+    carpeta = tmp_path / "yape"
+    carpeta.mkdir()
+    notificados = []
+    observador = ObservadorCarpetas([str(carpeta), str(tmp_path / "no_existe")],
+                                    lambda cambios, instantanea: notificados.append(cambios), espera=5)
+
+    assert observador.revisar(ahora=0) is None
+    (carpeta / "enero.pdf").write_bytes(b"%PDF enero")
+    assert observador.revisar(ahora=1) is None
+    (carpeta / "febrero.pdf").write_bytes(b"%PDF febrero")
+    (carpeta / "notas.txt").write_text("no es un PDF")
+    assert observador.revisar(ahora=4) is None
+    assert observador.revisar(ahora=8) is None      # solo 4 s sin cambios
+    cambios = observador.revisar(ahora=10)
+
+    assert [os.path.basename(r) for r in cambios['anadidos']] == ['enero.pdf', 'febrero.pdf']
+    assert notificados == [cambios]
+    assert observador.revisar(ahora=30) is None     # nada nuevo
+
+    (carpeta / "enero.pdf").unlink()
+    observador.revisar(ahora=31)
+    cambios = observador.revisar(ahora=40)
+    assert [os.path.basename(r) for r in cambios['eliminados']] == ['enero.pdf']
+    assert cambios['anadidos'] == [] and len(notificados) == 2
+
+def test_observador_arranca_desde_el_escaneo_del_reporte_publicado(tmp_path):
+    """
+    Si el reporte publicado salió de un escaneo de las carpetas, al arrancar
+    solo se notifica lo que cambió desde entonces (y nada si no cambió nada),
+    junto con el escaneo en el que ya están aplicados esos cambios.
+    """
+    carpeta = tmp_path / "yape"
+    carpeta.mkdir()
+    (carpeta / "enero.pdf").write_bytes(b"%PDF enero")
+    (carpeta / "febrero.pdf").write_bytes(b"%PDF febrero")
+    publicado = escanear([str(carpeta)])
+    notificados = []
+
+    def al_cambiar(cambios, instantanea):
+        notificados.append((cambios, instantanea))
+
+    sin_cambios = ObservadorCarpetas([str(carpeta)], al_cambiar, espera=5, procesado=publicado)
+    assert sin_cambios.revisar(ahora=0) is None
+    assert sin_cambios.revisar(ahora=10) is None and notificados == []
+
+    (carpeta / "marzo.pdf").write_bytes(b"%PDF marzo")
+    observador = ObservadorCarpetas([str(carpeta)], al_cambiar, espera=5, procesado=publicado)
+    observador.revisar(ahora=0)
+    cambios = observador.revisar(ahora=10)
+    assert [os.path.basename(r) for r in cambios['anadidos']] == ['marzo.pdf']
+    assert cambios['modificados'] == [] and cambios['eliminados'] == []
+    assert notificados == [(cambios, escanear([str(carpeta)]))]
+
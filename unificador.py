@@ -1,43 +1,94 @@
 import pandas as pd
 import os
 
+from conciliador import conciliar_cuentas
+from esquema import COLUMNAS_MONTO, a_centimos, a_soles, en_soles, leer_csv_en_centimos
+from fechas import parsear_fechas
+import metricas
+
 try:
     from extractor import analizar_reporte_consolidado
 except ImportError:
     print("⚠️  Advertencia: No se pudo encontrar el archivo 'extractor.py'. Se continuará sin el análisis detallado.")
-    def analizar_reporte_consolidado(csv_path):
-        print(f"-> El análisis detallado no se ejecutó porque falta 'extractor.py', pero el archivo consolidado '{csv_path}' ha sido creado.")
+    def analizar_reporte_consolidado(datos):
+        print("-> El análisis detallado no se ejecutó porque falta 'extractor.py', pero el reporte consolidado ha sido creado.")
+
+COLUMNAS_FINALES = ['FECHA', 'DESCRIPCION', 'CARGOS / DEBE', 'ABONOS / HABER', 'CUENTA_ORIGEN']
+
+def _cargar_reporte(origen):
+    """
+    Acepta un DataFrame ya consolidado en memoria (montos en céntimos), la ruta
+    de un CSV consolidado (montos en soles) o None (cuenta sin transacciones) y
+    devuelve siempre un DataFrame propio, con los montos en céntimos.
+    """
+    if origen is None:
+        df = pd.DataFrame(columns=COLUMNAS_FINALES[:-1])
+    elif isinstance(origen, pd.DataFrame):
+        df = origen.copy()
+    else:
+        df = leer_csv_en_centimos(origen)
+    for columna in COLUMNAS_MONTO:
+        df[columna] = a_centimos(df[columna], 'centimos')
+    if 'Fecha_Completa' in df.columns:
+        df['Fecha_Completa'] = pd.to_datetime(df['Fecha_Completa'], errors='coerce')
+    return df
 
-def unificar_y_conciliar_reportes(csv_yape, csv_ahorro, archivo_salida_final):
+def _imprimir_huerfanas(huerfanas):
+    """Muestra una línea por cada transferencia sin pareja."""
+    filas = zip(huerfanas['Fecha_Completa'], huerfanas['DESCRIPCION'],
+                huerfanas['CARGOS / DEBE'], huerfanas['ABONOS / HABER'])
+    for fecha, descripcion, cargo, abono in filas:
+        tipo = "Salida" if cargo > 0 else "Entrada"
+        monto = a_soles(cargo if tipo == "Salida" else abono)
+        fecha_str = fecha.strftime('%d/%m/%Y') if pd.notnull(fecha) else "Fecha Inválida"
+        print(f"     - {tipo} de S/ {monto:.2f} el {fecha_str} (Descripción: {descripcion})")
+
+def unificar_y_conciliar_cuentas(reportes, archivo_salida_final=None, tolerancia_dias=0,
+                                 anio_por_defecto=None):
     """
-    Carga reportes de dos cuentas, realiza una conciliación de las transferencias
-    entre ellas, muestra un resumen y consolida las transacciones externas en un único archivo.
+    Recibe los reportes de las cuentas propias como diccionario {cuenta: reporte}
+    (DataFrames en memoria con los montos en céntimos, o rutas de CSV en soles),
+    concilia las transferencias entre cualquier par de ellas, muestra un resumen
+    y devuelve las transacciones externas consolidadas en un único DataFrame
+    con el esquema compacto (montos en céntimos, cuenta y código de fecha como
+    categorías). Si se indica `archivo_salida_final`, además se exporta a CSV
+    (en soles).
+    `tolerancia_dias` permite enlazar transferencias que el banco registró en
+    días distintos en cada cuenta (por ejemplo, 1 para abonos al día siguiente).
+
+    Se usa la 'Fecha_Completa' que trae cada transacción desde el extractor; las
+    que no la tienen (p. ej. CSVs antiguos) se fechan con `anio_por_defecto`
+    (por defecto, el año en curso).
     """
     print("🚀 Iniciando el Conciliador de Cuentas 🚀")
     
     try:
-        df_yape = pd.read_csv(csv_yape, sep=';')
-        df_ahorro = pd.read_csv(csv_ahorro, sep=';')
-        print("   -> Archivos CSV cargados correctamente.")
+        cargados = {cuenta: _cargar_reporte(origen) for cuenta, origen in reportes.items()}
+        print("   -> Reportes cargados correctamente.")
     except FileNotFoundError as e:
         print(f"❌ Error: No se pudo encontrar uno de los archivos CSV. Detalle: {e}")
-        return
+        return None
+
+    if all(df.empty for df in cargados.values()):
+        print("❌ Error: No hay transacciones en ninguna de las cuentas.")
+        return None
 
     # --- 1. PREPARACIÓN Y ESTANDARIZACIÓN DE DATOS ---
-    df_yape['CUENTA_ORIGEN'] = 'Yape'
-    df_ahorro['CUENTA_ORIGEN'] = 'Ahorro'
-    df_total = pd.concat([df_yape, df_ahorro], ignore_index=True)
-    
-    # --- CORRECCIÓN CLAVE ---
-    # Se añade 'SET': 'SEP' para manejar la abreviatura de Septiembre de tus archivos.
-    meses_es = {
-        'ENE': 'JAN', 'FEB': 'FEB', 'MAR': 'MAR', 'ABR': 'APR', 'MAY': 'MAY', 'JUN': 'JUN',
-        'JUL': 'JUL', 'AGO': 'AUG', 'SET': 'SEP', 'SEP': 'SEP', 'OCT': 'OCT', 'NOV': 'NOV', 'DIC': 'DEC'
-    }
-    df_total['FECHA_TEMP'] = df_total['FECHA'].str.strip() + '2025'
-    for mes_es, mes_en in meses_es.items():
-        df_total['FECHA_TEMP'] = df_total['FECHA_TEMP'].str.replace(mes_es, mes_en, regex=False)
-    df_total['Fecha_Completa'] = pd.to_datetime(df_total['FECHA_TEMP'], format='%d%b%Y', errors='coerce')
+    for cuenta, df in cargados.items():
+        df['CUENTA_ORIGEN'] = cuenta
+    df_total = pd.concat(cargados.values(), ignore_index=True)
+    # Cuenta y código de fecha se repiten mucho: como categorías ocupan una fracción
+    df_total['CUENTA_ORIGEN'] = pd.Categorical(df_total['CUENTA_ORIGEN'], categories=list(cargados))
+    df_total['FECHA'] = df_total['FECHA'].astype('category')
+    if 'ESTADO' in df_total.columns:
+        df_total['ESTADO'] = df_total['ESTADO'].astype('category')
+
+    # Solo se deducen las fechas que no vienen ya calculadas del extractor
+    if 'Fecha_Completa' not in df_total.columns:
+        df_total['Fecha_Completa'] = pd.Series(pd.NaT, index=df_total.index, dtype='datetime64[ns]')
+    sin_fecha = df_total['Fecha_Completa'].isna()
+    if sin_fecha.any():
+        df_total.loc[sin_fecha, 'Fecha_Completa'] = parsear_fechas(df_total.loc[sin_fecha, 'FECHA'], anio_por_defecto)
 
     # --- 2. AISLAR Y CONCILIAR TRANSFERENCIAS INTERNAS ---
     print("\n" + "="*50)
@@ -45,61 +96,37 @@ def unificar_y_conciliar_reportes(csv_yape, csv_ahorro, archivo_salida_final):
     print("="*50)
     
     transferencias = df_total[df_total['DESCRIPCION'].str.contains('TRAN.CTAS.PROP.BM', na=False)].copy()
-    
-    yape_transfers = transferencias[transferencias['CUENTA_ORIGEN'] == 'Yape'].copy()
-    ahorro_transfers = transferencias[transferencias['CUENTA_ORIGEN'] == 'Ahorro'].copy()
+    por_cuenta = {cuenta: transferencias[transferencias['CUENTA_ORIGEN'] == cuenta] for cuenta in cargados}
 
-    print(f"\nTotal de transferencias candidatas en 'Yape': {len(yape_transfers)}")
-    print(f"Total de transferencias candidatas en 'Ahorro': {len(ahorro_transfers)}")
+    print()
+    for cuenta, transfers in por_cuenta.items():
+        print(f"Total de transferencias candidatas en '{cuenta}': {len(transfers)}")
     
-    enlazadas = []
-    indices_enlazados_yape = set()
-    indices_enlazados_ahorro = set()
-
-    for idx_y, yape_row in yape_transfers.iterrows():
-        for idx_a, ahorro_row in ahorro_transfers.iterrows():
-            if idx_y in indices_enlazados_yape or idx_a in indices_enlazados_ahorro: continue
-            
-            if yape_row['Fecha_Completa'] == ahorro_row['Fecha_Completa'] and pd.notnull(yape_row['Fecha_Completa']):
-                if yape_row['CARGOS / DEBE'] == ahorro_row['ABONOS / HABER'] and yape_row['CARGOS / DEBE'] > 0:
-                    enlazadas.append(f"   - [Yape -> Ahorro] de S/ {yape_row['CARGOS / DEBE']:.2f} el {yape_row['Fecha_Completa'].strftime('%d/%m/%Y')}")
-                    indices_enlazados_yape.add(idx_y)
-                    indices_enlazados_ahorro.add(idx_a)
-                    break
-                elif yape_row['ABONOS / HABER'] == ahorro_row['CARGOS / DEBE'] and yape_row['ABONOS / HABER'] > 0:
-                    enlazadas.append(f"   - [Ahorro -> Yape] de S/ {yape_row['ABONOS / HABER']:.2f} el {yape_row['Fecha_Completa'].strftime('%d/%m/%Y')}")
-                    indices_enlazados_yape.add(idx_y)
-                    indices_enlazados_ahorro.add(idx_a)
-                    break
+    with metricas.medir('conciliacion', candidatas=len(transferencias), cuentas=len(por_cuenta)):
+        enlazadas, huerfanas = conciliar_cuentas(por_cuenta, tolerancia_dias=tolerancia_dias)
+    metricas.incrementar('transferencias_enlazadas_total', len(enlazadas))
+    for cuenta, filas in huerfanas.items():
+        metricas.incrementar('transferencias_huerfanas_total', len(filas), cuenta=cuenta)
 
     # --- 3. MOSTRAR REPORTE DE CONCILIACIÓN EN PANTALLA ---
     print("\n✅ Transferencias Enlazadas Correctamente:")
-    if enlazadas:
-        for e in sorted(enlazadas): print(e)
+    if not enlazadas.empty:
+        lineas = [
+            f"   - [{par.SENTIDO}] de S/ {par.MONTO:.2f} el {par.FECHA_A.strftime('%d/%m/%Y')}"
+            for par in enlazadas.itertuples(index=False)
+        ]
+        for linea in sorted(lineas): print(linea)
     else:
         print("   - Ninguna.")
 
     print("\n❌ Transferencias 'Huérfanas' (sin par encontrado):")
     
-    huerfanas_yape = yape_transfers.drop(list(indices_enlazados_yape))
-    if not huerfanas_yape.empty:
-        print("   En Cuenta Yape:")
-        for _, row in huerfanas_yape.iterrows():
-            tipo = "Salida" if row['CARGOS / DEBE'] > 0 else "Entrada"
-            monto = row['CARGOS / DEBE'] if tipo == "Salida" else row['ABONOS / HABER']
-            fecha_str = row['Fecha_Completa'].strftime('%d/%m/%Y') if pd.notnull(row['Fecha_Completa']) else "Fecha Inválida"
-            print(f"     - {tipo} de S/ {monto:.2f} el {fecha_str} (Descripción: {row['DESCRIPCION']})")
-            
-    huerfanas_ahorro = ahorro_transfers.drop(list(indices_enlazados_ahorro))
-    if not huerfanas_ahorro.empty:
-        print("   En Cuenta de Ahorro:")
-        for _, row in huerfanas_ahorro.iterrows():
-            tipo = "Salida" if row['CARGOS / DEBE'] > 0 else "Entrada"
-            monto = row['CARGOS / DEBE'] if tipo == "Salida" else row['ABONOS / HABER']
-            fecha_str = row['Fecha_Completa'].strftime('%d/%m/%Y') if pd.notnull(row['Fecha_Completa']) else "Fecha Inválida"
-            print(f"     - {tipo} de S/ {monto:.2f} el {fecha_str} (Descripción: {row['DESCRIPCION']})")
+    for cuenta, filas in huerfanas.items():
+        if not filas.empty:
+            print(f"   En la cuenta {cuenta}:")
+            _imprimir_huerfanas(filas)
     
-    if huerfanas_yape.empty and huerfanas_ahorro.empty:
+    if all(filas.empty for filas in huerfanas.values()):
         print("   - Ninguna. ¡Conciliación perfecta!")
         
     print("="*50)
@@ -113,13 +140,28 @@ def unificar_y_conciliar_reportes(csv_yape, csv_ahorro, archivo_salida_final):
     
     df_limpio_ordenado = df_limpio.sort_values(by='Fecha_Completa').reset_index(drop=True)
     
-    columnas_finales = ['FECHA', 'DESCRIPCION', 'CARGOS / DEBE', 'ABONOS / HABER', 'CUENTA_ORIGEN']
-    df_final = df_limpio_ordenado[columnas_finales]
+    # La fecha ya interpretada y el estado de cuenta de origen acompañan al
+    # reporte para el almacén, pero no se exportan al CSV
+    adicionales = [columna for columna in ('Fecha_Completa', 'ESTADO') if columna in df_limpio_ordenado.columns]
+    df_final = df_limpio_ordenado[COLUMNAS_FINALES + adicionales]
 
-    df_final.to_csv(archivo_salida_final, index=False, sep=';', decimal='.')
-    print(f"\n🎉 ¡Proceso completado! Reporte maestro limpio guardado en '{archivo_salida_final}' 🎉")
+    if archivo_salida_final:
+        en_soles(df_final[COLUMNAS_FINALES]).to_csv(archivo_salida_final, index=False, sep=';', decimal='.')
+        print(f"\n🎉 ¡Proceso completado! Reporte maestro limpio guardado en '{archivo_salida_final}' 🎉")
+    else:
+        print(f"\n🎉 ¡Proceso completado! Reporte maestro limpio con {len(df_final)} transacciones 🎉")
     
-    analizar_reporte_consolidado(archivo_salida_final)
+    analizar_reporte_consolidado(df_final)
+
+    return df_final
+
+def unificar_y_conciliar_reportes(yape, ahorro, archivo_salida_final=None, tolerancia_dias=0,
+                                  anio_por_defecto=None):
+    """Atajo de `unificar_y_conciliar_cuentas` para las dos cuentas clásicas, Yape y Ahorro."""
+    return unificar_y_conciliar_cuentas(
+        {'Yape': yape, 'Ahorro': ahorro}, archivo_salida_final,
+        tolerancia_dias=tolerancia_dias, anio_por_defecto=anio_por_defecto
+    )
 
 if __name__ == "__main__":
     CSV_YAPE = "reporte_anual_consolidado.csv"